@@ -1,7 +1,17 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from typing import Generator
+from anyio import to_thread
+from fastapi import HTTPException, Request
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
+from sqlalchemy.pool import QueuePool
+from typing import Dict, Generator, Optional, Tuple
+import logging
 import os
+import threading
+import time
+
+from app.services import replica, shards
+
+logger = logging.getLogger(__name__)
 
 # CONFIGURACIÓN DE CONEXIÓN A MYSQL
 
@@ -11,17 +21,105 @@ MYSQL_PASSWORD = os.getenv("MYSQL_PASSWORD", "Optica2025!")
 MYSQL_HOST = os.getenv("MYSQL_HOST", "localhost")
 MYSQL_DB = os.getenv("MYSQL_DB", "optica")
 
-DATABASE_URL = (
-    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{MYSQL_HOST}/{MYSQL_DB}"
-)
+
+def _url_mysql(host: str) -> str:
+    return f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}@{host}/{MYSQL_DB}"
+
+
+DATABASE_URL = _url_mysql(MYSQL_HOST)
+
+# POOL DE CONEXIONES Y THREADPOOL
+#
+# Los handlers sync corren en el threadpool de AnyIO (THREADPOOL_TOKENS hilos a la
+# vez); cada uno puede tener una conexión tomada. Si el pool admite menos
+# conexiones que hilos, los requests se quedan esperando el checkout. Por eso, si
+# no se configura DB_POOL_SIZE, se toma igual a los tokens del threadpool.
+
+def _env_int(nombre: str, defecto: int) -> int:
+    valor = os.getenv(nombre)
+    return int(valor) if valor not in (None, "") else defecto
+
+
+THREADPOOL_TOKENS = _env_int("OPTICA_THREADPOOL_TOKENS", 40)
+DB_POOL_SIZE = _env_int("OPTICA_DB_POOL_SIZE", THREADPOOL_TOKENS)
+DB_MAX_OVERFLOW = _env_int("OPTICA_DB_MAX_OVERFLOW", 10)
+DB_POOL_TIMEOUT = _env_int("OPTICA_DB_POOL_TIMEOUT", 30)
+DB_POOL_RECYCLE = _env_int("OPTICA_DB_POOL_RECYCLE", 3600)
+DB_ECHO = os.getenv("OPTICA_DB_ECHO", "false").lower() in ("1", "true", "si", "yes")
+
+if DB_POOL_SIZE + DB_MAX_OVERFLOW < THREADPOOL_TOKENS:
+    logger.warning(
+        "El pool de conexiones (%s + %s overflow) es menor que el threadpool (%s hilos): "
+        "los requests van a esperar conexión.",
+        DB_POOL_SIZE, DB_MAX_OVERFLOW, THREADPOOL_TOKENS,
+    )
+
+
+class PoolMedido(QueuePool):
+    """
+    QueuePool que además mide cuánto se espera para obtener una conexión
+    (incluye el tiempo de abrir una conexión nueva cuando el pool tiene lugar).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._lock_medicion = threading.Lock()
+        self.checkouts = 0
+        self.esperas = 0          # checkouts que no fueron inmediatos (> 1 ms)
+        self.espera_total = 0.0
+        self.espera_maxima = 0.0
+        self.timeouts = 0
+
+    def _do_get(self):
+        inicio = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._lock_medicion:
+                self.timeouts += 1
+            raise
+        finally:
+            espera = time.perf_counter() - inicio
+            with self._lock_medicion:
+                self.checkouts += 1
+                self.espera_total += espera
+                self.espera_maxima = max(self.espera_maxima, espera)
+                if espera > 0.001:
+                    self.esperas += 1
+
+    def estadisticas(self) -> dict:
+        with self._lock_medicion:
+            return {
+                "pool_size": self.size(),
+                "max_overflow": self._max_overflow,
+                "checked_out": self.checkedout(),
+                "checked_in": self.checkedin(),
+                "overflow": max(self.overflow(), 0),
+                "checkouts": self.checkouts,
+                "checkouts_con_espera": self.esperas,
+                "espera_total_ms": round(self.espera_total * 1000, 1),
+                "espera_promedio_ms": round(self.espera_total * 1000 / self.checkouts, 3) if self.checkouts else 0,
+                "espera_maxima_ms": round(self.espera_maxima * 1000, 1),
+                "timeouts": self.timeouts,
+            }
+
+
+def _crear_engine(url: str):
+    return create_engine(
+        url,
+        echo=DB_ECHO,
+        future=True,
+        pool_pre_ping=True,
+        poolclass=PoolMedido,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+    )
+
 
 # Motor de conexión
-engine = create_engine(
-    DATABASE_URL,
-    echo=True,              
-    future=True,            
-    pool_pre_ping=True      
-)
+engine = _crear_engine(DATABASE_URL)
 
 # Creador de sesiones
 SessionLocal = sessionmaker(
@@ -31,19 +129,239 @@ SessionLocal = sessionmaker(
     future=True
 )
 
+
+# RÉPLICA DE LECTURA (OPCIONAL)
+#
+# Con MYSQL_REPLICA_HOST (mismo usuario, clave y base que la primaria; puede
+# llevar puerto: "127.0.0.1:3307"), los GET que usan get_read_db leen de la
+# réplica, con su propio pool. Escrituras y lecturas que tienen que ver lo recién
+# escrito siguen en la primaria (ver app/services/replica.py). Sin réplica,
+# get_read_db es lo mismo que get_db.
+
+MYSQL_REPLICA_HOST = os.getenv("MYSQL_REPLICA_HOST", "")
+
+REPLICA_DATABASE_URL = _url_mysql(MYSQL_REPLICA_HOST) if MYSQL_REPLICA_HOST else None
+
+replica_engine = _crear_engine(REPLICA_DATABASE_URL) if REPLICA_DATABASE_URL else None
+ReplicaSessionLocal = (
+    sessionmaker(autocommit=False, autoflush=False, bind=replica_engine, future=True)
+    if replica_engine is not None
+    else None
+)
+
+
+# SHARDS (OPCIONAL)
+#
+# Con OPTICA_SHARDS, cada óptica vive en una de varias bases (ver
+# app/services/shards.py). La principal es `engine`; cada shard tiene su engine y
+# su pool. get_db/get_read_db (y get_async_db, en modo async) abren la sesión en
+# el shard de la óptica del request (header X-Optica-Id). La réplica de lectura es
+# solo de la principal.
+
+shard_engines = {shards.PRINCIPAL: engine}
+shard_engines.update({nombre: _crear_engine(_url_mysql(host)) for nombre, host in shards.HOSTS.items()})
+
+_sesiones_shard: Dict[str, sessionmaker] = {
+    nombre: (
+        SessionLocal
+        if nombre == shards.PRINCIPAL
+        else sessionmaker(autocommit=False, autoflush=False, bind=motor, future=True)
+    )
+    for nombre, motor in shard_engines.items()
+}
+
+
+def _sesiones_de(shard: str) -> sessionmaker:
+    fabrica = _sesiones_shard.get(shard)
+    if fabrica is None:
+        raise RuntimeError(f"El directorio apunta al shard {shard!r}, que no está en OPTICA_SHARDS")
+    return fabrica
+
+
+def sesion_optica(optica_id: Optional[str]):
+    """Sesión en el shard de la óptica (para scripts; los endpoints usan get_db)."""
+    shard, bloqueada = shards.ubicar(engine, optica_id)
+    if bloqueada:
+        raise RuntimeError(f"La óptica {optica_id} se está moviendo de shard; reintentar cuando termine.")
+    db = _sesiones_de(shard)()
+    if optica_id:
+        db.info["optica"] = (optica_id, shard)
+    return db
+
+
+# ESCRITURAS EN VUELO DURANTE UNA MUDANZA DE SHARD
+#
+# get_db rechaza las escrituras de una óptica bloqueada, pero solo al abrir la
+# sesión. Una sesión abierta antes del bloqueo (un request lento, /clientes/importar
+# o los importadores por CLI, que confirman por lotes durante minutos) podría
+# seguir confirmando en el origen después de la pasada final de mover_optica, y
+# esas filas se perderían en el cambio de shard. Por eso, con shards, cada commit
+# de una sesión de óptica (get_db, sesion_optica) relee su fila del directorio con
+# LOCK IN SHARE MODE, en una conexión aparte, y la retiene hasta que el commit
+# termina:
+#   - si la óptica está bloqueada o ya no está en el shard de la sesión, el commit
+#     falla con OpticaEnMudanza (503) y la transacción se descarta;
+#   - mover_optica marca el bloqueo con un UPDATE de esa fila, que espera a que
+#     suelten la fila los commits en curso: cuando vuelve, no queda ninguna
+#     escritura de la óptica en vuelo y la pasada final puede empezar.
+# La conexión sale de un pool propio, para no competir con la de la sesión.
+
+directorio_engine = _crear_engine(DATABASE_URL) if shards.HOSTS else None
+
+
+@event.listens_for(Session, "before_commit")
+def _retener_directorio(session):
+    optica = session.info.get("optica")
+    if directorio_engine is None or not optica or "directorio" in session.info:
+        return
+    optica_id, shard = optica
+    conn = directorio_engine.connect()
+    try:
+        actual, bloqueada = shards.leer_directorio(conn, optica_id, compartido=True)
+    except BaseException:
+        conn.close()
+        raise
+    if bloqueada or actual != shard:
+        conn.close()
+        shards.invalidar(optica_id)
+        raise shards.OpticaEnMudanza(optica_id)
+    session.info["directorio"] = conn
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _soltar_directorio(session, transaccion):
+    if transaccion.parent is None:
+        conn = session.info.pop("directorio", None)
+        if conn is not None:
+            conn.close()  # rollback: suelta la fila del directorio
+
+
+# MODO ASYNC (OPCIONAL)
+#
+# OPTICA_DB_MODO=async monta además las versiones async de las lecturas más
+# usadas (app/routers/lectura_async.py) sobre AsyncEngines: uno por shard y, si
+# hay réplica, otro para ella, igual que los sync. Requiere el driver (asyncmy o
+# aiomysql, según OPTICA_DB_ASYNC_DRIVER) y greenlet; en modo sync no se importa
+# nada de eso.
+
+DB_ASYNC = os.getenv("OPTICA_DB_MODO", "sync").lower() == "async"
+DB_ASYNC_DRIVER = os.getenv("OPTICA_DB_ASYNC_DRIVER", "asyncmy")
+
+
+def _url_async(host: str) -> str:
+    return f"mysql+{DB_ASYNC_DRIVER}://{MYSQL_USER}:{MYSQL_PASSWORD}@{host}/{MYSQL_DB}"
+
+
+ASYNC_DATABASE_URL = _url_async(MYSQL_HOST)
+
+async_engine = None
+AsyncSessionLocal = None
+async_shard_engines: Dict[str, object] = {}
+async_replica_engine = None
+AsyncReplicaSessionLocal = None
+_sesiones_async_shard: Dict[str, object] = {}
+
+if DB_ASYNC:
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    def _crear_async_engine(url: str):
+        return create_async_engine(
+            url,
+            echo=DB_ECHO,
+            pool_pre_ping=True,
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+
+    def _async_sessionmaker(motor):
+        return async_sessionmaker(motor, autoflush=False, expire_on_commit=False)
+
+    async_engine = _crear_async_engine(ASYNC_DATABASE_URL)
+    async_shard_engines = {shards.PRINCIPAL: async_engine}
+    async_shard_engines.update({nombre: _crear_async_engine(_url_async(host)) for nombre, host in shards.HOSTS.items()})
+    _sesiones_async_shard = {nombre: _async_sessionmaker(motor) for nombre, motor in async_shard_engines.items()}
+    AsyncSessionLocal = _sesiones_async_shard[shards.PRINCIPAL]
+
+    if MYSQL_REPLICA_HOST:
+        async_replica_engine = _crear_async_engine(_url_async(MYSQL_REPLICA_HOST))
+        AsyncReplicaSessionLocal = _async_sessionmaker(async_replica_engine)
+
 # Clase base para los modelos
 Base = declarative_base()
 
 
 # DEPENDENCIA DE SESIÓN PARA FASTAPI
 
-def get_db() -> Generator:
-    """
-    Crea y cierra una sesión de base de datos para cada request.
-    FastAPI la usa automáticamente vía Depends(get_db)
-    """
-    db = SessionLocal()
+def _sesion(fabrica: sessionmaker, optica: Optional[Tuple[str, str]] = None) -> Generator:
+    db = fabrica()
+    if optica:
+        db.info["optica"] = optica  # (optica_id, shard): ver _retener_directorio
     try:
         yield db
     finally:
         db.close()
+
+
+def get_db(request: Request) -> Generator:
+    """
+    Crea y cierra una sesión de base de datos para cada request, en el shard de
+    la óptica. FastAPI la usa automáticamente vía Depends(get_db)
+    """
+    optica_id = request.headers.get("x-optica-id")
+    shard, bloqueada = shards.ubicar(engine, optica_id)
+    if bloqueada and request.method not in ("GET", "HEAD"):
+        raise HTTPException(
+            status_code=503,
+            detail="Los datos de la óptica se están moviendo de base. Reintentar en unos segundos.",
+            headers={"Retry-After": "5"},
+        )
+    yield from _sesion(_sesiones_de(shard), (optica_id, shard) if optica_id else None)
+
+
+def _destino_lectura(optica_id: Optional[str]) -> Optional[str]:
+    """
+    Dónde lee un GET: None = la réplica (configurada, al día, y la óptica no
+    escribió recién); si no, el shard de la óptica.
+    """
+    shard, _ = shards.ubicar(engine, optica_id)
+    if (
+        shard != shards.PRINCIPAL
+        or replica_engine is None
+        or replica.fijada(optica_id)
+        or not replica.replica_al_dia(replica_engine)
+    ):
+        return shard
+    return None
+
+
+def get_read_db(request: Request) -> Generator:
+    """
+    Sesión para los GET: de la réplica si hay una configurada, al día, y la
+    óptica no escribió recién; si no, del shard de la óptica (igual que get_db).
+    """
+    shard = _destino_lectura(request.headers.get("x-optica-id"))
+    yield from _sesion(ReplicaSessionLocal if shard is None else _sesiones_de(shard))
+
+
+async def get_async_db(request: Request):
+    """
+    Variante de get_read_db para los handlers async (solo con OPTICA_DB_MODO=async):
+    mismo shard o réplica, con los AsyncEngines.
+    """
+    if shards.HOSTS or async_replica_engine is not None:
+        # el directorio y el atraso de la réplica pueden ir a la base (con sus
+        # cachés, pocas veces): se resuelven en un hilo para no trabar el event loop
+        shard = await to_thread.run_sync(_destino_lectura, request.headers.get("x-optica-id"))
+    else:
+        shard = shards.PRINCIPAL
+
+    if shard is None:
+        fabrica = AsyncReplicaSessionLocal
+    else:
+        fabrica = _sesiones_async_shard.get(shard)
+        if fabrica is None:
+            raise RuntimeError(f"El directorio apunta al shard {shard!r}, que no está en OPTICA_SHARDS")
+    async with fabrica() as db:
+        yield db
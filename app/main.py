@@ -1,10 +1,29 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from anyio import to_thread
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm.exc import StaleDataError
 
 # importa los módulos de routers, no el objeto router directamente
-from app.routers import clientes, proveedores, insumos, recetas, compras_insumos, pedidos_laboratorio
+from app.routers import (
+    clientes, proveedores, insumos, recetas, compras_insumos, pedidos_laboratorio, tablero, status, metricas,
+)
+from app.database import (
+    DB_ASYNC, THREADPOOL_TOKENS, async_replica_engine, async_shard_engines, replica_engine, shard_engines,
+)
+from app.services import instrumentacion, metricas as servicio_metricas, shards
+
 
-app = FastAPI(title="API Óptica")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # hilos para los handlers sync: se configura junto con el pool (ver database.py)
+    to_thread.current_default_thread_limiter().total_tokens = THREADPOOL_TOKENS
+    yield
+
+
+app = FastAPI(title="API Óptica", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -12,8 +31,45 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "ETag"],
 )
 
+# CONFLICTO DE VERSIÓN: otro request modificó la fila entre la lectura y el UPDATE
+@app.exception_handler(StaleDataError)
+async def conflicto_de_version(request: Request, exc: StaleDataError):
+    return JSONResponse(
+        status_code=409,
+        content={"detail": "El registro fue modificado por otro usuario. Recargar y volver a intentar."},
+    )
+
+# ÓPTICA EN MUDANZA DE SHARD: el commit se rechazó (ver database.py)
+@app.exception_handler(shards.OpticaEnMudanza)
+async def optica_en_mudanza(request: Request, exc: shards.OpticaEnMudanza):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Los datos de la óptica se están moviendo de base. Reintentar en unos segundos."},
+        headers={"Retry-After": "5"},
+    )
+
+# INSTRUMENTACIÓN SQL: consultas / tiempo de base por request (Server-Timing, N+1)
+for motor in shard_engines.values():  # la principal y los shards (OPTICA_SHARDS)
+    instrumentacion.instalar(motor)
+if replica_engine is not None:
+    instrumentacion.instalar(replica_engine)
+for motor in async_shard_engines.values():  # modo async: uno por shard
+    instrumentacion.instalar(motor.sync_engine)
+if async_replica_engine is not None:
+    instrumentacion.instalar(async_replica_engine.sync_engine)
+# (las métricas van por dentro: leen la medición SQL del request al terminar)
+app.add_middleware(servicio_metricas.MetricasMiddleware)
+app.add_middleware(instrumentacion.MedicionSQLMiddleware)
+
+# LECTURAS ASYNC (OPTICA_DB_MODO=async): van primero para que sus rutas ganen
+if DB_ASYNC:
+    from app.routers import lectura_async
+
+    app.include_router(lectura_async.router)
+
 # CLIENTES
 app.include_router(clientes.router)
 
@@ -31,3 +87,12 @@ app.include_router(compras_insumos.router)
 
 # PEDIDOS LABORATORIO
 app.include_router(pedidos_laboratorio.router)
+
+# TABLERO (contadores por óptica)
+app.include_router(tablero.router)
+
+# ESTADO (healthcheck y pool de conexiones)
+app.include_router(status.router)
+
+# MÉTRICAS (formato Prometheus)
+app.include_router(metricas.router)
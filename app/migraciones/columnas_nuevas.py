@@ -0,0 +1,67 @@
+import sys
+
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+
+from app.database import Base, shard_engines
+from app import models  # noqa: F401  (registra las tablas en Base.metadata)
+
+# MIGRACIÓN: TABLAS Y COLUMNAS NUEVAS DE LOS MODELOS
+#
+# create_all crea las tablas que faltan pero no agrega columnas a las que ya
+# existen. Esto agrega, en cada tabla existente, las columnas del modelo que la
+# base todavía no tiene (con su server_default, así las filas viejas quedan con
+# un valor válido: p. ej. version = 1) y los índices que las usan.
+#
+# Se aplica en cada shard (la principal incluida), que tienen el mismo esquema.
+# Es idempotente: lo que ya está aplicado se saltea.
+#
+#   python -m app.migraciones.columnas_nuevas          # aplica
+#   python -m app.migraciones.columnas_nuevas --ver    # solo muestra qué haría
+
+
+def _sentencias(conn):
+    inspector = inspect(conn)
+    for tabla in Base.metadata.sorted_tables:
+        if not inspector.has_table(tabla.name):
+            continue
+        existentes = {c["name"] for c in inspector.get_columns(tabla.name)}
+        nuevas = [c for c in tabla.columns if c.name not in existentes]
+
+        for col in nuevas:
+            tipo = col.type.compile(dialect=conn.dialect)
+            sentencia = f"ALTER TABLE {tabla.name} ADD COLUMN {col.name} {tipo}"
+            if col.server_default is not None:
+                sentencia += f" DEFAULT {col.server_default.arg}"
+            sentencia += " NULL" if col.nullable else " NOT NULL"
+            yield sentencia
+
+        indices = {i["name"] for i in inspector.get_indexes(tabla.name)}
+        nombres_nuevos = {c.name for c in nuevas}
+        for indice in sorted(tabla.indexes, key=lambda i: i.name):
+            if indice.name not in indices and nombres_nuevos & {c.name for c in indice.columns}:
+                yield str(CreateIndex(indice).compile(dialect=conn.dialect))
+
+
+def migrar(solo_mostrar: bool = False) -> None:
+    for nombre, motor in shard_engines.items():
+        print(f"== {nombre}")
+        # tablas nuevas enteras (con sus índices)
+        if not solo_mostrar:
+            Base.metadata.create_all(motor)
+
+        with motor.connect() as conn:
+            sentencias = list(_sentencias(conn))
+            for sentencia in sentencias:
+                print(sentencia.strip() + ";")
+                if not solo_mostrar:
+                    conn.execute(text(sentencia))
+            if not solo_mostrar:
+                conn.commit()
+
+        if not sentencias:
+            print("Nada para migrar.")
+
+
+if __name__ == "__main__":
+    migrar("--ver" in sys.argv)
@@ -0,0 +1,140 @@
+import sys
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, inspect, select, text, update
+
+from app.database import shard_engines
+from app.models import DetalleCompraInsumos, HistorialCostoInsumo, Insumo, MovimientoStock
+from app.schemas.enums import TipoMovimientoStock
+from app.services.costos import costo_movil
+
+# MIGRACIÓN: COSTO PROMEDIO MÓVIL DE LAS COMPRAS EXISTENTES
+#
+# columnas_nuevas crea historial_costo_insumo vacía (correrla antes). Esto
+# recalcula, en cada shard, el precio_costo de los insumos con compras
+# reproduciendo en orden las compras y anulaciones del libro de movimientos, con
+# la misma cuenta que services/costos.py: el stock previo a cada una sale del
+# stock_resultante de su movimiento y el precio, de las líneas de la compra. Los
+# insumos sin compras en el libro conservan el precio_costo que tenían. Solo toca
+# las filas que no coinciden: es idempotente.
+#
+# El costo del stock que había antes de la primera compra del libro no está en
+# ningún lado: se toma el precio de esa compra (lo mismo que hace costo_movil
+# cuando el insumo no tiene costo). Lo mismo pasa con los movimientos ya
+# compactados (services/movimientos.py): la cuenta arranca en el primero que
+# quedó en el libro.
+#
+# Si el historial del shard está vacío, lo completa con una fila por compra o
+# anulación e insumo, con el costo resultante.
+#
+# Una primera versión guardaba acumulados en insumo.costo_cantidad / costo_valor
+# (NOT NULL) y columnas_nuevas los agregó en las bases migradas entonces. El
+# modelo ya no los tiene, así que los INSERT no los llenarían: si están, se borran.
+#
+#   python -m app.migraciones.costo_promedio          # aplica
+#   python -m app.migraciones.costo_promedio --ver    # solo cuenta los insumos a corregir
+
+TANDA = 5000
+COLUMNAS_VIEJAS = ("costo_cantidad", "costo_valor")
+
+
+def _reproducir(conn) -> Tuple[Dict[Tuple[str, int], Optional[float]], List[dict]]:
+    """Costo final por (optica_id, id_insumo) y las filas de historial, en orden."""
+    m, d = MovimientoStock, DetalleCompraInsumos
+    lineas = (
+        select(d.id_compra, d.id_insumo, func.sum(d.cantidad * d.precio_unitario).label("valor"))
+        .group_by(d.id_compra, d.id_insumo)
+        .subquery()
+    )
+    filas = conn.execute(
+        select(m.optica_id, m.id_insumo, m.fecha, m.tipo, m.id_origen, m.cantidad, m.stock_resultante, lineas.c.valor)
+        .join(lineas, (lineas.c.id_compra == m.id_origen) & (lineas.c.id_insumo == m.id_insumo))
+        .where(m.tipo.in_([TipoMovimientoStock.COMPRA.value, TipoMovimientoStock.ANULACION_COMPRA.value]))
+        .order_by(m.optica_id, m.id_insumo, m.id_movimiento)
+    ).all()
+
+    costos: Dict[Tuple[str, int], Optional[float]] = {}
+    historial = []
+    for optica_id, id_insumo, fecha, tipo, id_compra, cantidad, stock_resultante, valor in filas:
+        if not cantidad:
+            continue
+        signo = 1 if cantidad > 0 else -1
+        cantidad, valor = abs(cantidad), float(valor or 0.0)
+        costo = costo_movil(costos.get((optica_id, id_insumo)), stock_resultante, cantidad, valor, signo)
+        costos[(optica_id, id_insumo)] = costo
+        historial.append({
+            "optica_id": optica_id,
+            "id_insumo": id_insumo,
+            "fecha": fecha,
+            "tipo": tipo,
+            "id_compra": id_compra,
+            "cantidad": signo * cantidad,
+            "precio_unitario": round(valor / cantidad, 4),
+            "costo_promedio": costo,
+        })
+    return costos, historial
+
+
+def _redondeado(precio: Optional[float]) -> Optional[float]:
+    return None if precio is None else round(precio, 4)
+
+
+def _corregir(conn, costos: Dict[Tuple[str, int], Optional[float]], solo_mostrar: bool) -> int:
+    actuales = conn.execute(select(Insumo.optica_id, Insumo.id_insumo, Insumo.precio_costo)).all()
+    cambios = [
+        {"id": f.id_insumo, "precio": costos[(f.optica_id, f.id_insumo)]}
+        for f in actuales
+        if (f.optica_id, f.id_insumo) in costos
+        and _redondeado(costos[(f.optica_id, f.id_insumo)]) != _redondeado(f.precio_costo)
+    ]
+    if solo_mostrar:
+        return len(cambios)
+
+    for i in range(0, len(cambios), TANDA):
+        for cambio in cambios[i:i + TANDA]:
+            conn.execute(
+                update(Insumo.__table__)
+                .where(Insumo.id_insumo == cambio["id"])
+                .values(precio_costo=cambio["precio"], version=Insumo.version + 1)
+            )
+        conn.commit()
+    return len(cambios)
+
+
+def _historial(conn, historial: List[dict]) -> int:
+    if conn.execute(select(func.count()).select_from(HistorialCostoInsumo)).scalar():
+        return 0
+    for i in range(0, len(historial), TANDA):
+        conn.execute(insert(HistorialCostoInsumo), historial[i:i + TANDA])
+        conn.commit()
+    return len(historial)
+
+
+def _columnas_viejas(conn, solo_mostrar: bool) -> List[str]:
+    existentes = {c["name"] for c in inspect(conn).get_columns(Insumo.__tablename__)}
+    viejas = [c for c in COLUMNAS_VIEJAS if c in existentes]
+    for columna in viejas:
+        sentencia = f"ALTER TABLE {Insumo.__tablename__} DROP COLUMN {columna}"
+        print(sentencia + ";")
+        if not solo_mostrar:
+            conn.execute(text(sentencia))
+    if viejas and not solo_mostrar:
+        conn.commit()
+    return viejas
+
+
+def migrar(solo_mostrar: bool = False) -> None:
+    for nombre, motor in shard_engines.items():
+        with motor.connect() as conn:
+            _columnas_viejas(conn, solo_mostrar)
+            costos, historial = _reproducir(conn)
+            corregidos = _corregir(conn, costos, solo_mostrar)
+            if solo_mostrar:
+                print(f"{nombre}: {corregidos} insumos a corregir")
+                continue
+            filas = _historial(conn, historial)
+            print(f"{nombre}: {corregidos} insumos corregidos, {filas} filas de historial")
+
+
+if __name__ == "__main__":
+    migrar("--ver" in sys.argv)
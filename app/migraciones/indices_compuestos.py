@@ -0,0 +1,109 @@
+import sys
+
+from sqlalchemy import String, Text, inspect, text
+from sqlalchemy.schema import AddConstraint, CreateIndex
+
+from app.database import Base, shard_engines
+from app import models  # noqa: F401  (registra las tablas en Base.metadata)
+
+# MIGRACIÓN: COLUMNAS VARCHAR + ÍNDICES COMPUESTOS POR ÓPTICA
+#
+# Para una base ya creada (create_all no modifica tablas existentes):
+#   1) pasa a VARCHAR(n) las columnas que en los modelos dejaron de ser TEXT
+#      (antes verifica que ningún valor supere el largo nuevo);
+#   2) crea los índices declarados en los modelos que todavía no existen;
+#   3) crea las UNIQUE que dependen de esas columnas (no se podían crear sobre TEXT).
+#
+# Se aplica en cada shard (la principal incluida). Si en alguno hay columnas que no
+# se pueden convertir, ese shard se saltea y el resto sigue; la salida es 1.
+# Es idempotente: lo que ya está aplicado se saltea.
+#
+#   python -m app.migraciones.indices_compuestos          # aplica
+#   python -m app.migraciones.indices_compuestos --ver    # solo muestra qué haría
+
+UNIQUES = ["uq_insumo_optica_codigo_interno", "uq_pedido_lab_optica_nro_orden"]
+
+
+def _columnas_a_varchar(conn, inspector):
+    for tabla in Base.metadata.sorted_tables:
+        if not inspector.has_table(tabla.name):
+            continue
+        actuales = {c["name"]: c for c in inspector.get_columns(tabla.name)}
+        for col in tabla.columns:
+            actual = actuales.get(col.name)
+            if actual is None or not isinstance(col.type, String) or isinstance(col.type, Text):
+                continue
+            if not isinstance(actual["type"], Text):
+                continue
+
+            largo = conn.execute(
+                text(f"SELECT MAX(CHAR_LENGTH(`{col.name}`)) FROM `{tabla.name}`")
+            ).scalar() or 0
+            if largo > col.type.length:
+                yield None, (
+                    f"{tabla.name}.{col.name}: hay valores de {largo} caracteres "
+                    f"(máximo {col.type.length}); corregir los datos y volver a correr"
+                )
+                continue
+
+            tipo = col.type.compile(dialect=conn.dialect)
+            nulo = "NULL" if col.nullable else "NOT NULL"
+            yield f"ALTER TABLE `{tabla.name}` MODIFY `{col.name}` {tipo} {nulo}", None
+
+
+def _indices_faltantes(conn, inspector):
+    for tabla in Base.metadata.sorted_tables:
+        if not inspector.has_table(tabla.name):
+            continue
+        existentes = {i["name"] for i in inspector.get_indexes(tabla.name)}
+        existentes |= {u["name"] for u in inspector.get_unique_constraints(tabla.name)}
+
+        for indice in sorted(tabla.indexes, key=lambda i: i.name):
+            if indice.name not in existentes:
+                yield str(CreateIndex(indice).compile(dialect=conn.dialect))
+        for restriccion in tabla.constraints:
+            if restriccion.name in UNIQUES and restriccion.name not in existentes:
+                yield str(AddConstraint(restriccion).compile(dialect=conn.dialect))
+
+
+def migrar(solo_mostrar: bool = False) -> bool:
+    """Aplica la migración en todos los shards. Devuelve False si en alguno quedaron columnas sin convertir."""
+    resultados = []
+    for nombre, motor in shard_engines.items():
+        print(f"== {nombre}")
+        resultados.append(_migrar_shard(motor, solo_mostrar))
+    return all(resultados)
+
+
+def _migrar_shard(motor, solo_mostrar: bool) -> bool:
+    ok = True
+    with motor.connect() as conn:
+        inspector = inspect(conn)
+
+        sentencias = []
+        for sentencia, problema in _columnas_a_varchar(conn, inspector):
+            if problema:
+                print(f"!! {problema}")
+                ok = False
+            else:
+                sentencias.append(sentencia)
+        if not ok:
+            return False
+
+        sentencias += list(_indices_faltantes(conn, inspector))
+
+        for sentencia in sentencias:
+            print(sentencia.strip() + ";")
+            if not solo_mostrar:
+                # en MySQL cada ALTER/CREATE INDEX confirma solo
+                conn.execute(text(sentencia))
+        if not solo_mostrar:
+            conn.commit()
+
+    if not sentencias:
+        print("Nada para migrar.")
+    return ok
+
+
+if __name__ == "__main__":
+    sys.exit(0 if migrar("--ver" in sys.argv) else 1)
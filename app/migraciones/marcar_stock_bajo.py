@@ -0,0 +1,49 @@
+import sys
+
+from sqlalchemy import func, select, update
+
+from app.database import shard_engines
+from app.models import Insumo
+from app.services.stock import marca_stock_bajo
+
+# MIGRACIÓN: MARCAR insumo.stock_bajo EN LOS DATOS EXISTENTES
+#
+# columnas_nuevas agrega la columna con 0 en todas las filas. Esto la calcula
+# (stock_actual <= stock_minimo) en cada shard, por rangos de id y con un commit
+# por rango, así no se bloquea la tabla entera. Solo toca las filas cuya marca
+# no coincide: es idempotente.
+#
+# Después conviene recalcular el contador del tablero, que cuenta las marcas:
+#   python -m app.services.tablero
+#
+#   python -m app.migraciones.marcar_stock_bajo          # aplica
+#   python -m app.migraciones.marcar_stock_bajo --ver    # solo cuenta las filas a corregir
+
+RANGO = 5000
+
+
+def migrar(solo_mostrar: bool = False) -> None:
+    marca = marca_stock_bajo(Insumo.stock_actual, Insumo.stock_minimo)
+    for nombre, motor in shard_engines.items():
+        with motor.connect() as conn:
+            if solo_mostrar:
+                distintas = conn.execute(
+                    select(func.count()).select_from(Insumo).where(Insumo.stock_bajo != marca)
+                ).scalar()
+                print(f"{nombre}: {distintas} insumos a corregir")
+                continue
+
+            minimo, maximo = conn.execute(select(func.min(Insumo.id_insumo), func.max(Insumo.id_insumo))).one()
+            corregidas = 0
+            for desde in range(minimo or 0, (maximo or -1) + 1, RANGO):
+                corregidas += conn.execute(
+                    update(Insumo.__table__)
+                    .where(Insumo.id_insumo.between(desde, desde + RANGO - 1), Insumo.stock_bajo != marca)
+                    .values(stock_bajo=marca)
+                ).rowcount
+                conn.commit()
+            print(f"{nombre}: {corregidas} insumos corregidos")
+
+
+if __name__ == "__main__":
+    migrar("--ver" in sys.argv)
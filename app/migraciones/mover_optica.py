@@ -0,0 +1,260 @@
+import sys
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from sqlalchemy import bindparam, delete, insert, select, update
+
+from app.database import Base, engine, shard_engines
+from app.models import (
+    Cliente,
+    HistorialCostoInsumo,
+    CompraInsumos,
+    DetalleCompraInsumos,
+    DetallePedidoLaboratorioInsumo,
+    IndiceBusqueda,
+    Insumo,
+    MovimientoStock,
+    OpticaShard,
+    PedidoLaboratorio,
+    Proveedor,
+    Receta,
+    StockCheckpoint,
+    TableroOptica,
+)
+from app.services import shards
+
+# HERRAMIENTA: MOVER UNA ÓPTICA DE SHARD
+#
+# Copia las filas de la óptica del shard actual al destino y cambia el directorio
+# (ver app/services/shards.py). Las filas se leen en streaming y se escriben por
+# lotes, tabla por tabla en orden de claves foráneas (padres antes que hijos;
+# los borrados, al revés):
+#
+#   1) copia en línea: la óptica sigue trabajando contra el origen;
+#   2) puesta al día en línea: pasa solo lo que cambió durante la copia;
+#   3) bloqueo de escrituras de la óptica (los GET siguen andando), pasada final
+#      y cambio de shard en el directorio.
+#
+# El bloqueo no depende de que los procesos lo vean a tiempo: cada commit de la
+# óptica relee su fila del directorio y la retiene en modo compartido hasta
+# terminar (ver app/database.py). El UPDATE que marca el bloqueo espera a que
+# terminen los commits en curso, y los siguientes fallan con 503; así la pasada
+# final arranca sin ninguna escritura en vuelo, aunque haya importaciones
+# confirmando por lotes. Por eso la fila del directorio se crea (si faltaba)
+# antes de copiar: los commits que empiecen a partir de ahí la toman.
+#
+# Cada pasada compara origen y destino por clave primaria: (id, version) en las
+# tablas versionadas y la fila completa en el resto. Durante las pasadas en línea
+# el destino puede quedar con hijos sin padre por un momento; la pasada final (con
+# la óptica quieta) deja la copia exacta.
+#
+# El origen no se toca salvo con --borrar-origen (después del cambio de shard).
+#
+#   python -m app.migraciones.mover_optica OPTICA_ID SHARD_DESTINO [--borrar-origen]
+#   python -m app.migraciones.mover_optica OPTICA_ID SHARD_DESTINO --ver    # solo muestra qué copiaría (y crea las tablas)
+#   python -m app.migraciones.mover_optica OPTICA_ID --desbloquear          # si una mudanza se cortó
+
+TABLAS = (
+    Cliente, Proveedor, Insumo, Receta, CompraInsumos, DetalleCompraInsumos,
+    PedidoLaboratorio, DetallePedidoLaboratorioInsumo, MovimientoStock, StockCheckpoint, IndiceBusqueda,
+    TableroOptica, HistorialCostoInsumo,
+)
+LOTE = 2000
+
+Resumen = Dict[str, Tuple[int, int, int]]  # tabla -> (nuevas, cambiadas, borradas)
+
+
+def _pk(tabla):
+    (columna,) = tabla.primary_key.columns
+    return columna
+
+
+def _lotes(ids: Iterable[int]) -> Iterable[List[int]]:
+    ids = sorted(ids)
+    for i in range(0, len(ids), LOTE):
+        yield ids[i:i + LOTE]
+
+
+def _firmas(conn, tabla, optica_id: str) -> Dict[int, int]:
+    """id -> hash de lo que se compara de la fila."""
+    pk = _pk(tabla)
+    columnas = [pk, tabla.c.version] if "version" in tabla.c else [pk] + [c for c in tabla.columns if c is not pk]
+    resultado = conn.execution_options(stream_results=True, yield_per=LOTE).execute(
+        select(*columnas).where(tabla.c.optica_id == optica_id)
+    )
+    return {fila[0]: hash(tuple(fila)) for fila in resultado}
+
+
+def _verificar_ids(destino, tabla, optica_id: str, ids: List[int]) -> None:
+    pk = _pk(tabla)
+    ajeno = destino.execute(
+        select(pk).where(pk.in_(ids), tabla.c.optica_id != optica_id).limit(1)
+    ).scalar()
+    if ajeno is not None:
+        raise SystemExit(
+            f"{tabla.name}: el id {ajeno} ya existe en el destino para otra óptica "
+            "(los shards tienen que generar ids que no choquen: ver app/services/shards.py)."
+        )
+
+
+def _copiar_todo(origen, destino, tabla, optica_id: str) -> int:
+    """Destino vacío para la óptica: copia en streaming, sin comparar."""
+    resultado = origen.execution_options(stream_results=True, yield_per=LOTE).execute(
+        select(tabla).where(tabla.c.optica_id == optica_id)
+    )
+    copiadas = 0
+    for lote in resultado.mappings().partitions():
+        filas = [dict(f) for f in lote]
+        _verificar_ids(destino, tabla, optica_id, [f[_pk(tabla).key] for f in filas])
+        destino.execute(insert(tabla), filas)
+        copiadas += len(filas)
+    return copiadas
+
+
+def _copiar(origen, destino, tabla, optica_id: str, ids: List[int], actualizar: bool) -> None:
+    pk = _pk(tabla)
+    if actualizar:
+        sentencia = (
+            update(tabla)
+            .where(pk == bindparam(f"b_{pk.key}"))
+            .values({c.key: bindparam(f"b_{c.key}") for c in tabla.columns if c is not pk})
+        )
+    for lote in _lotes(ids):
+        filas = [dict(f) for f in origen.execute(select(tabla).where(pk.in_(lote))).mappings()]
+        if not filas:
+            continue  # se borraron en el origen mientras tanto: las toma la pasada siguiente
+        if actualizar:
+            destino.execute(sentencia, [{f"b_{k}": v for k, v in f.items()} for f in filas])
+        else:
+            _verificar_ids(destino, tabla, optica_id, lote)
+            destino.execute(insert(tabla), filas)
+
+
+def sincronizar(origen, destino, optica_id: str, solo_mostrar: bool = False) -> Resumen:
+    """Deja en `destino` las filas de la óptica iguales a las de `origen` (dos conexiones)."""
+    if destino.dialect.name == "mysql" and not solo_mostrar:
+        # en las pasadas en línea puede llegar un hijo cuyo padre se creó después de copiar su tabla
+        destino.exec_driver_sql("SET FOREIGN_KEY_CHECKS = 0")
+
+    resumen: Resumen = {}
+    borrar = []
+    for modelo in TABLAS:
+        tabla = modelo.__table__
+        en_destino = _firmas(destino, tabla, optica_id)
+
+        if not en_destino and not solo_mostrar:
+            resumen[tabla.name] = (_copiar_todo(origen, destino, tabla, optica_id), 0, 0)
+            destino.commit()
+            continue
+
+        en_origen = _firmas(origen, tabla, optica_id)
+        nuevas = [i for i in en_origen if i not in en_destino]
+        cambiadas = [i for i, firma in en_origen.items() if i in en_destino and en_destino[i] != firma]
+        borradas = [i for i in en_destino if i not in en_origen]
+        resumen[tabla.name] = (len(nuevas), len(cambiadas), len(borradas))
+        if solo_mostrar:
+            continue
+
+        _copiar(origen, destino, tabla, optica_id, nuevas, actualizar=False)
+        _copiar(origen, destino, tabla, optica_id, cambiadas, actualizar=True)
+        borrar.append((tabla, borradas))
+        destino.commit()
+
+    # hijos antes que padres
+    for tabla, ids in reversed(borrar):
+        for lote in _lotes(ids):
+            destino.execute(delete(tabla).where(_pk(tabla).in_(lote)))
+    destino.commit()
+
+    if destino.dialect.name == "mysql" and not solo_mostrar:
+        destino.exec_driver_sql("SET FOREIGN_KEY_CHECKS = 1")
+    return resumen
+
+
+def _imprimir(titulo: str, resumen: Resumen, segundos: float) -> None:
+    print(f"== {titulo} ({segundos:.1f} s)")
+    for tabla, (nuevas, cambiadas, borradas) in resumen.items():
+        if nuevas or cambiadas or borradas:
+            print(f"   {tabla}: {nuevas} nuevas, {cambiadas} cambiadas, {borradas} borradas")
+
+
+def _pasada(titulo: str, origen, destino, optica_id: str) -> None:
+    inicio = time.monotonic()
+    with origen.connect() as o, destino.connect() as d:
+        resumen = sincronizar(o, d, optica_id)
+    _imprimir(titulo, resumen, time.monotonic() - inicio)
+
+
+def _marcar(optica_id: str, shard: str, bloqueada: bool) -> None:
+    tabla = OpticaShard.__table__
+    with engine.begin() as conn:
+        valores = {"shard": shard, "bloqueada": bloqueada}
+        if conn.execute(update(tabla).where(tabla.c.optica_id == optica_id).values(valores)).rowcount == 0:
+            conn.execute(insert(tabla).values(optica_id=optica_id, **valores))
+    shards.invalidar(optica_id)
+
+
+def _borrar_optica(motor, optica_id: str) -> None:
+    with motor.begin() as conn:
+        for modelo in reversed(TABLAS):
+            conn.execute(delete(modelo).where(modelo.optica_id == optica_id))
+
+
+def mover(optica_id: str, destino: str, borrar_origen: bool = False, solo_mostrar: bool = False) -> None:
+    OpticaShard.__table__.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        origen, bloqueada = shards.leer_directorio(conn, optica_id)
+
+    if destino not in shard_engines:
+        raise SystemExit(f"Shard desconocido: {destino}. Configurados: {', '.join(shard_engines)}")
+    if destino == origen:
+        raise SystemExit(f"La óptica {optica_id} ya está en el shard {destino}.")
+    if bloqueada:
+        raise SystemExit(
+            f"La óptica {optica_id} figura bloqueada (hay otra mudanza en curso o una se cortó). "
+            "Si no hay ninguna en curso: --desbloquear"
+        )
+    motor_origen, motor_destino = shard_engines[origen], shard_engines[destino]
+    print(f"Óptica {optica_id}: {origen} -> {destino}")
+    Base.metadata.create_all(motor_destino)  # un shard nuevo arranca sin tablas
+
+    if solo_mostrar:
+        inicio = time.monotonic()
+        with motor_origen.connect() as o, motor_destino.connect() as d:
+            resumen = sincronizar(o, d, optica_id, solo_mostrar=True)
+        _imprimir("a copiar", resumen, time.monotonic() - inicio)
+        return
+
+    _marcar(optica_id, origen, bloqueada=False)  # que exista la fila que retienen los commits
+    _pasada("copia", motor_origen, motor_destino, optica_id)
+    _pasada("puesta al día", motor_origen, motor_destino, optica_id)
+
+    inicio = time.monotonic()
+    _marcar(optica_id, origen, bloqueada=True)  # vuelve cuando no queda ningún commit de la óptica en curso
+    try:
+        _pasada("final (escrituras bloqueadas)", motor_origen, motor_destino, optica_id)
+        _marcar(optica_id, destino, bloqueada=False)
+    except BaseException:
+        _marcar(optica_id, origen, bloqueada=False)
+        raise
+    print(f"Listo: escrituras bloqueadas {time.monotonic() - inicio:.1f} s; la óptica ya usa {destino}.")
+
+    if borrar_origen:
+        _borrar_optica(motor_origen, optica_id)
+        print(f"Datos borrados del shard {origen}.")
+
+
+if __name__ == "__main__":
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    if len(argumentos) == 1 and "--desbloquear" in sys.argv:
+        with engine.connect() as conexion:
+            shard_actual, _ = shards.leer_directorio(conexion, argumentos[0])
+        _marcar(argumentos[0], shard_actual, bloqueada=False)
+        print(f"Óptica {argumentos[0]} desbloqueada (shard {shard_actual}).")
+    elif len(argumentos) == 2:
+        mover(argumentos[0], argumentos[1], "--borrar-origen" in sys.argv, "--ver" in sys.argv)
+    else:
+        sys.exit(
+            "Uso: python -m app.migraciones.mover_optica OPTICA_ID SHARD_DESTINO [--ver] [--borrar-origen]\n"
+            "     python -m app.migraciones.mover_optica OPTICA_ID --desbloquear"
+        )
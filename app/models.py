@@ -8,18 +8,33 @@ from sqlalchemy import (
     Date,
     ForeignKey,
     UniqueConstraint,
+    Index,
 )
 from sqlalchemy.orm import relationship
 from sqlalchemy import DateTime
 from app.database import Base
 
+# Las entidades editables llevan `version` (version_id_col): cada UPDATE del ORM la
+# sube y va con "WHERE version = <la leída>"; si otro request la cambió antes, el
+# flush falla con StaleDataError (409, ver main.py). Los UPDATE con SQL directo la
+# suben a mano. También es la base de los ETag (services/etags.py).
+
 class Cliente(Base):
     __tablename__ = "cliente"
-    __table_args__ = (UniqueConstraint("optica_id", "nombre", name="uq_proveedor_optica_nombre"),)
+    __table_args__ = (
+        UniqueConstraint("optica_id", "nombre", name="uq_proveedor_optica_nombre"),
+        # un índice por orden de /clientes/avanzado: (óptica, columna, desempates)
+        Index("ix_cliente_optica_apellido", "optica_id", "apellido", "nombre", "id_cliente"),
+        Index("ix_cliente_optica_nombre", "optica_id", "nombre", "apellido", "id_cliente"),
+        Index("ix_cliente_optica_dni", "optica_id", "dni", "apellido", "nombre", "id_cliente"),
+        Index("ix_cliente_optica_fecha_alta", "optica_id", "fecha_alta", "apellido", "nombre", "id_cliente"),
+    )
     optica_id = Column(String(36), nullable=False, index=True)
     id_cliente = Column(Integer, primary_key=True, index=True)
-    nombre = Column(Text, nullable=False)
-    apellido = Column(Text, nullable=False)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    __mapper_args__ = {"version_id_col": version}
+    nombre = Column(String(100), nullable=False)
+    apellido = Column(String(100), nullable=False)
     dni = Column(Integer, unique=True, nullable=False)
     fecha_nacimiento = Column(Date, nullable=True)
     telefono = Column(String(20), nullable=True)
@@ -35,12 +50,20 @@ class Cliente(Base):
 
 class Receta(Base):
     __tablename__ = "receta"
+    __table_args__ = (
+        Index("ix_receta_optica_fecha", "optica_id", "fecha_receta", "id_receta"),
+        Index("ix_receta_optica_estado", "optica_id", "estado", "id_receta"),
+        Index("ix_receta_optica_tipo_lente", "optica_id", "tipo_lente", "id_receta"),
+        Index("ix_receta_optica_profesional", "optica_id", "profesional", "id_receta"),
+    )
     optica_id = Column(String(36), nullable=False, index=True)
     id_receta = Column(Integer, primary_key=True, index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    __mapper_args__ = {"version_id_col": version}
     id_cliente = Column(Integer, ForeignKey("cliente.id_cliente"), nullable=False)
     fecha_receta = Column(Date, nullable=False)
-    profesional = Column(Text, nullable=True)
-    tipo_lente = Column(Text, nullable=True)
+    profesional = Column(String(150), nullable=True)
+    tipo_lente = Column(String(64), nullable=True)
 
     od_esfera = Column(Float, nullable=True)
     od_cilindro = Column(Float, nullable=True)
@@ -54,7 +77,7 @@ class Receta(Base):
     dp = Column(Float, nullable=True)
 
     observaciones = Column(Text, nullable=True)
-    estado = Column(Text, nullable=True)
+    estado = Column(String(32), nullable=True)
     fecha_creacion_reg = Column(Date, nullable=True)
     id_receta_legacy = Column(Text, nullable=True)
 
@@ -68,13 +91,21 @@ class Receta(Base):
 
 class Proveedor(Base):
     __tablename__ = "proveedor"
-    __table_args__ = (UniqueConstraint("optica_id", "nombre", name="uq_proveedor_optica_nombre"),)
+    __table_args__ = (
+        UniqueConstraint("optica_id", "nombre", name="uq_proveedor_optica_nombre"),
+        Index("ix_proveedor_optica_email", "optica_id", "email", "nombre", "id_proveedor"),
+        Index("ix_proveedor_optica_telefono", "optica_id", "telefono", "nombre", "id_proveedor"),
+        Index("ix_proveedor_optica_direccion", "optica_id", "direccion", "nombre", "id_proveedor"),
+        Index("ix_proveedor_optica_activo", "optica_id", "activo", "nombre", "id_proveedor"),
+    )
     optica_id = Column(String(36), nullable=False, index=True)
     id_proveedor = Column(Integer, primary_key=True, index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    __mapper_args__ = {"version_id_col": version}
     nombre = Column(String(191), nullable=False)
     telefono = Column(String(20), nullable=True)
-    email = Column(Text, nullable=True)
-    direccion = Column(Text, nullable=True)
+    email = Column(String(191), nullable=True)
+    direccion = Column(String(255), nullable=True)
     activo = Column(Boolean, default=True)
 
     insumos = relationship("Insumo", back_populates="proveedor")
@@ -90,22 +121,35 @@ class Insumo(Base):
     __tablename__ = "insumo"
     __table_args__ = (
     UniqueConstraint("optica_id", "codigo_interno", name="uq_insumo_optica_codigo_interno"),
+    Index("ix_insumo_optica_descripcion", "optica_id", "descripcion", "id_insumo"),
+    Index("ix_insumo_optica_tipo", "optica_id", "tipo_insumo", "id_insumo"),
+    Index("ix_insumo_optica_stock_actual", "optica_id", "stock_actual", "id_insumo"),
+    Index("ix_insumo_optica_stock_minimo", "optica_id", "stock_minimo", "id_insumo"),
+    Index("ix_insumo_optica_precio_costo", "optica_id", "precio_costo", "id_insumo"),
+    Index("ix_insumo_optica_precio_sugerido", "optica_id", "precio_sugerido", "id_insumo"),
+    Index("ix_insumo_optica_proveedor", "optica_id", "id_proveedor", "id_insumo"),
+    # /insumos/stock-bajo y con_stock_bajo: solo las marcadas, ya en orden de descripción
+    Index("ix_insumo_optica_stock_bajo", "optica_id", "stock_bajo", "activo", "descripcion", "id_insumo"),
 )
     optica_id = Column(String(36), nullable=False, index=True)
     id_insumo = Column(Integer, primary_key=True, index=True)
-    descripcion = Column(Text, nullable=False)
-    tipo_insumo = Column(Text, nullable=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    __mapper_args__ = {"version_id_col": version}
+    descripcion = Column(String(255), nullable=False)
+    tipo_insumo = Column(String(64), nullable=True)
 
     id_proveedor = Column(Integer, ForeignKey("proveedor.id_proveedor"), nullable=True)
 
-    codigo_proveedor = Column(Text, nullable=True)
-    codigo_interno = Column(Text, nullable=True)
+    codigo_proveedor = Column(String(64), nullable=True)
+    codigo_interno = Column(String(64), nullable=True)
 
-    precio_costo = Column(Float, nullable=True)
+    precio_costo = Column(Float, nullable=True)  # costo promedio móvil del stock (ver services/costos.py)
     precio_sugerido = Column(Float, nullable=True)
 
     stock_minimo = Column(Integer, nullable=True)
     stock_actual = Column(Integer, nullable=True)
+    # stock_actual <= stock_minimo; se actualiza junto con el stock y el mínimo (ver services/stock.py)
+    stock_bajo = Column(Boolean, nullable=False, default=False, server_default="0")
 
     activo = Column(Boolean, default=True)
     id_insumo_legacy = Column(Text, nullable=True)
@@ -128,13 +172,19 @@ class Insumo(Base):
 
 class CompraInsumos(Base):
     __tablename__ = "compra_insumos"
+    __table_args__ = (
+        Index("ix_compra_optica_fecha", "optica_id", "fecha_compra", "id_compra"),
+        Index("ix_compra_optica_monto", "optica_id", "monto_total", "id_compra"),
+    )
 
     optica_id = Column(String(36), nullable=False, index=True)
     id_compra = Column(Integer, primary_key=True, index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    __mapper_args__ = {"version_id_col": version}
     id_proveedor = Column(Integer, ForeignKey("proveedor.id_proveedor"), nullable=False)
     fecha_compra = Column(Date, nullable=False)
-    tipo_comprobante = Column(Text, nullable=True)
-    nro_comprobante = Column(Text, nullable=True)
+    tipo_comprobante = Column(String(32), nullable=True)
+    nro_comprobante = Column(String(64), nullable=True)
     observaciones = Column(Text, nullable=True)
     monto_total = Column(Float, nullable=True)
 
@@ -176,19 +226,27 @@ class PedidoLaboratorio(Base):
     __tablename__ = "pedido_laboratorio"
     __table_args__ = (
         UniqueConstraint("optica_id", "nro_orden_lab", name="uq_pedido_lab_optica_nro_orden"),
+        Index("ix_pedido_lab_optica_envio", "optica_id", "fecha_envio", "id_pedido_lab"),
+        Index("ix_pedido_lab_optica_estimada", "optica_id", "fecha_estimada_rec", "id_pedido_lab"),
+        Index("ix_pedido_lab_optica_recepcion", "optica_id", "fecha_recepcion", "id_pedido_lab"),
+        Index("ix_pedido_lab_optica_estado", "optica_id", "estado", "id_pedido_lab"),
+        Index("ix_pedido_lab_optica_proveedor", "optica_id", "id_proveedor", "id_pedido_lab"),
+        Index("ix_pedido_lab_optica_receta", "optica_id", "id_receta", "id_pedido_lab"),
     )
 
     optica_id = Column(String(36), nullable=False, index=True)
 
     id_pedido_lab = Column(Integer, primary_key=True, index=True)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    __mapper_args__ = {"version_id_col": version}
     id_receta = Column(Integer, ForeignKey("receta.id_receta"), nullable=False)
     id_proveedor = Column(Integer, ForeignKey("proveedor.id_proveedor"), nullable=False)
 
     fecha_envio = Column(Date, nullable=True)
     fecha_estimada_rec = Column(Date, nullable=True)
     fecha_recepcion = Column(Date, nullable=True)
-    estado = Column(Text, nullable=True)
-    nro_orden_lab = Column(Text, nullable=True)
+    estado = Column(String(32), nullable=True)
+    nro_orden_lab = Column(String(64), nullable=True)
     observaciones = Column(Text, nullable=True)
     id_pedido_lab_legacy = Column(Text, nullable=True)
 
@@ -220,3 +278,95 @@ class DetallePedidoLaboratorioInsumo(Base):
 
     pedido_laboratorio = relationship("PedidoLaboratorio", back_populates="detalles_insumo")
     insumo = relationship("Insumo", back_populates="detalles_pedido_lab")
+
+
+# Índice invertido para la búsqueda libre (q): un token normalizado por fila
+class IndiceBusqueda(Base):
+    __tablename__ = "indice_busqueda"
+    __table_args__ = (
+        # cubre la búsqueda por prefijo: (óptica, entidad, token LIKE 'abc%') -> id, peso
+        Index("ix_busqueda_optica_entidad_token", "optica_id", "entidad", "token", "id_entidad", "peso"),
+        Index("ix_busqueda_entidad_id", "entidad", "id_entidad"),
+    )
+
+    id_indice_busqueda = Column(Integer, primary_key=True)
+    optica_id = Column(String(36), nullable=False)
+    entidad = Column(String(32), nullable=False)
+    id_entidad = Column(Integer, nullable=False)
+    token = Column(String(64), nullable=False)
+    peso = Column(Float, nullable=False)
+
+
+# Libro de movimientos de stock (solo se agregan filas; ver services/stock.py)
+class MovimientoStock(Base):
+    __tablename__ = "movimiento_stock"
+    __table_args__ = (
+        Index("ix_mov_stock_optica_insumo_fecha", "optica_id", "id_insumo", "fecha", "id_movimiento"),
+        Index("ix_mov_stock_fecha", "fecha"),
+    )
+
+    optica_id = Column(String(36), nullable=False)
+    id_movimiento = Column(Integer, primary_key=True)
+    id_insumo = Column(Integer, ForeignKey("insumo.id_insumo"), nullable=False)
+    fecha = Column(DateTime, nullable=False)
+    tipo = Column(String(20), nullable=False)
+    cantidad = Column(Integer, nullable=False)
+    stock_resultante = Column(Integer, nullable=False)
+    id_origen = Column(Integer, nullable=True)
+    observaciones = Column(Text, nullable=True)
+
+
+# Historial del costo promedio de cada insumo: una fila por línea de compra o anulación (ver services/costos.py)
+class HistorialCostoInsumo(Base):
+    __tablename__ = "historial_costo_insumo"
+    __table_args__ = (
+        Index("ix_hist_costo_optica_insumo_fecha", "optica_id", "id_insumo", "fecha", "id_historial"),
+    )
+
+    optica_id = Column(String(36), nullable=False)
+    id_historial = Column(Integer, primary_key=True)
+    id_insumo = Column(Integer, ForeignKey("insumo.id_insumo"), nullable=False)
+    fecha = Column(DateTime, nullable=False)
+    tipo = Column(String(20), nullable=False)
+    id_compra = Column(Integer, nullable=True)
+    cantidad = Column(Integer, nullable=False)
+    precio_unitario = Column(Float, nullable=False)
+    costo_promedio = Column(Float, nullable=True)
+
+
+# Foto del stock de un insumo a una fecha de corte (resume los movimientos compactados)
+class StockCheckpoint(Base):
+    __tablename__ = "stock_checkpoint"
+    __table_args__ = (
+        UniqueConstraint("optica_id", "id_insumo", "fecha_corte", name="uq_stock_checkpoint_optica_insumo_corte"),
+    )
+
+    optica_id = Column(String(36), nullable=False)
+    id_checkpoint = Column(Integer, primary_key=True)
+    id_insumo = Column(Integer, ForeignKey("insumo.id_insumo"), nullable=False)
+    fecha_corte = Column(DateTime, nullable=False)
+    stock = Column(Integer, nullable=False)
+    id_ultimo_movimiento = Column(Integer, nullable=True)
+
+
+# Directorio de shards: en qué base están los datos de cada óptica (ver services/shards.py).
+# Vive en la base principal; las ópticas que no figuran están en la principal.
+class OpticaShard(Base):
+    __tablename__ = "optica_shard"
+
+    optica_id = Column(String(36), primary_key=True)
+    shard = Column(String(64), nullable=False)
+    bloqueada = Column(Boolean, nullable=False, default=False, server_default="0")
+
+
+# Contadores del tablero por óptica (clave -> valor; ver services/tablero.py)
+class TableroOptica(Base):
+    __tablename__ = "tablero_optica"
+    __table_args__ = (
+        UniqueConstraint("optica_id", "clave", name="uq_tablero_optica_clave"),
+    )
+
+    id_tablero = Column(Integer, primary_key=True)
+    optica_id = Column(String(36), nullable=False)
+    clave = Column(String(64), nullable=False)
+    valor = Column(Float, nullable=False, default=0, server_default="0")
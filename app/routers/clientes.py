@@ -1,14 +1,20 @@
+import io
+import tempfile
 from datetime import date
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel, EmailStr
-from sqlalchemy import or_, asc, desc
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, EmailStr, Field
 from sqlalchemy.orm import Session
 from app.schemas.cliente import ClienteOut, ClienteCreate, ClienteUpdate
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import Cliente
 from app.dependencies.optica import get_optica_id
+from app.services import etags, listados, tablero, typeahead
+from app.services.paginacion import ORDER_DIR_DESCRIPCION
+from app.services.proyeccion import a_dicts, columnas
+from app.services.importacion import ImportadorClientes, formato_desde_nombre, leer_filas
 
 router = APIRouter(prefix="/clientes", tags=["Clientes"])
 
@@ -16,8 +22,8 @@ router = APIRouter(prefix="/clientes", tags=["Clientes"])
 # ------------------- Schemas -------------------
 
 class ClienteCreate(BaseModel):
-    nombre: str
-    apellido: str
+    nombre: str = Field(..., max_length=100)
+    apellido: str = Field(..., max_length=100)
     dni: int
     fecha_nacimiento: Optional[date] = None
     telefono: Optional[str] = None
@@ -27,6 +33,12 @@ class ClienteCreate(BaseModel):
     activo: bool = True
 
 
+class ClienteImportIn(ClienteCreate):
+    # mismas reglas que el alta, más los datos que trae el sistema anterior
+    id_cliente_legacy: Optional[str] = None
+    fecha_alta: Optional[date] = None
+
+
 class ClienteOut(BaseModel):
     id_cliente: int
     nombre: str
@@ -56,77 +68,17 @@ def listar_clientes_avanzado(
     fecha_desde: date | None = None,
     fecha_hasta: date | None = None,
     order_by: str = "apellido",
-    order_dir: str = "asc",
+    order_dir: str = Query(default="asc", description=ORDER_DIR_DESCRIPCION),
     limit: int = 50,
     offset: int = 0,
-    db: Session = Depends(get_db),
+    cursor: str | None = Query(default=None, description="Cursor opaco (next_cursor de la página anterior)"),
+    include_total: bool = Query(default=True, description="false = no calcula el total"),
+    total_estimado: bool = Query(default=False, description="true = total aproximado (ópticas grandes)"),
+    db: Session = Depends(get_read_db),
 ):
-    query = db.query(Cliente).filter(Cliente.optica_id == optica_id)
-
-    # Búsqueda libre
-    if q:
-        patron = f"%{q.strip()}%"
-        query = query.filter(
-            or_(
-                Cliente.nombre.ilike(patron),
-                Cliente.apellido.ilike(patron),
-            )
-        )
-
-    # DNI exacto
-    if dni is not None:
-        query = query.filter(Cliente.dni == dni)
-
-    # Activo/inactivo
-    if activo is not None:
-        query = query.filter(Cliente.activo == activo)
-
-    # Rango fechas alta
-    if fecha_desde:
-        query = query.filter(Cliente.fecha_alta >= fecha_desde)
-
-    if fecha_hasta:
-        query = query.filter(Cliente.fecha_alta <= fecha_hasta)
-
-    # Orden seguro (whitelist)
-    columnas_validas = {
-        "nombre": Cliente.nombre,
-        "apellido": Cliente.apellido,
-        "dni": Cliente.dni,
-        "fecha_alta": Cliente.fecha_alta,
-        "id_cliente": Cliente.id_cliente,
-    }
-    col = columnas_validas.get(order_by.lower())
-    if not col:
-        raise HTTPException(
-            status_code=400,
-            detail=f"order_by inválido. Opciones: {', '.join(columnas_validas.keys())}",
-        )
-
-    direction = asc if order_dir.lower() == "asc" else desc
-    query = query.order_by(direction(col), asc(Cliente.apellido), asc(Cliente.nombre), desc(Cliente.id_cliente))
-
-    total = query.count()
-    clientes = query.offset(offset).limit(limit).all()
-
-    return {
-        "total": total,
-        "limit": limit,
-        "offset": offset,
-        "items": [
-            {
-                "id_cliente": c.id_cliente,
-                "nombre": c.nombre,
-                "apellido": c.apellido,
-                "dni": c.dni,
-                "telefono": c.telefono,
-                "email": c.email,
-                "activo": c.activo,
-                "fecha_alta": c.fecha_alta,
-            }
-            for c in clientes
-        ],
-    }
+    # consulta compartida con la versión async (app/services/listados.py)
+    listado = listados.clientes_avanzado(optica_id, q, dni, activo, fecha_desde, fecha_hasta, order_by, order_dir)
+    return listados.ejecutar(db, listado, optica_id, limit, offset, cursor, include_total, total_estimado)
 
 
 @router.post("/", response_model=ClienteOut, status_code=201)
@@ -149,11 +101,48 @@ def crear_cliente(
 
     nuevo = Cliente(**data)
     db.add(nuevo)
+    tablero.sumar(db, optica_id, tablero.de_cliente(nuevo))
     db.commit()
     db.refresh(nuevo)
     return nuevo
 
 
+@router.post("/importar")
+async def importar_clientes(
+    request: Request,
+    optica_id: str = Depends(get_optica_id),
+    formato: Optional[str] = Query(default=None, description="csv | ndjson (por defecto, según Content-Type)"),
+    db: Session = Depends(get_db),
+):
+    """
+    Importa clientes desde el cuerpo del request (CSV con encabezado o NDJSON).
+    Las filas cuyo id_cliente_legacy ya existe se omiten: se puede reenviar el
+    mismo archivo para retomar una importación cortada.
+    """
+    formato = (formato or formato_desde_nombre(None, request.headers.get("content-type"))).lower()
+    if formato not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="formato inválido. Opciones: csv, ndjson")
+
+    # se baja a un archivo temporal (a disco si es grande) y se recorre por filas
+    archivo = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    async for parte in request.stream():
+        archivo.write(parte)
+    archivo.seek(0)
+
+    def _importar():
+        texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+        try:
+            importador = ImportadorClientes(db, optica_id, ClienteImportIn)
+            return importador.importar(leer_filas(texto, formato))
+        except UnicodeDecodeError:
+            db.rollback()
+            raise HTTPException(status_code=400, detail="El archivo debe estar en UTF-8")
+        finally:
+            texto.close()
+
+    return await run_in_threadpool(_importar)
+
+
 @router.get("/", response_model=List[ClienteOut])
 def listar_clientes(
     optica_id: str = Depends(get_optica_id),
@@ -165,9 +154,10 @@ def listar_clientes(
     fecha_hasta: Optional[date] = Query(None, description="Fecha de alta hasta"),
     offset: int = Query(0, ge=0, description="Desplazamiento (para paginar)"),
     limit: int = Query(100, ge=1, le=500, description="Cantidad máxima de registros"),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    query = db.query(Cliente).filter(Cliente.optica_id == optica_id)
+    campos = list(ClienteOut.model_fields)
+    query = db.query(*columnas(Cliente, campos)).select_from(Cliente).filter(Cliente.optica_id == optica_id)
 
     if nombre:
         query = query.filter(Cliente.nombre.ilike(f"%{nombre.strip()}%"))
@@ -187,63 +177,51 @@ def listar_clientes(
     if fecha_hasta:
         query = query.filter(Cliente.fecha_alta <= fecha_hasta)
 
-    return (
+    filas = (
         query.order_by(Cliente.apellido.asc(), Cliente.nombre.asc(), Cliente.id_cliente.desc())
         .offset(offset)
         .limit(limit)
         .all()
     )
+    return a_dicts(filas, campos)
 
 
 @router.get("/select")
 def clientes_select(
     optica_id: str = Depends(get_optica_id),
-    q: str | None = Query(default=None, description="Filtro por nombre/apellido"),
+    q: str | None = Query(default=None, description="Filtro por nombre/apellido/DNI (prefijo)"),
     limit: int = Query(default=50, ge=1, le=200),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    query = db.query(Cliente).filter(Cliente.optica_id == optica_id, Cliente.activo == True)
-
-    if q:
-        like = f"%{q.strip()}%"
-        query = query.filter(
-            or_(
-                Cliente.nombre.ilike(like),
-                Cliente.apellido.ilike(like),
-            )
-        )
-
-    rows = query.order_by(Cliente.apellido.asc(), Cliente.nombre.asc()).limit(limit).all()
-
-    return [
-        {
-            "id": c.id_cliente,
-            "label": f"{c.apellido}, {c.nombre} (DNI {c.dni})",
-            "dni": c.dni,
-        }
-        for c in rows
-    ]
+    # se resuelve desde el índice en memoria de la óptica (sin ir a la base)
+    return typeahead.buscar(db, "cliente", optica_id, q, limit)
 
 
 @router.get("/{id_cliente}", response_model=ClienteOut)
 def obtener_cliente(
     id_cliente: int,
+    request: Request,
+    response: Response,
     optica_id: str = Depends(get_optica_id),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    cliente = (
-        db.query(Cliente)
-        .filter(Cliente.id_cliente == id_cliente, Cliente.optica_id == optica_id)
-        .first()
+    no_modificado = etags.condicional(
+        db, request, response, "cliente", optica_id, id_cliente, listados.CLIENTE_NO_ENCONTRADO
     )
+    if no_modificado:
+        return no_modificado
+
+    cliente = db.execute(listados.cliente(optica_id, id_cliente)).scalar_one_or_none()
     if not cliente:
-        raise HTTPException(status_code=404, detail="Cliente no encontrado")
+        raise HTTPException(status_code=404, detail=listados.CLIENTE_NO_ENCONTRADO)
     return cliente
 
 @router.patch("/{id_cliente}", response_model=ClienteOut)
 def actualizar_cliente(
     id_cliente: int,
     data: ClienteUpdate,
+    request: Request,
+    response: Response,
     optica_id: str = Depends(get_optica_id),
     db: Session = Depends(get_db),
 ):
@@ -255,6 +233,8 @@ def actualizar_cliente(
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
+    etags.exigir_version(request, cliente.version)
+
     patch = data.model_dump(exclude_unset=True)
 
 #Validacion para que el dni no sea repetido
@@ -267,11 +247,14 @@ def actualizar_cliente(
         if existe:
             raise HTTPException(status_code=400, detail="Ya existe un cliente con ese DNI en esta óptica")
 
+    antes = tablero.de_cliente(cliente)
     for k, v in patch.items():
         setattr(cliente, k, v)
+    tablero.cambio(db, optica_id, antes, tablero.de_cliente(cliente))
 
     db.commit()
     db.refresh(cliente)
+    etags.etag_actual(db, response, "cliente", optica_id, id_cliente)
     return cliente
 
 
@@ -289,6 +272,8 @@ def eliminar_cliente(
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente no encontrado")
 
+    antes = tablero.de_cliente(cliente)
     cliente.activo = False
+    tablero.cambio(db, optica_id, antes, tablero.de_cliente(cliente))
     db.commit()
     return
@@ -1,14 +1,23 @@
 from datetime import date, datetime
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel, Field
-from sqlalchemy import or_, asc, desc
+from sqlalchemy import asc, desc, insert
 from sqlalchemy.orm import Session, joinedload
 
-from app.database import get_db
-from app.models import CompraInsumos, DetalleCompraInsumos, Insumo, Proveedor
+from app.database import get_db, get_read_db
+from app.models import CompraInsumos, DetalleCompraInsumos, Proveedor
+from app.schemas.enums import TipoMovimientoStock
 from app.dependencies.optica import get_optica_id
+from app.services.paginacion import ORDER_DIR_DESCRIPCION, claves_orden, paginar, cerrar_pagina
+from app.services.conteo import contar_total
+from app.services.busqueda import subconsulta_busqueda
+from app.services.exportacion import exportar, validar_formato
+from app.services.entidades import cargar_insumos_optica
+from app.services.stock import aplicar_deltas, sumar_deltas
+from app.services import costos, etags, reposicion, tablero
+from app.services.proyeccion import a_dicts, campos_tabla, columnas
 
 router = APIRouter(prefix="/compras-insumos", tags=["Compras de insumos"])
 
@@ -24,16 +33,16 @@ class ItemCompra(BaseModel):
 class CompraInsumosCreate(BaseModel):
     id_proveedor: int
     fecha_compra: date
-    tipo_comprobante: Optional[str] = None
-    nro_comprobante: Optional[str] = None
+    tipo_comprobante: Optional[str] = Field(default=None, max_length=32)
+    nro_comprobante: Optional[str] = Field(default=None, max_length=64)
     observaciones: Optional[str] = None
     items: List[ItemCompra]
 
 
 class CompraInsumosPatchCabecera(BaseModel):
     fecha_compra: Optional[date] = None
-    tipo_comprobante: Optional[str] = None
-    nro_comprobante: Optional[str] = None
+    tipo_comprobante: Optional[str] = Field(default=None, max_length=32)
+    nro_comprobante: Optional[str] = Field(default=None, max_length=64)
     observaciones: Optional[str] = None
 
 
@@ -43,6 +52,13 @@ class CompraInsumosAnular(BaseModel):
 
 # -------------------- Helpers --------------------
 
+# columnas que devuelve el listado avanzado (se piden solo estas, sin cargar entidades)
+CAMPOS_AVANZADO = (
+    "id_compra", "id_proveedor", "fecha_compra", "tipo_comprobante", "nro_comprobante", "monto_total",
+    "observaciones", "anulada", "motivo_anulacion", "fecha_anulacion",
+)
+
+
 def _get_proveedor_optica(db: Session, optica_id: str, id_proveedor: int) -> Proveedor:
     proveedor = (
         db.query(Proveedor)
@@ -58,21 +74,6 @@ def _get_proveedor_optica(db: Session, optica_id: str, id_proveedor: int) -> Pro
     return proveedor
 
 
-def _get_insumo_optica(db: Session, optica_id: str, id_insumo: int) -> Insumo:
-    insumo = (
-        db.query(Insumo)
-        .filter(
-            Insumo.id_insumo == id_insumo,
-            Insumo.optica_id == optica_id,
-            Insumo.activo == True,
-        )
-        .first()
-    )
-    if not insumo:
-        raise HTTPException(status_code=400, detail=f"Insumo id {id_insumo} no existe, inactivo o fuera de esta óptica")
-    return insumo
-
-
 def _get_compra_optica(db: Session, optica_id: str, id_compra: int) -> CompraInsumos:
     compra = (
         db.query(CompraInsumos)
@@ -95,22 +96,23 @@ def listar_compras_insumos_avanzado(
     fecha_desde: Optional[date] = Query(default=None),
     fecha_hasta: Optional[date] = Query(default=None),
     order_by: str = Query(default="fecha_compra", description="fecha_compra|monto_total|id_compra"),
-    order_dir: str = Query(default="desc", description="asc|desc"),
+    order_dir: str = Query(default="desc", description=ORDER_DIR_DESCRIPCION),
     limit: int = Query(default=50, ge=1, le=200),
     offset: int = Query(default=0, ge=0),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(default=None, description="Cursor opaco (next_cursor de la página anterior)"),
+    include_total: bool = Query(default=True, description="false = no calcula el total"),
+    total_estimado: bool = Query(default=False, description="true = total aproximado (ópticas grandes)"),
+    db: Session = Depends(get_read_db),
 ):
-    query = db.query(CompraInsumos).filter(CompraInsumos.optica_id == optica_id)
-
-    if q:
-        like = f"%{q.strip()}%"
-        query = query.filter(
-            or_(
-                CompraInsumos.tipo_comprobante.ilike(like),
-                CompraInsumos.nro_comprobante.ilike(like),
-                CompraInsumos.observaciones.ilike(like),
-            )
-        )
+    query = (
+        db.query(*columnas(CompraInsumos, CAMPOS_AVANZADO))
+        .select_from(CompraInsumos)
+        .filter(CompraInsumos.optica_id == optica_id)
+    )
+
+    busqueda = subconsulta_busqueda(optica_id, "compra_insumos", q) if q else None
+    if busqueda is not None:
+        query = query.join(busqueda, busqueda.c.id_entidad == CompraInsumos.id_compra)
 
     if id_proveedor is not None:
         _get_proveedor_optica(db, optica_id, id_proveedor)
@@ -130,34 +132,57 @@ def listar_compras_insumos_avanzado(
         "monto_total": CompraInsumos.monto_total,
         "id_compra": CompraInsumos.id_compra,
     }
+    if busqueda is not None:
+        allowed["relevancia"] = busqueda.c.puntaje
     col = allowed.get(order_by)
-    if not col:
+    if col is None:
         raise HTTPException(status_code=400, detail=f"order_by inválido. Opciones: {list(allowed.keys())}")
 
     direction = asc if order_dir.lower() == "asc" else desc
-    query = query.order_by(direction(col), desc(CompraInsumos.id_compra))
+    claves = claves_orden(col, direction, [CompraInsumos.id_compra])
+    firma = f"{order_by}:{order_dir.lower()}"
+
+    total, es_estimado = contar_total(
+        db, query, optica_id, ("compra_insumos",),
+        {
+            "q": q, "id_proveedor": id_proveedor, "anulada": anulada,
+            "fecha_desde": fecha_desde, "fecha_hasta": fecha_hasta,
+        },
+        include_total, total_estimado,
+    )
+    pagina = paginar(query, claves, limit, offset, cursor, firma).all()
+    filas, next_cursor = cerrar_pagina(pagina, claves, limit, firma)
 
-    total = query.count()
-    rows = query.offset(offset).limit(limit).all()
+    return {
+        "total": total,
+        "total_estimado": es_estimado,
+        "limit": limit,
+        "offset": offset,
+        "next_cursor": next_cursor,
+        "items": a_dicts(filas, CAMPOS_AVANZADO),
+    }
 
-    items = []
-    for c in rows:
-        items.append(
-            {
-                "id_compra": c.id_compra,
-                "id_proveedor": c.id_proveedor,
-                "fecha_compra": c.fecha_compra,
-                "tipo_comprobante": c.tipo_comprobante,
-                "nro_comprobante": c.nro_comprobante,
-                "monto_total": c.monto_total,
-                "observaciones": c.observaciones,
-                "anulada": c.anulada,
-                "motivo_anulacion": c.motivo_anulacion,
-                "fecha_anulacion": c.fecha_anulacion,
-            }
-        )
 
-    return {"total": total, "limit": limit, "offset": offset, "items": items}
+# -------------------- Sugerencia de compra --------------------
+
+@router.get("/sugerencia")
+def sugerir_compras(
+    optica_id: str = Depends(get_optica_id),
+    id_proveedor: Optional[int] = Query(default=None),
+    dias_historia: int = Query(default=90, ge=14, le=730, description="Días de consumo que se miran"),
+    dias_cobertura: int = Query(default=30, ge=1, le=365, description="Días de consumo que tiene que cubrir la compra"),
+    dias_entrega: int = Query(default=7, ge=0, le=180, description="Días de entrega de los proveedores"),
+    nivel_servicio: float = Query(default=0.95, ge=0.5, lt=1, description="Probabilidad de no quedarse sin stock"),
+    incluir_todos: bool = Query(default=False, description="true = también los insumos que no hace falta pedir"),
+    db: Session = Depends(get_read_db),
+):
+    """Cantidades a comprar por insumo, agrupadas por proveedor (ver services/reposicion.py)."""
+    if id_proveedor is not None:
+        _get_proveedor_optica(db, optica_id, id_proveedor)
+    return reposicion.sugerir(
+        db, optica_id, date.today(), dias_historia, dias_cobertura, dias_entrega, nivel_servicio,
+        id_proveedor, incluir_todos,
+    )
 
 
 # -------------------- GET básicos --------------------
@@ -166,21 +191,33 @@ def listar_compras_insumos_avanzado(
 def listar_compras(
     optica_id: str = Depends(get_optica_id),
     incluir_anuladas: bool = Query(default=True, description="Si false, oculta anuladas"),
-    db: Session = Depends(get_db),
+    formato: Optional[str] = Query(default=None, alias="format", description="json | ndjson | csv (exportación en streaming)"),
+    db: Session = Depends(get_read_db),
 ):
-    query = db.query(CompraInsumos).filter(CompraInsumos.optica_id == optica_id)
+    formato = validar_formato(formato)
+    campos = campos_tabla(CompraInsumos)
+    query = db.query(*columnas(CompraInsumos, campos)).filter(CompraInsumos.optica_id == optica_id)
     if not incluir_anuladas:
         query = query.filter(CompraInsumos.anulada == False)
 
-    return query.order_by(CompraInsumos.fecha_compra.desc(), CompraInsumos.id_compra.desc()).all()
+    query = query.order_by(CompraInsumos.fecha_compra.desc(), CompraInsumos.id_compra.desc())
+    if formato:
+        return exportar(db, query.statement, formato, "compras")
+    return a_dicts(query.all(), campos)
 
 
 @router.get("/{id_compra}")
 def obtener_compra(
     id_compra: int,
+    request: Request,
+    response: Response,
     optica_id: str = Depends(get_optica_id),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
+    no_modificado = etags.condicional(db, request, response, "compra", optica_id, id_compra, "Compra no encontrada")
+    if no_modificado:
+        return no_modificado
+
     compra = (
         db.query(CompraInsumos)
         .options(joinedload(CompraInsumos.detalles).joinedload(DetalleCompraInsumos.insumo))
@@ -231,22 +268,24 @@ def crear_compra(
     if not compra_in.items:
         raise HTTPException(status_code=400, detail="La compra debe tener al menos un ítem")
 
+    # una sola query para todos los insumos de la factura, ya bloqueados para el stock
+    insumos = cargar_insumos_optica(db, optica_id, [item.id_insumo for item in compra_in.items], bloquear=True)
+
     monto_total = 0.0
-    detalles_objs: List[DetalleCompraInsumos] = []
+    detalles: List[dict] = []
 
     for item in compra_in.items:
-        _get_insumo_optica(db, optica_id, item.id_insumo)
-
         subtotal = item.cantidad * item.precio_unitario
         monto_total += subtotal
 
-        detalles_objs.append(
-            DetalleCompraInsumos(
-                id_insumo=item.id_insumo,
-                cantidad=item.cantidad,
-                precio_unitario=item.precio_unitario,
-                subtotal=subtotal,
-            )
+        detalles.append(
+            {
+                "optica_id": optica_id,
+                "id_insumo": item.id_insumo,
+                "cantidad": item.cantidad,
+                "precio_unitario": item.precio_unitario,
+                "subtotal": subtotal,
+            }
         )
 
     compra = CompraInsumos(
@@ -258,32 +297,41 @@ def crear_compra(
         observaciones=compra_in.observaciones,
         monto_total=monto_total,
         anulada=False,
-        detalles=detalles_objs,
     )
 
     db.add(compra)
+    db.flush()
+
+    # detalles en un único INSERT multi-fila
+    for det in detalles:
+        det["id_compra"] = compra.id_compra
+    db.execute(insert(DetalleCompraInsumos), detalles)
+
+    # actualizar stock (UPDATE set-based con filas bloqueadas)
+    stock_resultante = aplicar_deltas(
+        db,
+        optica_id,
+        sumar_deltas((item.id_insumo, item.cantidad) for item in compra_in.items),
+        TipoMovimientoStock.COMPRA,
+        id_origen=compra.id_compra,
+        bloqueadas=insumos.values(),
+    )
 
-    # actualizar stock
-    for item in compra_in.items:
-        insumo = (
-            db.query(Insumo)
-            .filter(Insumo.id_insumo == item.id_insumo, Insumo.optica_id == optica_id)
-            .first()
-        )
-        if not insumo:
-            raise HTTPException(status_code=400, detail=f"Insumo id {item.id_insumo} no pertenece a esta óptica")
-
-        if insumo.stock_actual is None:
-            insumo.stock_actual = 0
-        insumo.stock_actual += item.cantidad
-
-        if insumo.precio_costo is None:
-            insumo.precio_costo = item.precio_unitario
+    # costo promedio móvil (precio_costo) con los precios de esta compra
+    costos.aplicar_compra(
+        db,
+        optica_id,
+        compra.id_compra,
+        ((item.id_insumo, item.cantidad, item.precio_unitario) for item in compra_in.items),
+        TipoMovimientoStock.COMPRA,
+        stock_resultante,
+    )
 
+    tablero.sumar(db, optica_id, tablero.de_compra(compra))
     db.commit()
     db.refresh(compra)
 
-    return {"id_compra": compra.id_compra, "monto_total": compra.monto_total, "cantidad_items": len(compra.detalles)}
+    return {"id_compra": compra.id_compra, "monto_total": compra.monto_total, "cantidad_items": len(detalles)}
 
 
 # -------------------- PATCH cabecera --------------------
@@ -292,11 +340,15 @@ def crear_compra(
 def patch_compra_cabecera(
     id_compra: int,
     data: CompraInsumosPatchCabecera,
+    request: Request,
+    response: Response,
     optica_id: str = Depends(get_optica_id),
     db: Session = Depends(get_db),
 ):
     compra = _get_compra_optica(db, optica_id, id_compra)
 
+    etags.exigir_version(request, compra.version)
+
     if compra.anulada:
         raise HTTPException(status_code=400, detail="No se puede modificar una compra anulada")
 
@@ -304,11 +356,14 @@ def patch_compra_cabecera(
     if not patch:
         raise HTTPException(status_code=400, detail="No se enviaron campos para actualizar")
 
+    antes = tablero.de_compra(compra)
     for k, v in patch.items():
         setattr(compra, k, v)
+    tablero.cambio(db, optica_id, antes, tablero.de_compra(compra))
 
     db.commit()
     db.refresh(compra)
+    etags.etag_actual(db, response, "compra", optica_id, id_compra)
 
     return {
         "id_compra": compra.id_compra,
@@ -328,10 +383,11 @@ def anular_compra(
     optica_id: str = Depends(get_optica_id),
     db: Session = Depends(get_db),
 ):
+    # FOR UPDATE: dos anulaciones simultáneas de la misma compra no pueden revertir dos veces
     compra = (
         db.query(CompraInsumos)
-        .options(joinedload(CompraInsumos.detalles))
         .filter(CompraInsumos.id_compra == id_compra, CompraInsumos.optica_id == optica_id)
+        .with_for_update()
         .first()
     )
     if not compra:
@@ -343,34 +399,31 @@ def anular_compra(
     if not compra.detalles:
         raise HTTPException(status_code=400, detail="La compra no tiene detalles para anular")
 
-    # revertir stock (solo insumos de la misma óptica)
-    for det in compra.detalles:
-        insumo = (
-            db.query(Insumo)
-            .filter(Insumo.id_insumo == det.id_insumo, Insumo.optica_id == optica_id)
-            .first()
-        )
-        if not insumo:
-            raise HTTPException(
-                status_code=400,
-                detail=f"No existe insumo id {det.id_insumo} en esta óptica para revertir stock",
-            )
-
-        if insumo.stock_actual is None:
-            insumo.stock_actual = 0
-
-        nuevo_stock = insumo.stock_actual - det.cantidad
-        if nuevo_stock < 0:
-            raise HTTPException(
-                status_code=400,
-                detail=f"No se puede anular: el insumo id {insumo.id_insumo} quedaría con stock negativo",
-            )
-
-        insumo.stock_actual = nuevo_stock
+    # revertir stock (solo insumos de la misma óptica) y el costo promedio
+    stock_resultante = aplicar_deltas(
+        db,
+        optica_id,
+        sumar_deltas((det.id_insumo, -det.cantidad) for det in compra.detalles),
+        TipoMovimientoStock.ANULACION_COMPRA,
+        id_origen=compra.id_compra,
+        observaciones=payload.motivo,
+        motivo="No se puede anular: quedaría stock negativo",
+    )
+    costos.aplicar_compra(
+        db,
+        optica_id,
+        compra.id_compra,
+        ((det.id_insumo, det.cantidad, det.precio_unitario) for det in compra.detalles),
+        TipoMovimientoStock.ANULACION_COMPRA,
+        stock_resultante,
+        signo=-1,
+    )
 
+    antes = tablero.de_compra(compra)
     compra.anulada = True
     compra.motivo_anulacion = payload.motivo
     compra.fecha_anulacion = datetime.utcnow()
+    tablero.cambio(db, optica_id, antes, tablero.de_compra(compra))
 
     db.commit()
 
@@ -1,16 +1,29 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+import io
+import tempfile
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
 from typing import Optional
-from sqlalchemy import or_, asc, desc
+from sqlalchemy import desc
 
-from app.database import get_db
-from app.models import Insumo, Proveedor
+from app.database import get_db, get_read_db
+from app.models import HistorialCostoInsumo, Insumo, MovimientoStock, Proveedor
+from app.schemas.enums import TipoMovimientoStock
 from app.schemas.insumo import InsumoCreate, InsumoUpdate, InsumoOut
 from app.dependencies.optica import get_optica_id
+from app.services.paginacion import ORDER_DIR_DESCRIPCION, paginar, cerrar_pagina
+from app.services.busqueda import subconsulta_busqueda
+from app.services import etags, listados, tablero, typeahead
+from app.services.movimientos import stock_a_fecha
+from app.services.exportacion import exportar, validar_formato
+from app.services.importacion import ImportadorCatalogo, formato_desde_nombre, leer_filas
+from app.services.stock import aplicar_deltas, bajo_minimo, registrar_movimientos
+from app.services.proyeccion import a_dicts, columnas
 
 router = APIRouter(prefix="/insumos", tags=["Insumos"])
 
-
 def _get_proveedor_optica(db: Session, optica_id: str, id_proveedor: int) -> Proveedor:
     proveedor = (
         db.query(Proveedor)
@@ -18,18 +31,18 @@ def _get_proveedor_optica(db: Session, optica_id: str, id_proveedor: int) -> Pro
         .first()
     )
     if not proveedor:
-        raise HTTPException(status_code=400, detail="El proveedor indicado no existe en esta óptica.")
+        raise HTTPException(status_code=400, detail=listados.PROVEEDOR_INEXISTENTE)
     return proveedor
 
 
-def _get_insumo_optica(db: Session, optica_id: str, id_insumo: int) -> Insumo:
-    insumo = (
-        db.query(Insumo)
-        .filter(Insumo.id_insumo == id_insumo, Insumo.optica_id == optica_id)
-        .first()
-    )
+def _get_insumo_optica(db: Session, optica_id: str, id_insumo: int, bloquear: bool = False) -> Insumo:
+    consulta = listados.insumo(optica_id, id_insumo)
+    if bloquear:
+        # FOR UPDATE y con los valores de la base (no los que ya tenga la sesión)
+        consulta = consulta.with_for_update().execution_options(populate_existing=True)
+    insumo = db.execute(consulta).scalar_one_or_none()
     if not insumo:
-        raise HTTPException(status_code=404, detail="Insumo no encontrado en esta óptica.")
+        raise HTTPException(status_code=404, detail=listados.INSUMO_NO_ENCONTRADO)
     return insumo
 
 
@@ -41,77 +54,17 @@ def listar_insumos_avanzado(
     proveedor_id: Optional[int] = Query(default=None, description="Filtra por id_proveedor"),
     tipo_insumo: Optional[str] = Query(default=None, description="Filtra por tipo_insumo"),
     order_by: str = Query(default="descripcion", description="Campo de orden"),
-    order_dir: str = Query(default="asc", description="asc | desc"),
+    order_dir: str = Query(default="asc", description=ORDER_DIR_DESCRIPCION),
     limit: int = Query(default=50, ge=1, le=200),
     offset: int = Query(default=0, ge=0),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(default=None, description="Cursor opaco (next_cursor de la página anterior)"),
+    include_total: bool = Query(default=True, description="false = no calcula el total"),
+    total_estimado: bool = Query(default=False, description="true = total aproximado (ópticas grandes)"),
+    db: Session = Depends(get_read_db),
 ):
-    query = db.query(Insumo).filter(Insumo.optica_id == optica_id)
-
-    if activo is not None:
-        query = query.filter(Insumo.activo == activo)
-
-    if proveedor_id is not None:
-        # valida proveedor en esta óptica
-        _get_proveedor_optica(db, optica_id, proveedor_id)
-        query = query.filter(Insumo.id_proveedor == proveedor_id)
-
-    if tipo_insumo:
-        query = query.filter(Insumo.tipo_insumo.ilike(f"%{tipo_insumo.strip()}%"))
-
-    if q:
-        qv = f"%{q.strip()}%"
-        query = query.filter(
-            or_(
-                Insumo.descripcion.ilike(qv),
-                Insumo.tipo_insumo.ilike(qv),
-                Insumo.codigo_proveedor.ilike(qv),
-                Insumo.codigo_interno.ilike(qv),
-            )
-        )
-
-    allowed_order = {
-        "descripcion": Insumo.descripcion,
-        "tipo_insumo": Insumo.tipo_insumo,
-        "stock_actual": Insumo.stock_actual,
-        "stock_minimo": Insumo.stock_minimo,
-        "precio_costo": Insumo.precio_costo,
-        "precio_sugerido": Insumo.precio_sugerido,
-        "id_insumo": Insumo.id_insumo,
-        "id_proveedor": Insumo.id_proveedor,
-    }
-
-    col = allowed_order.get(order_by)
-    if not col:
-        raise HTTPException(
-            status_code=400,
-            detail=f"order_by inválido. Permitidos: {list(allowed_order.keys())}",
-        )
-
-    direction = asc if order_dir.lower() == "asc" else desc
-    query = query.order_by(direction(col), desc(Insumo.id_insumo))
-
-    total = query.count()
-    rows = query.offset(offset).limit(limit).all()
-
-    items = [
-        {
-            "id_insumo": i.id_insumo,
-            "descripcion": i.descripcion,
-            "tipo_insumo": i.tipo_insumo,
-            "id_proveedor": i.id_proveedor,
-            "codigo_proveedor": i.codigo_proveedor,
-            "codigo_interno": i.codigo_interno,
-            "precio_costo": i.precio_costo,
-            "precio_sugerido": i.precio_sugerido,
-            "stock_minimo": i.stock_minimo,
-            "stock_actual": i.stock_actual,
-            "activo": i.activo,
-        }
-        for i in rows
-    ]
-
-    return {"total": total, "limit": limit, "offset": offset, "items": items}
+    # consulta compartida con la versión async (app/services/listados.py)
+    listado = listados.insumos_avanzado(optica_id, q, activo, proveedor_id, tipo_insumo, order_by, order_dir)
+    return listados.ejecutar(db, listado, optica_id, limit, offset, cursor, include_total, total_estimado)
 
 
 @router.post("/", response_model=InsumoOut, status_code=status.HTTP_201_CREATED)
@@ -126,12 +79,63 @@ def crear_insumo(
     payload = data.model_dump()
     payload["optica_id"] = optica_id 
     nuevo = Insumo(**payload)
+    nuevo.stock_bajo = bajo_minimo(nuevo.stock_actual, nuevo.stock_minimo)
     db.add(nuevo)
+    db.flush()
+
+    if nuevo.stock_actual:
+        registrar_movimientos(db, [{
+            "optica_id": optica_id,
+            "id_insumo": nuevo.id_insumo,
+            "tipo": TipoMovimientoStock.AJUSTE,
+            "cantidad": nuevo.stock_actual,
+            "stock_resultante": nuevo.stock_actual,
+            "observaciones": "Stock inicial",
+        }])
+
+    tablero.sumar(db, optica_id, tablero.de_insumo(nuevo))
     db.commit()
     db.refresh(nuevo)
     return nuevo
 
 
+@router.post("/importar-catalogo")
+async def importar_catalogo(
+    request: Request,
+    optica_id: str = Depends(get_optica_id),
+    id_proveedor: Optional[int] = Query(default=None, description="Proveedor de la lista de precios"),
+    formato: Optional[str] = Query(default=None, description="csv | ndjson (por defecto, según Content-Type)"),
+    db: Session = Depends(get_db),
+):
+    """
+    Aplica la lista de precios (CSV con encabezado o NDJSON, clave codigo_interno):
+    da de alta los códigos nuevos y actualiza solo las líneas que cambiaron.
+    """
+    formato = (formato or formato_desde_nombre(None, request.headers.get("content-type"))).lower()
+    if formato not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="formato inválido. Opciones: csv, ndjson")
+
+    archivo = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+    async for parte in request.stream():
+        archivo.write(parte)
+    archivo.seek(0)
+
+    def _importar():
+        if id_proveedor is not None:
+            _get_proveedor_optica(db, optica_id, id_proveedor)
+        texto = io.TextIOWrapper(archivo, encoding="utf-8-sig", newline="")
+        try:
+            importador = ImportadorCatalogo(db, optica_id, id_proveedor)
+            return importador.importar(leer_filas(texto, formato))
+        except UnicodeDecodeError:
+            db.rollback()
+            raise HTTPException(status_code=400, detail="El archivo debe estar en UTF-8")
+        finally:
+            texto.close()
+
+    return await run_in_threadpool(_importar)
+
+
 @router.get("/", response_model=list[InsumoOut])
 def listar_insumos(
     optica_id: str = Depends(get_optica_id),
@@ -139,9 +143,12 @@ def listar_insumos(
     activo: Optional[bool] = Query(default=None),
     buscar: Optional[str] = Query(default=None, description="Busca en la descripción o código interno"),
     con_stock_bajo: Optional[bool] = Query(default=None, description="stock_actual <= stock_minimo"),
-    db: Session = Depends(get_db),
+    formato: Optional[str] = Query(default=None, alias="format", description="json | ndjson | csv (exportación en streaming)"),
+    db: Session = Depends(get_read_db),
 ):
-    query = db.query(Insumo).filter(Insumo.optica_id == optica_id)
+    formato = validar_formato(formato)
+    campos = list(InsumoOut.model_fields)
+    query = db.query(*columnas(Insumo, campos)).select_from(Insumo).filter(Insumo.optica_id == optica_id)
 
     if id_proveedor is not None:
         _get_proveedor_optica(db, optica_id, id_proveedor)
@@ -150,23 +157,17 @@ def listar_insumos(
     if activo is not None:
         query = query.filter(Insumo.activo == activo)
 
-    if buscar:
-        like = f"%{buscar}%"
-        query = query.filter(
-            or_(
-                Insumo.descripcion.ilike(like),
-                Insumo.codigo_interno.ilike(like),
-            )
-        )
+    busqueda = subconsulta_busqueda(optica_id, "insumo", buscar) if buscar else None
+    if busqueda is not None:
+        query = query.join(busqueda, busqueda.c.id_entidad == Insumo.id_insumo)
 
     if con_stock_bajo:
-        query = query.filter(
-            Insumo.stock_minimo.isnot(None),
-            Insumo.stock_actual.isnot(None),
-            Insumo.stock_actual <= Insumo.stock_minimo,
-        )
+        query = query.filter(Insumo.stock_bajo == True)
 
-    return query.order_by(Insumo.descripcion.asc()).all()
+    query = query.order_by(Insumo.descripcion.asc())
+    if formato:
+        return exportar(db, query.statement, formato, "insumos")
+    return a_dicts(query.all(), campos)
 
 
 @router.get("/select")
@@ -175,43 +176,39 @@ def insumos_select(
     proveedor_id: int | None = Query(default=None),
     q: str | None = Query(default=None),
     limit: int = Query(default=50, ge=1, le=200),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    query = db.query(Insumo).filter(Insumo.optica_id == optica_id, Insumo.activo == True)
-
-    if proveedor_id is not None:
-        _get_proveedor_optica(db, optica_id, proveedor_id)
-        query = query.filter(Insumo.id_proveedor == proveedor_id)
-
-    if q:
-        like = f"%{q.strip()}%"
-        query = query.filter(
-            or_(
-                Insumo.descripcion.ilike(like),
-                Insumo.codigo_interno.ilike(like),
-                Insumo.codigo_proveedor.ilike(like),
-            )
-        )
+    # se resuelve desde el índice en memoria de la óptica (sin ir a la base)
+    return typeahead.buscar_insumos(db, optica_id, q, limit, proveedor_id)
 
-    rows = query.order_by(Insumo.descripcion.asc()).limit(limit).all()
 
-    return [
-        {
-            "id": i.id_insumo,
-            "label": f"{i.descripcion} ({i.codigo_interno or '-'})",
-            "stock_actual": i.stock_actual,
-            "precio_costo": i.precio_costo,
-        }
-        for i in rows
-    ]
+@router.get("/stock-bajo")
+def listar_stock_bajo(
+    optica_id: str = Depends(get_optica_id),
+    activo: Optional[bool] = Query(default=True, description="Filtra por activo"),
+    proveedor_id: Optional[int] = Query(default=None, description="Filtra por id_proveedor"),
+    limit: int = Query(default=50, ge=1, le=200),
+    cursor: Optional[str] = Query(default=None, description="Cursor opaco (next_cursor de la página anterior)"),
+    include_total: bool = Query(default=True, description="false = no calcula el total"),
+    db: Session = Depends(get_read_db),
+):
+    listado = listados.insumos_stock_bajo(optica_id, activo, proveedor_id)
+    return listados.ejecutar(db, listado, optica_id, limit, cursor=cursor, include_total=include_total)
 
 
 @router.get("/{id_insumo}", response_model=InsumoOut)
 def obtener_insumo(
     id_insumo: int,
+    request: Request,
+    response: Response,
     optica_id: str = Depends(get_optica_id),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
+    no_modificado = etags.condicional(
+        db, request, response, "insumo", optica_id, id_insumo, listados.INSUMO_NO_ENCONTRADO
+    )
+    if no_modificado:
+        return no_modificado
     return _get_insumo_optica(db, optica_id, id_insumo)
 
 
@@ -219,22 +216,152 @@ def obtener_insumo(
 def actualizar_insumo(
     id_insumo: int,
     data: InsumoUpdate,
+    request: Request,
+    response: Response,
     optica_id: str = Depends(get_optica_id),
     db: Session = Depends(get_db),
 ):
-    insumo = _get_insumo_optica(db, optica_id, id_insumo)
+    # bloqueada desde acá: el ajuste de stock se calcula sobre el valor que no puede
+    # cambiar hasta el commit (una compra en el medio no se pierde)
+    insumo = _get_insumo_optica(db, optica_id, id_insumo, bloquear=True)
+
+    etags.exigir_version(request, insumo.version)
 
     if data.id_proveedor is not None:
         _get_proveedor_optica(db, optica_id, data.id_proveedor)
 
-    for campo, valor in data.model_dump(exclude_unset=True).items():
+    cambios = data.model_dump(exclude_unset=True)
+
+    # el stock no se pisa: se registra como ajuste en el libro de movimientos
+    nuevo_stock = cambios.pop("stock_actual", None)
+    if nuevo_stock is not None:
+        aplicar_deltas(
+            db, optica_id, {id_insumo: nuevo_stock - (insumo.stock_actual or 0)},
+            TipoMovimientoStock.AJUSTE, observaciones="Edición del insumo", bloqueadas=[insumo],
+        )
+
+    # (el cambio de stock ya lo contó aplicar_deltas)
+    antes = tablero.de_insumo(insumo)
+    for campo, valor in cambios.items():
         setattr(insumo, campo, valor)
+    insumo.stock_bajo = bajo_minimo(insumo.stock_actual, insumo.stock_minimo)
+    tablero.cambio(db, optica_id, antes, tablero.de_insumo(insumo))
 
     db.commit()
     db.refresh(insumo)
+    etags.etag_actual(db, response, "insumo", optica_id, id_insumo)
     return insumo
 
 
+class AjusteStockIn(BaseModel):
+    cantidad: int = Field(..., description="Positivo suma, negativo resta")
+    observaciones: Optional[str] = None
+
+
+@router.post("/{id_insumo}/ajuste-stock")
+def ajustar_stock(
+    id_insumo: int,
+    payload: AjusteStockIn,
+    optica_id: str = Depends(get_optica_id),
+    db: Session = Depends(get_db),
+):
+    if payload.cantidad == 0:
+        raise HTTPException(status_code=400, detail="La cantidad del ajuste no puede ser 0.")
+    _get_insumo_optica(db, optica_id, id_insumo)
+
+    resultantes = aplicar_deltas(
+        db, optica_id, {id_insumo: payload.cantidad},
+        TipoMovimientoStock.AJUSTE, observaciones=payload.observaciones,
+    )
+    db.commit()
+    return {"id_insumo": id_insumo, "stock_actual": resultantes[id_insumo]}
+
+
+@router.get("/{id_insumo}/stock-historico")
+def obtener_stock_historico(
+    id_insumo: int,
+    fecha: datetime = Query(..., description="Momento a consultar (ISO 8601)"),
+    optica_id: str = Depends(get_optica_id),
+    db: Session = Depends(get_read_db),
+):
+    _get_insumo_optica(db, optica_id, id_insumo)
+
+    stock = stock_a_fecha(db, optica_id, id_insumo, fecha)
+    if stock is None:
+        raise HTTPException(status_code=404, detail="No hay historial de stock para esa fecha (fue compactado).")
+    return {"id_insumo": id_insumo, "fecha": fecha, "stock": stock}
+
+
+@router.get("/{id_insumo}/movimientos")
+def listar_movimientos(
+    id_insumo: int,
+    optica_id: str = Depends(get_optica_id),
+    desde: Optional[datetime] = Query(default=None),
+    hasta: Optional[datetime] = Query(default=None),
+    limit: int = Query(default=50, ge=1, le=200),
+    cursor: Optional[str] = Query(default=None, description="Cursor opaco (next_cursor de la página anterior)"),
+    db: Session = Depends(get_read_db),
+):
+    _get_insumo_optica(db, optica_id, id_insumo)
+
+    campos = (
+        "id_movimiento", "fecha", "tipo", "cantidad", "stock_resultante", "id_origen", "observaciones",
+    )
+    query = db.query(*columnas(MovimientoStock, campos)).select_from(MovimientoStock).filter(
+        MovimientoStock.optica_id == optica_id,
+        MovimientoStock.id_insumo == id_insumo,
+    )
+    if desde:
+        query = query.filter(MovimientoStock.fecha >= desde)
+    if hasta:
+        query = query.filter(MovimientoStock.fecha <= hasta)
+
+    claves = [(MovimientoStock.fecha, desc), (MovimientoStock.id_movimiento, desc)]
+    pagina = paginar(query, claves, limit, cursor=cursor, firma="movimientos").all()
+    filas, next_cursor = cerrar_pagina(pagina, claves, limit, "movimientos")
+
+    return {
+        "limit": limit,
+        "next_cursor": next_cursor,
+        "items": a_dicts(filas, campos),
+    }
+
+
+@router.get("/{id_insumo}/costos")
+def listar_costos(
+    id_insumo: int,
+    optica_id: str = Depends(get_optica_id),
+    desde: Optional[datetime] = Query(default=None),
+    hasta: Optional[datetime] = Query(default=None),
+    limit: int = Query(default=50, ge=1, le=200),
+    cursor: Optional[str] = Query(default=None, description="Cursor opaco (next_cursor de la página anterior)"),
+    db: Session = Depends(get_read_db),
+):
+    # serie del costo promedio (ver services/costos.py), desde ix_hist_costo_optica_insumo_fecha
+    _get_insumo_optica(db, optica_id, id_insumo)
+
+    hist = HistorialCostoInsumo
+    campos = ("id_historial", "fecha", "tipo", "id_compra", "cantidad", "precio_unitario", "costo_promedio")
+    query = db.query(*columnas(hist, campos)).select_from(hist).filter(
+        hist.optica_id == optica_id,
+        hist.id_insumo == id_insumo,
+    )
+    if desde:
+        query = query.filter(hist.fecha >= desde)
+    if hasta:
+        query = query.filter(hist.fecha <= hasta)
+
+    claves = [(hist.fecha, desc), (hist.id_historial, desc)]
+    pagina = paginar(query, claves, limit, cursor=cursor, firma="costos").all()
+    filas, next_cursor = cerrar_pagina(pagina, claves, limit, "costos")
+
+    return {
+        "limit": limit,
+        "next_cursor": next_cursor,
+        "items": a_dicts(filas, campos),
+    }
+
+
 @router.delete("/{id_insumo}")
 def desactivar_insumo(
     id_insumo: int,
@@ -243,6 +370,8 @@ def desactivar_insumo(
 ):
     insumo = _get_insumo_optica(db, optica_id, id_insumo)
 
+    antes = tablero.de_insumo(insumo)
     insumo.activo = False
+    tablero.cambio(db, optica_id, antes, tablero.de_insumo(insumo))
     db.commit()
     return {"detail": "Insumo desactivado correctamente."}
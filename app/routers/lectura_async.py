@@ -0,0 +1,160 @@
+from datetime import date
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import get_async_db
+from app.routers.clientes import ClienteOut
+from app.schemas.insumo import InsumoOut
+from app.dependencies.optica import get_optica_id
+from app.services import etags, listados, typeahead
+from app.services.paginacion import ORDER_DIR_DESCRIPCION
+
+# LECTURAS ASYNC (OPTICA_DB_MODO=async)
+#
+# Versiones async de los GET más usados (autocomplete, listados avanzados, stock
+# bajo y detalle). Se montan antes que los routers sync, así que para estas rutas
+# ganan ellas; el resto de la API sigue igual. Las respuestas son las mismas: las
+# consultas se arman en app/services/listados.py, compartidas con los handlers
+# sync; acá solo se ejecutan con la AsyncSession.
+#
+# Los ids de las rutas de detalle llevan el conversor :int, para que un
+# /insumos/<ruta fija> del router sync (p. ej. /insumos/stock-bajo) no caiga acá.
+#
+# Los índices en memoria del autocomplete usan la sesión sync: se llaman con
+# run_sync (solo va a la base cuando hay que armar o refrescar el índice).
+
+router = APIRouter(tags=["Lecturas async"])
+
+
+# ------------------- Clientes -------------------
+
+@router.get("/clientes/avanzado")
+async def listar_clientes_avanzado(
+    optica_id: str = Depends(get_optica_id),
+    q: str | None = None,
+    dni: int | None = None,
+    activo: bool | None = None,
+    fecha_desde: date | None = None,
+    fecha_hasta: date | None = None,
+    order_by: str = "apellido",
+    order_dir: str = Query(default="asc", description=ORDER_DIR_DESCRIPCION),
+    limit: int = 50,
+    offset: int = 0,
+    cursor: str | None = Query(default=None, description="Cursor opaco (next_cursor de la página anterior)"),
+    include_total: bool = Query(default=True, description="false = no calcula el total"),
+    total_estimado: bool = Query(default=False, description="true = total aproximado (ópticas grandes)"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    listado = listados.clientes_avanzado(optica_id, q, dni, activo, fecha_desde, fecha_hasta, order_by, order_dir)
+    return await listados.ejecutar_async(db, listado, optica_id, limit, offset, cursor, include_total, total_estimado)
+
+
+@router.get("/clientes/select")
+async def clientes_select(
+    optica_id: str = Depends(get_optica_id),
+    q: str | None = Query(default=None, description="Filtro por nombre/apellido/DNI (prefijo)"),
+    limit: int = Query(default=50, ge=1, le=200),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(typeahead.buscar, "cliente", optica_id, q, limit)
+
+
+@router.get("/clientes/{id_cliente:int}", response_model=ClienteOut)
+async def obtener_cliente(
+    id_cliente: int,
+    request: Request,
+    response: Response,
+    optica_id: str = Depends(get_optica_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    no_modificado = await db.run_sync(
+        etags.condicional, request, response, "cliente", optica_id, id_cliente, listados.CLIENTE_NO_ENCONTRADO
+    )
+    if no_modificado:
+        return no_modificado
+
+    cliente = (await db.execute(listados.cliente(optica_id, id_cliente))).scalar_one_or_none()
+    if not cliente:
+        raise HTTPException(status_code=404, detail=listados.CLIENTE_NO_ENCONTRADO)
+    return cliente
+
+
+# ------------------- Insumos -------------------
+
+@router.get("/insumos/avanzado")
+async def listar_insumos_avanzado(
+    optica_id: str = Depends(get_optica_id),
+    q: Optional[str] = Query(default=None, description="Búsqueda por descripción/códigos/tipo"),
+    activo: Optional[bool] = Query(default=True, description="Filtra por activo"),
+    proveedor_id: Optional[int] = Query(default=None, description="Filtra por id_proveedor"),
+    tipo_insumo: Optional[str] = Query(default=None, description="Filtra por tipo_insumo"),
+    order_by: str = Query(default="descripcion", description="Campo de orden"),
+    order_dir: str = Query(default="asc", description=ORDER_DIR_DESCRIPCION),
+    limit: int = Query(default=50, ge=1, le=200),
+    offset: int = Query(default=0, ge=0),
+    cursor: Optional[str] = Query(default=None, description="Cursor opaco (next_cursor de la página anterior)"),
+    include_total: bool = Query(default=True, description="false = no calcula el total"),
+    total_estimado: bool = Query(default=False, description="true = total aproximado (ópticas grandes)"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    listado = listados.insumos_avanzado(optica_id, q, activo, proveedor_id, tipo_insumo, order_by, order_dir)
+    return await listados.ejecutar_async(db, listado, optica_id, limit, offset, cursor, include_total, total_estimado)
+
+
+@router.get("/insumos/select")
+async def insumos_select(
+    optica_id: str = Depends(get_optica_id),
+    proveedor_id: int | None = Query(default=None),
+    q: str | None = Query(default=None),
+    limit: int = Query(default=50, ge=1, le=200),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(typeahead.buscar_insumos, optica_id, q, limit, proveedor_id)
+
+
+@router.get("/insumos/stock-bajo")
+async def listar_stock_bajo(
+    optica_id: str = Depends(get_optica_id),
+    activo: Optional[bool] = Query(default=True, description="Filtra por activo"),
+    proveedor_id: Optional[int] = Query(default=None, description="Filtra por id_proveedor"),
+    limit: int = Query(default=50, ge=1, le=200),
+    cursor: Optional[str] = Query(default=None, description="Cursor opaco (next_cursor de la página anterior)"),
+    include_total: bool = Query(default=True, description="false = no calcula el total"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    listado = listados.insumos_stock_bajo(optica_id, activo, proveedor_id)
+    return await listados.ejecutar_async(db, listado, optica_id, limit, cursor=cursor, include_total=include_total)
+
+
+@router.get("/insumos/{id_insumo:int}", response_model=InsumoOut)
+async def obtener_insumo(
+    id_insumo: int,
+    request: Request,
+    response: Response,
+    optica_id: str = Depends(get_optica_id),
+    db: AsyncSession = Depends(get_async_db),
+):
+    no_modificado = await db.run_sync(
+        etags.condicional, request, response, "insumo", optica_id, id_insumo, listados.INSUMO_NO_ENCONTRADO
+    )
+    if no_modificado:
+        return no_modificado
+
+    insumo = (await db.execute(listados.insumo(optica_id, id_insumo))).scalar_one_or_none()
+    if not insumo:
+        raise HTTPException(status_code=404, detail=listados.INSUMO_NO_ENCONTRADO)
+    return insumo
+
+
+# ------------------- Proveedores -------------------
+
+@router.get("/proveedores/select")
+async def proveedores_select(
+    optica_id: str = Depends(get_optica_id),
+    q: str | None = Query(default=None),
+    limit: int = Query(default=50, ge=1, le=200),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(typeahead.buscar, "proveedor", optica_id, q, limit)
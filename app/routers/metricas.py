@@ -0,0 +1,31 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app import database
+from app.services import metricas
+
+router = APIRouter(tags=["Métricas"])
+
+
+def _pools() -> dict:
+    # los mismos pools que reporta /status/pool: principal, réplica y shards
+    motores = {"principal": database.engine}
+    if database.replica_engine is not None:
+        motores["replica"] = database.replica_engine
+    for nombre, motor in database.shard_engines.items():
+        if motor is not database.engine:
+            motores[nombre] = motor
+    return {
+        nombre: motor.pool.estadisticas()
+        for nombre, motor in motores.items()
+        if isinstance(motor.pool, database.PoolMedido)
+    }
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # async a propósito: lee los contadores desde el event loop, que es donde se escriben
+    return PlainTextResponse(
+        metricas.render(_pools()),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -1,20 +1,28 @@
 from datetime import date
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from pydantic import BaseModel, Field
-from sqlalchemy import and_, or_, asc, desc
+from sqlalchemy import and_, asc, desc, insert, select
 from sqlalchemy.orm import Session, joinedload
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import (
     PedidoLaboratorio,
     DetallePedidoLaboratorioInsumo,
     Receta,
     Proveedor,
-    Insumo,
 )
+from app.schemas.enums import TipoMovimientoStock
 from app.dependencies.optica import get_optica_id
+from app.services.paginacion import ORDER_DIR_DESCRIPCION, claves_orden, paginar, cerrar_pagina
+from app.services.conteo import contar_total
+from app.services.busqueda import subconsulta_busqueda
+from app.services.exportacion import exportar, validar_formato
+from app.services.entidades import cargar_insumos_optica
+from app.services.stock import aplicar_deltas, sumar_deltas
+from app.services import etags, tablero
+from app.services.proyeccion import a_dicts, cantidad_detalles, columnas
 
 router = APIRouter(prefix="/pedidos-laboratorio", tags=["Pedidos al laboratorio"])
 
@@ -34,33 +42,45 @@ class PedidoLaboratorioCreate(BaseModel):
     fecha_envio: Optional[date] = None
     fecha_estimada_rec: Optional[date] = None
     fecha_recepcion: Optional[date] = None
-    estado: Optional[str] = "ENVIADO"
-    nro_orden_lab: Optional[str] = None
+    estado: Optional[str] = Field(default="ENVIADO", max_length=32)
+    nro_orden_lab: Optional[str] = Field(default=None, max_length=64)
     observaciones: Optional[str] = None
     items: List[ItemPedidoLab]
 
 
 class PedidoPatch(BaseModel):
-    estado: Optional[str] = None
-    nro_orden_lab: Optional[str] = None
+    estado: Optional[str] = Field(default=None, max_length=32)
+    nro_orden_lab: Optional[str] = Field(default=None, max_length=64)
     fecha_estimada_rec: Optional[date] = None
     observaciones: Optional[str] = None
 
 
 class PedidoEstadoUpdate(BaseModel):
-    estado: str = Field(..., description="Nuevo estado del pedido")
+    estado: str = Field(..., max_length=32, description="Nuevo estado del pedido")
 
 
 class PedidoRecepcionUpdate(BaseModel):
     fecha_recepcion: Optional[date] = None  
-    estado: Optional[str] = None            
-    nro_orden_lab: Optional[str] = None
+    estado: Optional[str] = Field(default=None, max_length=32)
+    nro_orden_lab: Optional[str] = Field(default=None, max_length=64)
     observaciones: Optional[str] = None
     descontar_stock: bool = True
 
 
 # ----------------- Helpers -----------------
 
+# columnas que devuelven los listados (se piden solo estas, sin cargar entidades)
+CAMPOS_AVANZADO = (
+    "id_pedido_lab", "id_receta", "id_proveedor", "fecha_envio", "fecha_estimada_rec",
+    "fecha_recepcion", "estado", "nro_orden_lab",
+)
+CAMPOS_LISTADO = CAMPOS_AVANZADO + ("observaciones",)
+
+
+def _cantidad_insumos():
+    return cantidad_detalles(DetallePedidoLaboratorioInsumo.id_pedido_lab, PedidoLaboratorio.id_pedido_lab)
+
+
 def _estado_normalizado(s: Optional[str]) -> Optional[str]:
     return s.strip().upper() if isinstance(s, str) else s
 
@@ -102,21 +122,6 @@ def _get_proveedor_optica(db: Session, optica_id: str, id_proveedor: int) -> Pro
     return proveedor
 
 
-def _get_insumo_optica(db: Session, optica_id: str, id_insumo: int) -> Insumo:
-    insumo = (
-        db.query(Insumo)
-        .filter(
-            Insumo.id_insumo == id_insumo,
-            Insumo.optica_id == optica_id,
-            Insumo.activo == True,
-        )
-        .first()
-    )
-    if not insumo:
-        raise HTTPException(status_code=400, detail=f"Insumo con id {id_insumo} no existe, inactivo o fuera de esta óptica")
-    return insumo
-
-
 def _get_pedido_optica(db: Session, optica_id: str, id_pedido_lab: int) -> PedidoLaboratorio:
     pedido = (
         db.query(PedidoLaboratorio)
@@ -142,19 +147,19 @@ def crear_pedido(
     if not pedido_in.items:
         raise HTTPException(status_code=400, detail="El pedido debe tener al menos un ítem")
 
-    detalles_objs: List[DetallePedidoLaboratorioInsumo] = []
+    # una sola query para validar todos los insumos del pedido
+    cargar_insumos_optica(db, optica_id, [item.id_insumo for item in pedido_in.items])
 
-    for item in pedido_in.items:
-        _get_insumo_optica(db, optica_id, item.id_insumo)
-
-        detalles_objs.append(
-            DetallePedidoLaboratorioInsumo(
-                id_insumo=item.id_insumo,
-                cantidad=item.cantidad,
-                observaciones=item.observaciones,
-                precio_unitario=item.precio_unitario,
-            )
-        )
+    detalles: List[dict] = [
+        {
+            "optica_id": optica_id,
+            "id_insumo": item.id_insumo,
+            "cantidad": item.cantidad,
+            "observaciones": item.observaciones,
+            "precio_unitario": item.precio_unitario,
+        }
+        for item in pedido_in.items
+    ]
 
     pedido = PedidoLaboratorio(
         optica_id=optica_id,
@@ -166,10 +171,17 @@ def crear_pedido(
         estado=_estado_normalizado(pedido_in.estado) or "ENVIADO",
         nro_orden_lab=pedido_in.nro_orden_lab,
         observaciones=pedido_in.observaciones,
-        detalles_insumo=detalles_objs,
     )
 
     db.add(pedido)
+    db.flush()
+
+    # detalles en un único INSERT multi-fila
+    for det in detalles:
+        det["id_pedido_lab"] = pedido.id_pedido_lab
+    db.execute(insert(DetallePedidoLaboratorioInsumo), detalles)
+
+    tablero.sumar(db, optica_id, tablero.de_pedido(pedido))
     db.commit()
     db.refresh(pedido)
 
@@ -178,7 +190,7 @@ def crear_pedido(
         "id_receta": pedido.id_receta,
         "id_proveedor": pedido.id_proveedor,
         "estado": pedido.estado,
-        "cantidad_items": len(pedido.detalles_insumo),
+        "cantidad_items": len(detalles),
     }
 
 
@@ -192,11 +204,16 @@ def listar_pedidos_avanzado(
     fecha_desde: Optional[date] = None,
     fecha_hasta: Optional[date] = None,
     order_by: str = Query(default="fecha_envio"),
-    order_dir: str = Query(default="desc"),
+    order_dir: str = Query(default="desc", description=ORDER_DIR_DESCRIPCION),
     limit: int = Query(default=50, ge=1, le=200),
     offset: int = Query(default=0, ge=0),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(default=None, description="Cursor opaco (next_cursor de la página anterior)"),
+    include_total: bool = Query(default=True, description="false = no calcula el total"),
+    total_estimado: bool = Query(default=False, description="true = total aproximado (ópticas grandes)"),
+    db: Session = Depends(get_read_db),
 ):
+    busqueda = subconsulta_busqueda(optica_id, "pedido_laboratorio", q) if q else None
+
     order_map = {
         "id_pedido_lab": PedidoLaboratorio.id_pedido_lab,
         "fecha_envio": PedidoLaboratorio.fecha_envio,
@@ -207,9 +224,11 @@ def listar_pedidos_avanzado(
         "id_proveedor": PedidoLaboratorio.id_proveedor,
         "id_receta": PedidoLaboratorio.id_receta,
     }
+    if busqueda is not None:
+        order_map["relevancia"] = busqueda.c.puntaje
 
     col = order_map.get(order_by)
-    if not col:
+    if col is None:
         raise HTTPException(
             status_code=400,
             detail=f"order_by inválido. Opciones: {', '.join(order_map.keys())}",
@@ -218,13 +237,9 @@ def listar_pedidos_avanzado(
     direction = asc if order_dir.lower() == "asc" else desc
 
     query = (
-        db.query(PedidoLaboratorio)
+        db.query(*columnas(PedidoLaboratorio, CAMPOS_AVANZADO))
+        .select_from(PedidoLaboratorio)
         .filter(PedidoLaboratorio.optica_id == optica_id)
-        .options(
-            joinedload(PedidoLaboratorio.proveedor),
-            joinedload(PedidoLaboratorio.receta),
-            joinedload(PedidoLaboratorio.detalles_insumo).joinedload(DetallePedidoLaboratorioInsumo.insumo),
-        )
     )
 
     filtros = []
@@ -246,57 +261,55 @@ def listar_pedidos_avanzado(
     if fecha_hasta:
         filtros.append(PedidoLaboratorio.fecha_envio <= fecha_hasta)
 
-    if q:
-        q_like = f"%{q.strip()}%"
-        filtros.append(
-            or_(
-                PedidoLaboratorio.estado.ilike(q_like),
-                PedidoLaboratorio.nro_orden_lab.ilike(q_like),
-                PedidoLaboratorio.observaciones.ilike(q_like),
-            )
-        )
-
     if filtros:
         query = query.filter(and_(*filtros))
 
-    total = query.count()
+    if busqueda is not None:
+        query = query.join(busqueda, busqueda.c.id_entidad == PedidoLaboratorio.id_pedido_lab)
 
-    pedidos = (
-        query.order_by(direction(col), desc(PedidoLaboratorio.id_pedido_lab))
-        .offset(offset)
-        .limit(limit)
-        .all()
+    # el conteo va sin el join a proveedores ni la cantidad de ítems: solo necesita la tabla de pedidos
+    total, es_estimado = contar_total(
+        db, query, optica_id, ("pedido_laboratorio",),
+        {
+            "q": q, "id_proveedor": id_proveedor, "id_receta": id_receta, "estado": estado,
+            "fecha_desde": fecha_desde, "fecha_hasta": fecha_hasta,
+        },
+        include_total, total_estimado,
     )
 
-    data = []
-    for p in pedidos:
-        data.append(
-            {
-                "id_pedido_lab": p.id_pedido_lab,
-                "id_receta": p.id_receta,
-                "id_proveedor": p.id_proveedor,
-                "proveedor_nombre": p.proveedor.nombre if p.proveedor else None,
-                "fecha_envio": p.fecha_envio,
-                "fecha_estimada_rec": p.fecha_estimada_rec,
-                "fecha_recepcion": p.fecha_recepcion,
-                "estado": p.estado,
-                "nro_orden_lab": p.nro_orden_lab,
-                "items": len(p.detalles_insumo) if p.detalles_insumo else 0,
-            }
-        )
+    query = query.outerjoin(Proveedor, Proveedor.id_proveedor == PedidoLaboratorio.id_proveedor).add_columns(
+        Proveedor.nombre, _cantidad_insumos()
+    )
 
-    return {"total": total, "limit": limit, "offset": offset, "data": data}
+    claves = claves_orden(col, direction, [PedidoLaboratorio.id_pedido_lab])
+    firma = f"{order_by}:{order_dir.lower()}"
+    pagina = paginar(query, claves, limit, offset, cursor, firma).all()
+    filas, next_cursor = cerrar_pagina(pagina, claves, limit, firma)
+    data = a_dicts(filas, CAMPOS_AVANZADO + ("proveedor_nombre", "items"))
+
+    return {
+        "total": total,
+        "total_estimado": es_estimado,
+        "limit": limit,
+        "offset": offset,
+        "next_cursor": next_cursor,
+        "data": data,
+    }
 
 
 @router.patch("/{id_pedido_lab}")
 def patch_pedido(
     id_pedido_lab: int,
     data: PedidoPatch,
+    request: Request,
+    response: Response,
     optica_id: str = Depends(get_optica_id),
     db: Session = Depends(get_db),
 ):
     pedido = _get_pedido_optica(db, optica_id, id_pedido_lab)
 
+    etags.exigir_version(request, pedido.version)
+
     patch = data.model_dump(exclude_unset=True)
     if not patch:
         raise HTTPException(status_code=400, detail="No se enviaron campos")
@@ -306,11 +319,14 @@ def patch_pedido(
             raise HTTPException(status_code=400, detail="No se puede modificar el estado de un pedido ya recibido")
         patch["estado"] = _validar_estado(patch["estado"])
 
+    antes = tablero.de_pedido(pedido)
     for k, v in patch.items():
         setattr(pedido, k, v)
+    tablero.cambio(db, optica_id, antes, tablero.de_pedido(pedido))
 
     db.commit()
     db.refresh(pedido)
+    etags.etag_actual(db, response, "pedido", optica_id, id_pedido_lab)
     return {"id_pedido_lab": pedido.id_pedido_lab}
 
 
@@ -318,19 +334,26 @@ def patch_pedido(
 def actualizar_estado_pedido(
     id_pedido_lab: int,
     data: PedidoEstadoUpdate,
+    request: Request,
+    response: Response,
     optica_id: str = Depends(get_optica_id),
     db: Session = Depends(get_db),
 ):
     pedido = _get_pedido_optica(db, optica_id, id_pedido_lab)
 
+    etags.exigir_version(request, pedido.version)
+
     nuevo_estado = _validar_estado(data.estado)
 
     if pedido.estado == "RECIBIDO" and nuevo_estado != "RECIBIDO":
         raise HTTPException(status_code=400, detail="No se puede cambiar el estado de un pedido ya recibido")
 
+    antes = tablero.de_pedido(pedido)
     pedido.estado = nuevo_estado
+    tablero.cambio(db, optica_id, antes, tablero.de_pedido(pedido))
     db.commit()
     db.refresh(pedido)
+    etags.etag_actual(db, response, "pedido", optica_id, id_pedido_lab)
 
     return {"id_pedido_lab": pedido.id_pedido_lab, "estado": pedido.estado}
 
@@ -342,12 +365,11 @@ def recepcionar_pedido(
     optica_id: str = Depends(get_optica_id),
     db: Session = Depends(get_db),
 ):
+    # FOR UPDATE: dos recepciones simultáneas del mismo pedido no pueden descontar dos veces
     pedido = (
         db.query(PedidoLaboratorio)
-        .options(
-            joinedload(PedidoLaboratorio.detalles_insumo).joinedload(DetallePedidoLaboratorioInsumo.insumo)
-        )
         .filter(PedidoLaboratorio.id_pedido_lab == id_pedido_lab, PedidoLaboratorio.optica_id == optica_id)
+        .with_for_update()
         .first()
     )
     if not pedido:
@@ -356,8 +378,10 @@ def recepcionar_pedido(
     if pedido.fecha_recepcion:
         raise HTTPException(status_code=400, detail="Pedido ya recibido")
 
+    antes = tablero.de_pedido(pedido)
     pedido.fecha_recepcion = data.fecha_recepcion or date.today()
     pedido.estado = _estado_normalizado(data.estado) or "RECIBIDO"
+    tablero.cambio(db, optica_id, antes, tablero.de_pedido(pedido))
 
     if data.nro_orden_lab is not None:
         pedido.nro_orden_lab = data.nro_orden_lab
@@ -366,28 +390,14 @@ def recepcionar_pedido(
         pedido.observaciones = data.observaciones
 
     if data.descontar_stock:
-        for det in pedido.detalles_insumo:
-            insumo = det.insumo
-            if not insumo:
-                raise HTTPException(status_code=400, detail=f"Detalle con insumo inexistente (id_insumo={det.id_insumo}).")
-
-            # seguridad tenant: el insumo debe pertenecer a la óptica
-            if getattr(insumo, "optica_id", None) != optica_id:
-                raise HTTPException(status_code=400, detail=f"Insumo id {insumo.id_insumo} no pertenece a esta óptica")
-
-            if insumo.stock_actual is None:
-                insumo.stock_actual = 0
-
-            if insumo.stock_actual < det.cantidad:
-                raise HTTPException(
-                    status_code=400,
-                    detail=(
-                        f"Stock insuficiente para insumo id={insumo.id_insumo} "
-                        f"({insumo.descripcion}). Stock={insumo.stock_actual}, requiere={det.cantidad}"
-                    ),
-                )
-
-            insumo.stock_actual -= det.cantidad
+        # el servicio valida que los insumos sean de esta óptica y que alcance el stock
+        aplicar_deltas(
+            db,
+            optica_id,
+            sumar_deltas((det.id_insumo, -det.cantidad) for det in pedido.detalles_insumo),
+            TipoMovimientoStock.RECEPCION_PEDIDO,
+            id_origen=pedido.id_pedido_lab,
+        )
 
     db.commit()
     db.refresh(pedido)
@@ -404,46 +414,39 @@ def recepcionar_pedido(
 @router.get("/")
 def listar_pedidos(
     optica_id: str = Depends(get_optica_id),
-    db: Session = Depends(get_db),
+    formato: Optional[str] = Query(default=None, alias="format", description="json | ndjson | csv (exportación en streaming)"),
+    db: Session = Depends(get_read_db),
 ):
-    pedidos = (
-        db.query(PedidoLaboratorio)
-        .filter(PedidoLaboratorio.optica_id == optica_id)
-        .options(
-            joinedload(PedidoLaboratorio.proveedor),
-            joinedload(PedidoLaboratorio.receta),
-            joinedload(PedidoLaboratorio.detalles_insumo).joinedload(DetallePedidoLaboratorioInsumo.insumo),
+    formato = validar_formato(formato)
+    # mismas columnas para el JSON y la exportación, resueltas en SQL (sin cargar relaciones)
+    consulta = (
+        select(
+            *columnas(PedidoLaboratorio, CAMPOS_LISTADO),
+            Proveedor.nombre.label("proveedor_nombre"),
+            _cantidad_insumos().label("cantidad_insumos"),
         )
+        .outerjoin(Proveedor, Proveedor.id_proveedor == PedidoLaboratorio.id_proveedor)
+        .where(PedidoLaboratorio.optica_id == optica_id)
         .order_by(PedidoLaboratorio.id_pedido_lab.desc())
-        .all()
     )
+    if formato:
+        return exportar(db, consulta, formato, "pedidos")
 
-    items = []
-    for p in pedidos:
-        items.append(
-            {
-                "id_pedido_lab": p.id_pedido_lab,
-                "id_receta": p.id_receta,
-                "id_proveedor": p.id_proveedor,
-                "fecha_envio": p.fecha_envio,
-                "fecha_estimada_rec": p.fecha_estimada_rec,
-                "fecha_recepcion": p.fecha_recepcion,
-                "estado": p.estado,
-                "nro_orden_lab": p.nro_orden_lab,
-                "observaciones": p.observaciones,
-                "proveedor_nombre": p.proveedor.nombre if p.proveedor else None,
-                "cantidad_insumos": len(p.detalles_insumo),
-            }
-        )
-    return items
+    return [dict(fila) for fila in db.execute(consulta).mappings()]
 
 
 @router.get("/{id_pedido_lab}")
 def obtener_pedido(
     id_pedido_lab: int,
+    request: Request,
+    response: Response,
     optica_id: str = Depends(get_optica_id),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
+    no_modificado = etags.condicional(db, request, response, "pedido", optica_id, id_pedido_lab, "Pedido no encontrado")
+    if no_modificado:
+        return no_modificado
+
     pedido = (
         db.query(PedidoLaboratorio)
         .options(
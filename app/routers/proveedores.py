@@ -1,16 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from typing import Optional
-from sqlalchemy import or_, asc, desc
+from sqlalchemy import asc, desc
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import Proveedor
 from app.schemas.proveedor import ProveedorCreate, ProveedorOut
 from app.dependencies.optica import get_optica_id
+from app.services.paginacion import ORDER_DIR_DESCRIPCION, claves_orden, paginar, cerrar_pagina
+from app.services.conteo import contar_total
+from app.services.busqueda import subconsulta_busqueda
+from app.services.exportacion import exportar, validar_formato
+from app.services import etags, typeahead
+from app.services.proyeccion import a_dicts, columnas
 
 router = APIRouter(prefix="/proveedores", tags=["Proveedores"])
 
+# columnas que devuelve el listado avanzado (se piden solo estas, sin cargar entidades)
+CAMPOS_AVANZADO = ("id_proveedor", "nombre", "telefono", "email", "direccion", "activo")
+
 
 @router.get("/avanzado")
 def listar_proveedores_avanzado(
@@ -18,31 +27,31 @@ def listar_proveedores_avanzado(
     q: Optional[str] = None,
     activo: Optional[bool] = None,
     order_by: str = "nombre",
-    order_dir: str = "asc",
+    order_dir: str = Query(default="asc", description=ORDER_DIR_DESCRIPCION),
     limit: int = 50,
     offset: int = 0,
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(default=None, description="Cursor opaco (next_cursor de la página anterior)"),
+    include_total: bool = Query(default=True, description="false = no calcula el total"),
+    total_estimado: bool = Query(default=False, description="true = total aproximado (ópticas grandes)"),
+    db: Session = Depends(get_read_db),
 ):
     """
     Listado avanzado de proveedores (multi-óptica) con:
     - búsqueda por texto (q)
     - filtro por activo
     - orden dinámico seguro
-    - paginación
+    - paginación por offset o por cursor (next_cursor)
     """
 
-    query = db.query(Proveedor).filter(Proveedor.optica_id == optica_id)
-
-    if q:
-        patron = f"%{q.strip()}%"
-        query = query.filter(
-            or_(
-                Proveedor.nombre.ilike(patron),
-                Proveedor.email.ilike(patron),
-                Proveedor.telefono.ilike(patron),
-                Proveedor.direccion.ilike(patron),
-            )
-        )
+    query = (
+        db.query(*columnas(Proveedor, CAMPOS_AVANZADO))
+        .select_from(Proveedor)
+        .filter(Proveedor.optica_id == optica_id)
+    )
+
+    busqueda = subconsulta_busqueda(optica_id, "proveedor", q) if q else None
+    if busqueda is not None:
+        query = query.join(busqueda, busqueda.c.id_entidad == Proveedor.id_proveedor)
 
     if activo is not None:
         query = query.filter(Proveedor.activo == activo)
@@ -55,10 +64,12 @@ def listar_proveedores_avanzado(
     "direccion": Proveedor.direccion,
     "activo": Proveedor.activo,
     }
+    if busqueda is not None:
+        columnas_validas["relevancia"] = busqueda.c.puntaje
 
 
     col = columnas_validas.get(order_by.lower())
-    if not col:
+    if col is None:
         raise HTTPException(
             status_code=400,
             detail=f"order_by inválido. Opciones: {', '.join(columnas_validas.keys())}",
@@ -66,29 +77,22 @@ def listar_proveedores_avanzado(
 
     direction = asc if order_dir.lower() == "asc" else desc
 
-    total = query.count()
-    rows = (
-        query.order_by(direction(col), asc(Proveedor.nombre), desc(Proveedor.id_proveedor))
-        .offset(offset)
-        .limit(limit)
-        .all()
+    claves = claves_orden(col, direction, [Proveedor.nombre, Proveedor.id_proveedor])
+    firma = f"{order_by.lower()}:{order_dir.lower()}"
+
+    total, es_estimado = contar_total(
+        db, query, optica_id, ("proveedor",), {"q": q, "activo": activo}, include_total, total_estimado
     )
+    pagina = paginar(query, claves, limit, offset, cursor, firma).all()
+    filas, next_cursor = cerrar_pagina(pagina, claves, limit, firma)
 
     return {
         "total": total,
+        "total_estimado": es_estimado,
         "limit": limit,
         "offset": offset,
-        "items": [
-            {
-                "id_proveedor": p.id_proveedor,
-                "nombre": p.nombre,
-                "telefono": p.telefono,
-                "email": p.email,
-                "direccion": p.direccion,
-                "activo": p.activo,
-            }
-            for p in rows
-        ],
+        "next_cursor": next_cursor,
+        "items": a_dicts(filas, CAMPOS_AVANZADO),
     }
 
 
@@ -118,9 +122,12 @@ def listar_proveedores(
     optica_id: str = Depends(get_optica_id),
     activo: Optional[bool] = Query(default=None),
     nombre: Optional[str] = Query(default=None),
-    db: Session = Depends(get_db),
+    formato: Optional[str] = Query(default=None, alias="format", description="json | ndjson | csv (exportación en streaming)"),
+    db: Session = Depends(get_read_db),
 ):
-    query = db.query(Proveedor).filter(Proveedor.optica_id == optica_id)
+    formato = validar_formato(formato)
+    campos = list(ProveedorOut.model_fields)
+    query = db.query(*columnas(Proveedor, campos)).select_from(Proveedor).filter(Proveedor.optica_id == optica_id)
 
     if activo is not None:
         query = query.filter(Proveedor.activo == activo)
@@ -128,7 +135,10 @@ def listar_proveedores(
     if nombre:
         query = query.filter(Proveedor.nombre.ilike(f"%{nombre.strip()}%"))
 
-    return query.order_by(Proveedor.nombre.asc(), Proveedor.id_proveedor.desc()).all()
+    query = query.order_by(Proveedor.nombre.asc(), Proveedor.id_proveedor.desc())
+    if formato:
+        return exportar(db, query.statement, formato, "proveedores")
+    return a_dicts(query.all(), campos)
 
 
 @router.get("/select")
@@ -136,23 +146,17 @@ def proveedores_select(
     optica_id: str = Depends(get_optica_id),
     q: str | None = Query(default=None),
     limit: int = Query(default=50, ge=1, le=200),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    query = db.query(Proveedor).filter(Proveedor.optica_id == optica_id, Proveedor.activo == True)
-
-    if q:
-        like = f"%{q.strip()}%"
-        query = query.filter(Proveedor.nombre.ilike(like))
-
-    rows = query.order_by(Proveedor.nombre.asc()).limit(limit).all()
-    return [{"id": p.id_proveedor, "label": p.nombre} for p in rows]
+    # se resuelve desde el índice en memoria de la óptica (sin ir a la base)
+    return typeahead.buscar(db, "proveedor", optica_id, q, limit)
 
 
 @router.get("/{id_proveedor}", response_model=ProveedorOut)
 def obtener_proveedor(
     id_proveedor: int,
     optica_id: str = Depends(get_optica_id),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     proveedor = (
         db.query(Proveedor)
@@ -168,6 +172,8 @@ def obtener_proveedor(
 def actualizar_proveedor(
     id_proveedor: int,
     data: ProveedorCreate,
+    request: Request,
+    response: Response,
     optica_id: str = Depends(get_optica_id),
     db: Session = Depends(get_db),
 ):
@@ -179,12 +185,15 @@ def actualizar_proveedor(
     if not proveedor:
         raise HTTPException(status_code=404, detail="Proveedor no encontrado.")
 
+    etags.exigir_version(request, proveedor.version)
+
     for key, value in data.model_dump().items():
         setattr(proveedor, key, value)
 
     try:
         db.commit()
         db.refresh(proveedor)
+        etags.etag_actual(db, response, "proveedor", optica_id, id_proveedor)
     except IntegrityError:
         db.rollback()
         raise HTTPException(status_code=400, detail="El nombre del proveedor ya existe en esta óptica.")
@@ -1,15 +1,21 @@
 from datetime import date
 from typing import Optional
 
-from fastapi import APIRouter, Depends, HTTPException, Query
-from pydantic import BaseModel
-from sqlalchemy import or_, asc, desc
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import BaseModel, Field
+from sqlalchemy import asc, desc
 from sqlalchemy.orm import Session, joinedload
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import Receta, Cliente
 from app.schemas.enums import EstadoReceta
 from app.dependencies.optica import get_optica_id
+from app.services.paginacion import ORDER_DIR_DESCRIPCION, claves_orden, paginar, cerrar_pagina
+from app.services.conteo import contar_total
+from app.services.busqueda import subconsulta_busqueda
+from app.services.exportacion import exportar, validar_formato
+from app.services import etags, tablero
+from app.services.proyeccion import a_dicts, campos_tabla, columnas
 
 router = APIRouter(prefix="/recetas", tags=["Recetas"])
 
@@ -19,8 +25,8 @@ router = APIRouter(prefix="/recetas", tags=["Recetas"])
 class RecetaCreate(BaseModel):
     id_cliente: int
     fecha_receta: date
-    profesional: Optional[str] = None
-    tipo_lente: Optional[str] = None
+    profesional: Optional[str] = Field(default=None, max_length=150)
+    tipo_lente: Optional[str] = Field(default=None, max_length=64)
 
     od_esfera: Optional[float] = None
     od_cilindro: Optional[float] = None
@@ -34,7 +40,7 @@ class RecetaCreate(BaseModel):
     dp: Optional[float] = None
 
     observaciones: Optional[str] = None
-    estado: Optional[str] = "ACTIVA"
+    estado: Optional[str] = Field(default="ACTIVA", max_length=32)
     fecha_creacion_reg: Optional[date] = None
 
 
@@ -44,8 +50,8 @@ class RecetaEstadoUpdate(BaseModel):
 
 
 class RecetaPatch(BaseModel):
-    profesional: Optional[str] = None
-    tipo_lente: Optional[str] = None
+    profesional: Optional[str] = Field(default=None, max_length=150)
+    tipo_lente: Optional[str] = Field(default=None, max_length=64)
 
     od_esfera: Optional[float] = None
     od_cilindro: Optional[float] = None
@@ -59,11 +65,15 @@ class RecetaPatch(BaseModel):
     dp: Optional[float] = None
 
     observaciones: Optional[str] = None
-    estado: Optional[str] = None
+    estado: Optional[str] = Field(default=None, max_length=32)
 
 
 # ------------------- HELPERS -------------------
 
+# columnas que devuelve el listado avanzado (se piden solo estas, sin cargar entidades)
+CAMPOS_AVANZADO = ("id_receta", "id_cliente", "fecha_receta", "profesional", "tipo_lente", "estado", "observaciones")
+
+
 def _get_cliente_optica(db: Session, optica_id: str, id_cliente: int) -> Cliente:
     cliente = (
         db.query(Cliente)
@@ -109,6 +119,7 @@ def crear_receta(
 
     receta = Receta(**payload)
     db.add(receta)
+    tablero.sumar(db, optica_id, tablero.de_receta(receta))
     db.commit()
     db.refresh(receta)
 
@@ -128,13 +139,17 @@ def listar_recetas_avanzado(
     fecha_desde: Optional[date] = Query(default=None),
     fecha_hasta: Optional[date] = Query(default=None),
     order_by: str = Query(default="fecha_receta"),
-    order_dir: str = Query(default="desc"),
+    order_dir: str = Query(default="desc", description=ORDER_DIR_DESCRIPCION),
     limit: int = Query(default=50, ge=1, le=200),
     offset: int = Query(default=0, ge=0),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(default=None, description="Cursor opaco (next_cursor de la página anterior)"),
+    include_total: bool = Query(default=True, description="false = no calcula el total"),
+    total_estimado: bool = Query(default=False, description="true = total aproximado (ópticas grandes)"),
+    db: Session = Depends(get_read_db),
 ):
     query = (
-        db.query(Receta)
+        db.query(*columnas(Receta, CAMPOS_AVANZADO))
+        .select_from(Receta)
         .join(Cliente, Receta.id_cliente == Cliente.id_cliente)
         .filter(Receta.optica_id == optica_id, Cliente.optica_id == optica_id)
     )
@@ -163,18 +178,10 @@ def listar_recetas_avanzado(
     if fecha_hasta:
         query = query.filter(Receta.fecha_receta <= fecha_hasta)
 
-    if q:
-        like = f"%{q.strip()}%"
-        query = query.filter(
-            or_(
-                Cliente.nombre.ilike(like),
-                Cliente.apellido.ilike(like),
-                Receta.profesional.ilike(like),
-                Receta.tipo_lente.ilike(like),
-                Receta.estado.ilike(like),
-                Receta.observaciones.ilike(like),
-            )
-        )
+    # búsqueda libre: cliente (nombre/apellido), profesional, tipo_lente, estado, observaciones
+    busqueda = subconsulta_busqueda(optica_id, "receta", q) if q else None
+    if busqueda is not None:
+        query = query.join(busqueda, busqueda.c.id_entidad == Receta.id_receta)
 
     allowed_order = {
         "id_receta": Receta.id_receta,
@@ -186,58 +193,73 @@ def listar_recetas_avanzado(
         "cliente_nombre": Cliente.nombre,
         "dni": Cliente.dni,
     }
+    if busqueda is not None:
+        allowed_order["relevancia"] = busqueda.c.puntaje
 
     col = allowed_order.get(order_by)
-    if not col:
+    if col is None:
         raise HTTPException(
             status_code=400,
             detail=f"order_by inválido. Permitidos: {list(allowed_order.keys())}",
         )
 
     direction = asc if order_dir.lower() == "asc" else desc
-    query = query.order_by(direction(col), desc(Receta.id_receta))
+    claves = claves_orden(col, direction, [Receta.id_receta])
+    firma = f"{order_by}:{order_dir.lower()}"
 
-    total = query.count()
-    data = query.offset(offset).limit(limit).all()
-
-    items = [
+    total, es_estimado = contar_total(
+        db, query, optica_id, ("receta", "cliente"),
         {
-            "id_receta": r.id_receta,
-            "id_cliente": r.id_cliente,
-            "fecha_receta": r.fecha_receta,
-            "profesional": r.profesional,
-            "tipo_lente": r.tipo_lente,
-            "estado": r.estado,
-            "observaciones": r.observaciones,
-        }
-        for r in data
-    ]
+            "q": q, "activo_cliente": activo_cliente, "id_cliente": id_cliente, "dni": dni,
+            "estado": estado, "tipo_lente": tipo_lente, "profesional": profesional,
+            "fecha_desde": fecha_desde, "fecha_hasta": fecha_hasta,
+        },
+        include_total, total_estimado,
+    )
+    pagina = paginar(query, claves, limit, offset, cursor, firma).all()
+    filas, next_cursor = cerrar_pagina(pagina, claves, limit, firma)
 
-    return {"total": total, "limit": limit, "offset": offset, "items": items}
+    return {
+        "total": total,
+        "total_estimado": es_estimado,
+        "limit": limit,
+        "offset": offset,
+        "next_cursor": next_cursor,
+        "items": a_dicts(filas, CAMPOS_AVANZADO),
+    }
 
 
 @router.get("/")
 def listar_recetas(
     optica_id: str = Depends(get_optica_id),
-    db: Session = Depends(get_db),
+    formato: Optional[str] = Query(default=None, alias="format", description="json | ndjson | csv (exportación en streaming)"),
+    db: Session = Depends(get_read_db),
 ):
-    return (
-        db.query(Receta)
+    formato = validar_formato(formato)
+    campos = campos_tabla(Receta)
+    query = (
+        db.query(*columnas(Receta, campos))
         .filter(Receta.optica_id == optica_id)
         .order_by(Receta.id_receta.desc())
-        .all()
     )
+    if formato:
+        return exportar(db, query.statement, formato, "recetas")
+    return a_dicts(query.all(), campos)
 
 
 @router.patch("/{id_receta}/estado")
 def actualizar_estado_receta(
     id_receta: int,
     data: RecetaEstadoUpdate,
+    request: Request,
+    response: Response,
     optica_id: str = Depends(get_optica_id),
     db: Session = Depends(get_db),
 ):
     receta = _get_receta_optica(db, optica_id, id_receta)
 
+    etags.exigir_version(request, receta.version)
+
     receta.estado = data.estado.value
 
     if data.observaciones is not None:
@@ -245,6 +267,7 @@ def actualizar_estado_receta(
 
     db.commit()
     db.refresh(receta)
+    etags.etag_actual(db, response, "receta", optica_id, id_receta)
 
     return {
         "id_receta": receta.id_receta,
@@ -258,11 +281,15 @@ def actualizar_estado_receta(
 def patch_receta(
     id_receta: int,
     data: RecetaPatch,
+    request: Request,
+    response: Response,
     optica_id: str = Depends(get_optica_id),
     db: Session = Depends(get_db),
 ):
     receta = _get_receta_optica(db, optica_id, id_receta)
 
+    etags.exigir_version(request, receta.version)
+
     patch = data.model_dump(exclude_unset=True)
     if not patch:
         raise HTTPException(status_code=400, detail="No se enviaron campos")
@@ -280,14 +307,21 @@ def patch_receta(
 
     db.commit()
     db.refresh(receta)
+    etags.etag_actual(db, response, "receta", optica_id, id_receta)
     return {"id_receta": receta.id_receta, "estado": receta.estado}
 
 @router.get("/{id_receta}")
 def obtener_receta(
     id_receta: int,
+    request: Request,
+    response: Response,
     optica_id: str = Depends(get_optica_id),
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
+    no_modificado = etags.condicional(db, request, response, "receta", optica_id, id_receta, "Receta no encontrada")
+    if no_modificado:
+        return no_modificado
+
     receta = (
         db.query(Receta)
         .options(joinedload(Receta.cliente))
@@ -1,10 +1,13 @@
 from datetime import datetime, timezone
 
+from anyio import to_thread
 from fastapi import APIRouter, Depends
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
+from app import database
 from app.database import get_db
+from app.services import replica
 
 router = APIRouter(prefix="/status", tags=["Status"])
 
@@ -20,3 +23,52 @@ def status(db: Session = Depends(get_db)):
         "timestamp_utc": datetime.now(timezone.utc).isoformat(),
         "version": "1.0.0",
     }
+
+
+@router.get("/pool")
+async def pool():
+    # async a propósito: no ocupa un hilo del threadpool que se está midiendo
+    limitador = to_thread.current_default_thread_limiter().statistics()
+    pool = database.engine.pool
+    conexiones = (
+        pool.estadisticas()
+        if isinstance(pool, database.PoolMedido)
+        else {"pool": pool.status()}
+    )
+    lectura = None
+    if database.replica_engine is not None:
+        pool_replica = database.replica_engine.pool
+        lectura = {
+            "pool": (
+                pool_replica.estadisticas()
+                if isinstance(pool_replica, database.PoolMedido)
+                else {"pool": pool_replica.status()}
+            ),
+            **replica.estado(),
+        }
+
+    otros_shards = {
+        nombre: motor.pool.estadisticas()
+        for nombre, motor in database.shard_engines.items()
+        if motor is not database.engine and isinstance(motor.pool, database.PoolMedido)
+    }
+
+    return {
+        "pool": conexiones,
+        "replica": lectura,
+        "shards": otros_shards,
+        "threadpool": {
+            "tokens": limitador.total_tokens,
+            "en_uso": limitador.borrowed_tokens,
+            "esperando": limitador.tasks_waiting,
+        },
+        "config": {
+            "pool_size": database.DB_POOL_SIZE,
+            "max_overflow": database.DB_MAX_OVERFLOW,
+            "pool_timeout": database.DB_POOL_TIMEOUT,
+            "pool_recycle": database.DB_POOL_RECYCLE,
+            "echo": database.DB_ECHO,
+            "threadpool_tokens": database.THREADPOOL_TOKENS,
+        },
+        "timestamp_utc": datetime.now(timezone.utc).isoformat(),
+    }
@@ -0,0 +1,19 @@
+from datetime import date
+
+from fastapi import APIRouter, Depends
+from sqlalchemy.orm import Session
+
+from app.database import get_read_db
+from app.dependencies.optica import get_optica_id
+from app.services import tablero
+
+router = APIRouter(prefix="/dashboard", tags=["Tablero"])
+
+
+@router.get("")
+def dashboard(
+    optica_id: str = Depends(get_optica_id),
+    db: Session = Depends(get_read_db),
+):
+    # contadores ya calculados en cada escritura (ver services/tablero.py): lee unas pocas filas
+    return tablero.leer(db, optica_id, date.today())
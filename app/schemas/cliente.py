@@ -1,9 +1,9 @@
-from pydantic import BaseModel, ConfigDict
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import date
 
 class ClienteBase(BaseModel):
-    nombre: str
-    apellido: str
+    nombre: str = Field(..., max_length=100)
+    apellido: str = Field(..., max_length=100)
     dni: int
     fecha_nacimiento: date | None = None
     telefono: str | None = None
@@ -17,8 +17,8 @@ class ClienteCreate(ClienteBase):
     pass
 
 class ClienteUpdate(BaseModel):
-    nombre: str | None = None
-    apellido: str | None = None
+    nombre: str | None = Field(default=None, max_length=100)
+    apellido: str | None = Field(default=None, max_length=100)
     dni: int | None = None
     fecha_nacimiento: date | None = None
     telefono: str | None = None
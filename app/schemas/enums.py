@@ -10,3 +10,9 @@ class EstadoPedidoLab(str, Enum):
     ENVIADO = "ENVIADO"
     RECIBIDO = "RECIBIDO"
     CANCELADO = "CANCELADO"
+
+class TipoMovimientoStock(str, Enum):
+    COMPRA = "COMPRA"
+    ANULACION_COMPRA = "ANULACION_COMPRA"
+    RECEPCION_PEDIDO = "RECEPCION_PEDIDO"
+    AJUSTE = "AJUSTE"
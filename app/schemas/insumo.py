@@ -1,13 +1,13 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 
 
 class InsumoBase(BaseModel):
-    descripcion: str
-    tipo_insumo: Optional[str] = None
+    descripcion: str = Field(..., max_length=255)
+    tipo_insumo: Optional[str] = Field(default=None, max_length=64)
     id_proveedor: Optional[int] = None
-    codigo_proveedor: Optional[str] = None
-    codigo_interno: Optional[str] = None
+    codigo_proveedor: Optional[str] = Field(default=None, max_length=64)
+    codigo_interno: Optional[str] = Field(default=None, max_length=64)
     precio_costo: Optional[float] = None
     precio_sugerido: Optional[float] = None
     stock_minimo: Optional[int] = None
@@ -20,11 +20,11 @@ class InsumoCreate(InsumoBase):
 
 
 class InsumoUpdate(BaseModel):
-    descripcion: Optional[str] = None
-    tipo_insumo: Optional[str] = None
+    descripcion: Optional[str] = Field(default=None, max_length=255)
+    tipo_insumo: Optional[str] = Field(default=None, max_length=64)
     id_proveedor: Optional[int] = None
-    codigo_proveedor: Optional[str] = None
-    codigo_interno: Optional[str] = None
+    codigo_proveedor: Optional[str] = Field(default=None, max_length=64)
+    codigo_interno: Optional[str] = Field(default=None, max_length=64)
     precio_costo: Optional[float] = None
     precio_sugerido: Optional[float] = None
     stock_minimo: Optional[int] = None
@@ -37,3 +37,14 @@ class InsumoOut(InsumoBase):
 
     class Config:
         from_attributes = True
+
+
+class CatalogoItemIn(BaseModel):
+    # una línea de la lista de precios del proveedor (clave: codigo_interno)
+    codigo_interno: str = Field(..., max_length=64)
+    descripcion: str = Field(..., max_length=255)
+    tipo_insumo: Optional[str] = Field(default=None, max_length=64)
+    codigo_proveedor: Optional[str] = Field(default=None, max_length=64)
+    precio_costo: Optional[float] = None
+    precio_sugerido: Optional[float] = None
+    stock_minimo: Optional[int] = None
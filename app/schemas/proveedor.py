@@ -1,11 +1,11 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 
 class ProveedorBase(BaseModel):
     nombre: str
     telefono: Optional[str] = None
-    email: Optional[str] = None
-    direccion: Optional[str] = None
+    email: Optional[str] = Field(default=None, max_length=191)
+    direccion: Optional[str] = Field(default=None, max_length=255)
     activo: bool = True
 
 
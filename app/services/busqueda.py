@@ -0,0 +1,274 @@
+import re
+import sys
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import case, delete, event, func, insert, inspect, literal, select, union_all
+from sqlalchemy.orm import Session
+
+from app.models import (
+    Cliente,
+    CompraInsumos,
+    IndiceBusqueda,
+    Insumo,
+    PedidoLaboratorio,
+    Proveedor,
+    Receta,
+)
+
+# BÚSQUEDA LIBRE (q) SOBRE UN ÍNDICE INVERTIDO POR ÓPTICA
+#
+# Cada entidad se parte en tokens normalizados (minúsculas, sin acentos) que se
+# guardan en indice_busqueda con un peso según el campo. Buscar "per jua" es
+# buscar filas que tengan un token que empiece con "per" Y otro con "jua":
+# LIKE 'per%' sí usa el índice (optica_id, entidad, token), a diferencia de
+# ilike('%per%') que recorre toda la óptica.
+#
+# El índice se mantiene solo: al hacer flush de altas/cambios/bajas de las
+# entidades indexadas se re-indexan esas filas dentro de la misma transacción.
+# Las escrituras con SQL directo (importaciones masivas) llaman a indexar().
+
+MAX_TERMINOS = 8
+LARGO_TOKEN = 64
+
+# campo: (columna, peso, es_codigo). En los códigos además se indexa el valor
+# compacto ("AB-123" -> "ab123") para poder buscarlo completo.
+_ENTIDADES = {
+    "cliente": {
+        "id": Cliente.id_cliente,
+        "campos": [(Cliente.apellido, 3, False), (Cliente.nombre, 3, False)],
+    },
+    "insumo": {
+        "id": Insumo.id_insumo,
+        "campos": [
+            (Insumo.descripcion, 3, False),
+            (Insumo.codigo_interno, 3, True),
+            (Insumo.codigo_proveedor, 2, True),
+            (Insumo.tipo_insumo, 1, False),
+        ],
+    },
+    "receta": {
+        "id": Receta.id_receta,
+        "campos": [
+            (Cliente.apellido, 3, False),
+            (Cliente.nombre, 3, False),
+            (Receta.profesional, 2, False),
+            (Receta.tipo_lente, 1, False),
+            (Receta.estado, 1, False),
+            (Receta.observaciones, 1, False),
+        ],
+        # la receta se busca también por el nombre del cliente
+        "join": (Cliente, Receta.id_cliente == Cliente.id_cliente),
+        "depende": (Cliente, Receta.id_cliente),
+    },
+    "compra_insumos": {
+        "id": CompraInsumos.id_compra,
+        "campos": [
+            (CompraInsumos.nro_comprobante, 3, True),
+            (CompraInsumos.tipo_comprobante, 1, False),
+            (CompraInsumos.observaciones, 1, False),
+        ],
+    },
+    "pedido_laboratorio": {
+        "id": PedidoLaboratorio.id_pedido_lab,
+        "campos": [
+            (PedidoLaboratorio.nro_orden_lab, 3, True),
+            (PedidoLaboratorio.estado, 1, False),
+            (PedidoLaboratorio.observaciones, 1, False),
+        ],
+    },
+    "proveedor": {
+        "id": Proveedor.id_proveedor,
+        "campos": [
+            (Proveedor.nombre, 3, False),
+            (Proveedor.email, 1, False),
+            (Proveedor.telefono, 1, True),
+            (Proveedor.direccion, 1, False),
+        ],
+    },
+}
+
+
+# ------------------- Normalización -------------------
+
+def normalizar(texto: Optional[str]) -> str:
+    if not texto:
+        return ""
+    descompuesto = unicodedata.normalize("NFKD", str(texto))
+    return "".join(ch for ch in descompuesto if not unicodedata.combining(ch)).lower()
+
+
+def tokenizar(texto: Optional[str]) -> List[str]:
+    return [t[:LARGO_TOKEN] for t in re.findall(r"[a-z0-9]+", normalizar(texto))]
+
+
+def tokenizar_campo(valor, es_codigo: bool = False) -> List[str]:
+    tokens = tokenizar(valor)
+    if es_codigo and len(tokens) > 1:
+        tokens.append("".join(tokens)[:LARGO_TOKEN])
+    return tokens
+
+
+def _tokens_documento(valores: Iterable, campos) -> Dict[str, float]:
+    pesos: Dict[str, float] = {}
+    for valor, (_, peso, es_codigo) in zip(valores, campos):
+        for t in tokenizar_campo(valor, es_codigo):
+            pesos[t] = max(pesos.get(t, 0), peso)
+    return pesos
+
+
+# ------------------- Mantenimiento del índice -------------------
+
+def indexar(conn, entidad: str, ids: Iterable[int]) -> None:
+    """Re-indexa las filas indicadas (borra sus tokens y los vuelve a generar)."""
+    ids = sorted(set(i for i in ids if i is not None))
+    if not ids:
+        return
+
+    cfg = _ENTIDADES[entidad]
+    modelo = cfg["id"].class_
+    consulta = select(cfg["id"], modelo.optica_id, *[c for c, _, _ in cfg["campos"]]).select_from(modelo)
+    if "join" in cfg:
+        consulta = consulta.join(*cfg["join"])
+
+    conn.execute(
+        delete(IndiceBusqueda).where(IndiceBusqueda.entidad == entidad, IndiceBusqueda.id_entidad.in_(ids))
+    )
+
+    filas_indice = []
+    for fila in conn.execute(consulta.where(cfg["id"].in_(ids))):
+        id_entidad, optica_id, *valores = fila
+        for token, peso in _tokens_documento(valores, cfg["campos"]).items():
+            filas_indice.append(
+                {"optica_id": optica_id, "entidad": entidad, "id_entidad": id_entidad, "token": token, "peso": peso}
+            )
+
+    if filas_indice:
+        conn.execute(insert(IndiceBusqueda), filas_indice)
+
+
+def _borrar(conn, entidad: str, ids: Iterable[int]) -> None:
+    ids = list(ids)
+    if ids:
+        conn.execute(
+            delete(IndiceBusqueda).where(IndiceBusqueda.entidad == entidad, IndiceBusqueda.id_entidad.in_(ids))
+        )
+
+
+def _cambio_indexado(obj, entidad: str) -> bool:
+    cfg = _ENTIDADES[entidad]
+    estado = inspect(obj)
+    claves = [c.key for c, _, _ in cfg["campos"] if c.class_ is type(obj)]
+    if "join" in cfg:
+        claves.append(cfg["depende"][1].key)
+    return any(estado.attrs[k].history.has_changes() for k in claves)
+
+
+@event.listens_for(Session, "after_flush")
+def _indexar_cambios(session, flush_context):
+    a_indexar = defaultdict(set)
+    a_borrar = defaultdict(set)
+    por_dependencia = defaultdict(set)
+
+    for entidad, cfg in _ENTIDADES.items():
+        modelo = cfg["id"].class_
+        pk = cfg["id"].key
+        for obj in session.new:
+            if isinstance(obj, modelo):
+                a_indexar[entidad].add(getattr(obj, pk))
+        for obj in session.dirty:
+            if isinstance(obj, modelo) and _cambio_indexado(obj, entidad):
+                a_indexar[entidad].add(getattr(obj, pk))
+        for obj in session.deleted:
+            if isinstance(obj, modelo):
+                a_borrar[entidad].add(inspect(obj).dict.get(pk))
+
+        if "depende" in cfg:
+            padre, fk = cfg["depende"]
+            campos_padre = [c.key for c, _, _ in cfg["campos"] if c.class_ is padre]
+            for obj in session.dirty:
+                if isinstance(obj, padre) and any(
+                    inspect(obj).attrs[k].history.has_changes() for k in campos_padre
+                ):
+                    por_dependencia[entidad].add(inspect(obj).identity[0])
+
+    if not (a_indexar or a_borrar or por_dependencia):
+        return
+
+    conn = session.connection()
+    for entidad, ids_padre in por_dependencia.items():
+        cfg = _ENTIDADES[entidad]
+        fk = cfg["depende"][1]
+        a_indexar[entidad].update(conn.execute(select(cfg["id"]).where(fk.in_(ids_padre))).scalars())
+    for entidad, ids in a_borrar.items():
+        _borrar(conn, entidad, ids)
+    for entidad, ids in a_indexar.items():
+        indexar(conn, entidad, ids)
+
+
+def reindexar(db: Session, optica_id: Optional[str] = None, lote: int = 1000) -> None:
+    """Reconstruye el índice completo (o de una óptica). Para la carga inicial."""
+    for entidad, cfg in _ENTIDADES.items():
+        modelo = cfg["id"].class_
+        consulta = select(cfg["id"]).order_by(cfg["id"])
+        if optica_id:
+            consulta = consulta.where(modelo.optica_id == optica_id)
+        ids = db.execute(consulta).scalars().all()
+        for i in range(0, len(ids), lote):
+            indexar(db.connection(), entidad, ids[i:i + lote])
+            db.commit()
+
+
+# ------------------- Consulta -------------------
+
+def subconsulta_busqueda(optica_id: str, entidad: str, q: Optional[str]):
+    """
+    Subconsulta (id_entidad, puntaje) con las filas que matchean TODOS los términos
+    de q (por prefijo). El puntaje suma el peso de cada término (el doble si el
+    token es exacto). None si q no tiene términos buscables; 400 si tiene más de
+    MAX_TERMINOS (cada término es un SELECT más en el UNION).
+    """
+    terminos = list(dict.fromkeys(tokenizar(q)))
+    if len(terminos) > MAX_TERMINOS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"La búsqueda admite hasta {MAX_TERMINOS} términos (q tiene {len(terminos)})",
+        )
+    if not terminos:
+        return None
+
+    ib = IndiceBusqueda
+    por_termino = [
+        select(
+            ib.id_entidad,
+            literal(i).label("termino"),
+            func.max(case((ib.token == t, ib.peso * 2), else_=ib.peso)).label("puntaje"),
+        )
+        .where(ib.optica_id == optica_id, ib.entidad == entidad, ib.token.like(f"{t}%"))
+        .group_by(ib.id_entidad)
+        for i, t in enumerate(terminos)
+    ]
+    matches = union_all(*por_termino).subquery()
+
+    return (
+        select(matches.c.id_entidad, func.sum(matches.c.puntaje).label("puntaje"))
+        .group_by(matches.c.id_entidad)
+        .having(func.count() == len(terminos))
+        .subquery()
+    )
+
+
+if __name__ == "__main__":
+    # python -m app.services.busqueda [optica_id]
+    from app.database import sesion_optica, shard_engines
+
+    optica = sys.argv[1] if len(sys.argv) > 1 else None
+    # una óptica: su shard; todas: cada shard
+    for db in [sesion_optica(optica)] if optica else [Session(bind=m) for m in shard_engines.values()]:
+        try:
+            reindexar(db, optica)
+        finally:
+            db.close()
+    print("Índice de búsqueda reconstruido.")
@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.sql import Select
+from sqlalchemy.orm import Session
+
+from app.services.escrituras import Escrituras, suscribir
+
+# ESTRATEGIA DE CONTEO PARA LISTADOS PAGINADOS
+#
+# - exacto: COUNT cacheado por (óptica, filtros normalizados). Cada escritura de la
+#   óptica sobre la tabla sube su "generación" y deja viejas las entradas.
+# - estimado: para ópticas grandes, usa la estimación de filas de EXPLAIN (MySQL).
+#   Si la estimación da chica, conviene el exacto y se hace el COUNT igual.
+# - sin total: include_total=false no cuenta nada.
+#
+# El caché es por proceso: con varios workers, las escrituras hechas en otro
+# worker no invalidan este caché; por eso las entradas vencen igual a los TTL segundos.
+
+CONTEO_TTL = float(os.getenv("OPTICA_CONTEO_TTL", "60"))
+CONTEO_MAX_ENTRADAS = int(os.getenv("OPTICA_CONTEO_MAX_ENTRADAS", "10000"))
+CONTEO_ESTIMADO_DESDE = int(os.getenv("OPTICA_CONTEO_ESTIMADO_DESDE", "10000"))
+
+_lock = threading.Lock()
+_generaciones: Dict[Tuple[str, str], int] = {}
+_cache: "OrderedDict[tuple, Tuple[int, float]]" = OrderedDict()
+
+
+@suscribir
+def _invalidar(escrituras: Escrituras) -> None:
+    with _lock:
+        for clave in escrituras:
+            _generaciones[clave] = _generaciones.get(clave, 0) + 1
+
+
+def invalidar(tabla: str, optica_id: str) -> None:
+    _invalidar({(tabla, optica_id): None})
+
+
+def _normalizar(filtros: Dict[str, Any]) -> tuple:
+    normalizados = []
+    for k, v in filtros.items():
+        if v is None:
+            continue
+        if isinstance(v, str):
+            v = v.strip().lower()
+            if not v:
+                continue
+        normalizados.append((k, v))
+    return tuple(sorted(normalizados, key=lambda kv: kv[0]))
+
+
+def _estimar(db: Session, query) -> Optional[int]:
+    """
+    Filas estimadas por el optimizador (solo MySQL). None si no se puede estimar.
+
+    Con joins, EXPLAIN da una fila por tabla del SELECT principal (mismo id) y el
+    join es un nested loop: el resultado estimado es el producto de
+    rows * filtered / 100 de todas ellas, no la primera (que es la tabla que el
+    optimizador eligió leer primero, no necesariamente la del listado). Las filas
+    de subconsultas y tablas derivadas tienen otro id: la derivada ya aparece en
+    el SELECT principal como <derivedN> con su propia estimación.
+    """
+    dialect = db.get_bind().dialect
+    if dialect.name != "mysql":
+        return None
+
+    consulta = query.order_by(None)
+    compilado = getattr(consulta, "statement", consulta).compile(
+        dialect=dialect, compile_kwargs={"render_postcompile": True}
+    )
+    filas = db.connection().exec_driver_sql(f"EXPLAIN {compilado}", compilado.params).mappings().all()
+    if not filas:
+        return None
+
+    principal = filas[0].get("id")
+    estimado = 1.0
+    for fila in filas:
+        if fila.get("id") != principal:
+            continue
+        if fila.get("rows") is None:
+            return None  # "Impossible WHERE", tablas const, etc.: mejor el COUNT
+        estimado *= fila["rows"] * float(fila.get("filtered") or 100) / 100
+    return int(estimado)
+
+
+def contar_total(
+    db: Session,
+    query,
+    optica_id: str,
+    tablas: Sequence[str],
+    filtros: Dict[str, Any],
+    incluir: bool = True,
+    estimado: bool = False,
+) -> Tuple[Optional[int], bool]:
+    """
+    Devuelve (total, es_estimado) para la query (Query o Select) ya filtrada (sin
+    orden ni límite).
+
+    - tablas: tablas de las que depende el resultado (las escrituras sobre
+      cualquiera de ellas invalidan el conteo).
+    - filtros: los parámetros que definen el conjunto (q, fechas, etc.).
+    """
+    if not incluir:
+        return None, False
+
+    clave = _clave(optica_id, tablas, filtros)
+    total = _leer(clave)
+    if total is not None:
+        return total, False
+
+    if estimado:
+        aprox = _estimar(db, query)
+        if aprox is not None and aprox >= CONTEO_ESTIMADO_DESDE:
+            return aprox, True
+
+    if isinstance(query, Select):
+        total = db.execute(select(func.count()).select_from(query.order_by(None).subquery())).scalar() or 0
+    else:
+        total = query.order_by(None).with_entities(func.count()).scalar() or 0
+    _guardar(clave, total)
+    return total, False
+
+
+async def contar_total_async(
+    db,
+    consulta,
+    optica_id: str,
+    tablas: Sequence[str],
+    filtros: Dict[str, Any],
+    incluir: bool = True,
+    estimado: bool = False,
+) -> Tuple[Optional[int], bool]:
+    """Igual que contar_total(), para un Select ejecutado con AsyncSession (modo async)."""
+    if not incluir:
+        return None, False
+
+    clave = _clave(optica_id, tablas, filtros)
+    total = _leer(clave)
+    if total is not None:
+        return total, False
+
+    if estimado:
+        aprox = await db.run_sync(_estimar, consulta)
+        if aprox is not None and aprox >= CONTEO_ESTIMADO_DESDE:
+            return aprox, True
+
+    conteo = select(func.count()).select_from(consulta.order_by(None).subquery())
+    total = (await db.execute(conteo)).scalar() or 0
+    _guardar(clave, total)
+    return total, False
+
+
+def _clave(optica_id: str, tablas: Sequence[str], filtros: Dict[str, Any]) -> tuple:
+    with _lock:
+        generaciones = tuple(_generaciones.get((t, optica_id), 0) for t in tablas)
+    return (tuple(tablas), optica_id, _normalizar(filtros), generaciones)
+
+
+def _leer(clave: tuple) -> Optional[int]:
+    with _lock:
+        hit = _cache.get(clave)
+        if hit and hit[1] > time.monotonic():
+            _cache.move_to_end(clave)
+            return hit[0]
+    return None
+
+
+def _guardar(clave: tuple, total: int) -> None:
+    with _lock:
+        _cache[clave] = (total, time.monotonic() + CONTEO_TTL)
+        _cache.move_to_end(clave)
+        while len(_cache) > CONTEO_MAX_ENTRADAS:
+            _cache.popitem(last=False)
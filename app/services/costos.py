@@ -0,0 +1,130 @@
+from datetime import datetime
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import case, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.models import HistorialCostoInsumo, Insumo
+from app.schemas.enums import TipoMovimientoStock
+from app.services.escrituras import registrar_escritura
+
+# COSTO PROMEDIO MÓVIL (PERPETUO)
+#
+# Insumo.precio_costo es el costo promedio del stock que hay en cada momento.
+# Cada compra lo pondera con el stock previo a la compra:
+#   precio_costo = (stock_previo * precio_costo + cantidad * precio) / (stock_previo + cantidad)
+# y las salidas de stock (ventas, pedidos) no lo cambian. La anulación de una
+# compra hace la cuenta al revés con el stock que tenía antes de anularse:
+#   precio_costo = (stock * precio_costo - cantidad * precio) / (stock - cantidad)
+# Si entre la compra y la anulación no hubo otros movimientos del insumo, vuelve
+# exactamente al costo anterior. Si los hubo, es la mejor aproximación sin releer
+# la historia; cuando el stock que queda es 0 o la cuenta no da un costo positivo
+# (p. ej. se consumió casi todo lo comprado más barato), precio_costo no cambia.
+#
+# El stock previo sale del stock resultante que devuelve aplicar_deltas (se llama
+# antes, en la misma transacción y con las filas ya bloqueadas): una cuenta por
+# insumo y un único UPDATE set-based. Cada línea deja una fila en
+# historial_costo_insumo con el costo resultante: es la serie de
+# GET /insumos/{id}/costos.
+#
+# Una edición manual de precio_costo (o la lista de precios del proveedor) entra
+# en el promedio de la próxima compra como costo del stock que había.
+
+Linea = Tuple[int, int, float]  # (id_insumo, cantidad, precio_unitario)
+
+
+def costo_movil(
+    costo: Optional[float], stock_resultante: int, cantidad: int, valor: float, signo: int = 1
+) -> Optional[float]:
+    """
+    Costo promedio después de sumar (signo=1) o restar (signo=-1) `cantidad`
+    unidades por `valor` total, con `stock_resultante` ya aplicado el movimiento.
+    """
+    if stock_resultante <= 0:
+        return costo
+    if costo is None:
+        if signo < 0:
+            return None
+        costo = valor / cantidad  # sin costo previo: el stock que había vale lo mismo que lo comprado
+    total = costo * (stock_resultante - signo * cantidad) + signo * valor
+    if total <= 0:
+        return costo
+    return round(total / stock_resultante, 4)
+
+
+def aplicar_compra(
+    db: Session,
+    optica_id: str,
+    id_compra: int,
+    lineas: Iterable[Linea],
+    tipo: TipoMovimientoStock,
+    stock_resultante: Dict[int, int],
+    signo: int = 1,
+) -> Dict[int, Optional[float]]:
+    """
+    Pondera (signo=1, compra) o des-pondera (signo=-1, anulación) el costo de
+    cada insumo con las líneas, dentro de la transacción del request.
+    stock_resultante es lo que devolvió aplicar_deltas para esas mismas líneas.
+    Devuelve el precio_costo resultante por insumo.
+    """
+    cantidades: Dict[int, int] = {}
+    valores: Dict[int, float] = {}
+    for id_insumo, cantidad, precio in lineas:
+        cantidades[id_insumo] = cantidades.get(id_insumo, 0) + cantidad
+        valores[id_insumo] = valores.get(id_insumo, 0.0) + cantidad * precio
+    ids = sorted(i for i in cantidades if cantidades[i] > 0 and i in stock_resultante)
+    if not ids:
+        return {}
+
+    # (ya las bloqueó aplicar_deltas: acá no espera)
+    actuales = db.execute(
+        select(Insumo.id_insumo, Insumo.precio_costo)
+        .where(Insumo.optica_id == optica_id, Insumo.id_insumo.in_(ids))
+        .order_by(Insumo.id_insumo)
+        .with_for_update()
+    ).all()
+
+    nuevos: Dict[int, Optional[float]] = {
+        f.id_insumo: costo_movil(
+            f.precio_costo, stock_resultante[f.id_insumo], cantidades[f.id_insumo], valores[f.id_insumo], signo
+        )
+        for f in actuales
+    }
+    if not nuevos:
+        return {}
+
+    db.execute(
+        update(Insumo)
+        .where(Insumo.optica_id == optica_id, Insumo.id_insumo.in_(list(nuevos)))
+        .values(
+            precio_costo=case(nuevos, value=Insumo.id_insumo, else_=Insumo.precio_costo),
+            version=Insumo.version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+
+    # los objetos ya cargados en la sesión tienen los valores viejos
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, Insumo) and obj.id_insumo in nuevos:
+            db.expire(obj, ["precio_costo", "version"])
+
+    registrar_escritura(db, "insumo", optica_id, list(nuevos))
+
+    ahora = datetime.utcnow()
+    db.execute(
+        insert(HistorialCostoInsumo),
+        [
+            {
+                "optica_id": optica_id,
+                "id_insumo": i,
+                "fecha": ahora,
+                "tipo": TipoMovimientoStock(tipo).value,
+                "id_compra": id_compra,
+                "cantidad": signo * cantidades[i],
+                "precio_unitario": round(valores[i] / cantidades[i], 4),
+                "costo_promedio": nuevos[i],
+            }
+            for i in sorted(nuevos)
+        ],
+    )
+    return nuevos
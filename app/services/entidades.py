@@ -0,0 +1,50 @@
+from collections import Counter
+from typing import Dict, Iterable
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+
+from app.models import Insumo
+
+
+def cargar_insumos_optica(
+    db: Session,
+    optica_id: str,
+    ids: Iterable[int],
+    solo_activos: bool = True,
+    bloquear: bool = False,
+) -> Dict[int, Insumo]:
+    """
+    Trae en una sola query (IN) todos los insumos referenciados por una compra o
+    pedido. Si falta alguno (o está inactivo) informa todos juntos en un único 400.
+
+    Con bloquear=True los trae con FOR UPDATE en orden de id (el mismo orden que
+    aplicar_deltas), para pasárselos y no volver a leerlos.
+    """
+    ids = list(ids)
+
+    repetidos = sorted(i for i, veces in Counter(ids).items() if veces > 1)
+    if repetidos:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Insumos repetidos en los ítems: {', '.join(map(str, repetidos))}",
+        )
+
+    query = db.query(Insumo).filter(Insumo.optica_id == optica_id, Insumo.id_insumo.in_(ids))
+    if solo_activos:
+        query = query.filter(Insumo.activo == True)
+    if bloquear:
+        query = query.order_by(Insumo.id_insumo).with_for_update().populate_existing()
+
+    insumos = {i.id_insumo: i for i in query.all()}
+
+    faltantes = [i for i in ids if i not in insumos]
+    if faltantes:
+        raise HTTPException(
+            status_code=400,
+            detail=(
+                "Insumos inexistentes, inactivos o fuera de esta óptica: "
+                f"{', '.join(map(str, faltantes))}"
+            ),
+        )
+    return insumos
@@ -0,0 +1,66 @@
+import logging
+from typing import Callable, Dict, Optional, Set, Tuple
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+# REGISTRO DE ESCRITURAS POR ÓPTICA
+#
+# Junta, por sesión, qué tablas tocó cada óptica (y qué ids) y lo publica recién
+# cuando la transacción confirma. Los cachés en memoria (conteos, índices, etc.)
+# se suscriben para invalidarse. Si hay rollback, no se publica nada.
+#
+# Las escrituras hechas con el ORM se detectan solas en el flush. Las hechas con
+# SQL directo (UPDATE/INSERT masivos) tienen que avisar con registrar_escritura().
+
+logger = logging.getLogger(__name__)
+
+Escrituras = Dict[Tuple[str, str], Optional[Set[int]]]  # (tabla, optica_id) -> ids | None (todas)
+
+_suscriptores: list = []
+
+
+def suscribir(fn: Callable[[Escrituras], None]) -> Callable[[Escrituras], None]:
+    _suscriptores.append(fn)
+    return fn
+
+
+def registrar_escritura(session: Session, tabla: str, optica_id: str, ids=None) -> None:
+    """Marca (tabla, optica_id) como modificada en la transacción actual. ids=None = "no sé cuáles"."""
+    pendientes: Escrituras = session.info.setdefault("escrituras", {})
+    clave = (tabla, optica_id)
+    if ids is None:
+        pendientes[clave] = None
+    elif clave not in pendientes:
+        pendientes[clave] = set(ids)
+    elif pendientes[clave] is not None:
+        pendientes[clave].update(ids)
+
+
+@event.listens_for(Session, "after_flush")
+def _despues_de_flush(session, flush_context):
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        estado = inspect(obj)
+        tabla = getattr(obj, "__tablename__", None)
+        optica_id = estado.dict.get("optica_id")
+        if not tabla or not optica_id:
+            continue
+        pk = estado.dict.get(estado.mapper.primary_key[0].key)
+        registrar_escritura(session, tabla, optica_id, [pk] if pk is not None else None)
+
+
+@event.listens_for(Session, "after_commit")
+def _despues_de_commit(session):
+    pendientes = session.info.pop("escrituras", None)
+    if not pendientes:
+        return
+    for fn in _suscriptores:
+        try:
+            fn(pendientes)
+        except Exception:
+            logger.exception("Error notificando escrituras a %s", fn)
+
+
+@event.listens_for(Session, "after_rollback")
+def _despues_de_rollback(session):
+    session.info.pop("escrituras", None)
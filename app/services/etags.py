@@ -0,0 +1,164 @@
+from typing import Optional, Tuple
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.models import (
+    Cliente,
+    CompraInsumos,
+    DetalleCompraInsumos,
+    DetallePedidoLaboratorioInsumo,
+    Insumo,
+    PedidoLaboratorio,
+    Proveedor,
+    Receta,
+)
+
+# ETAGS Y GET CONDICIONAL (If-None-Match -> 304)
+#
+# Los GET de detalle arman el payload completo (con joinedload de cliente,
+# proveedor, detalles e insumos). El ETag sale de la columna version de la fila
+# y de las filas relacionadas que aparecen en el payload, leídas en UNA consulta
+# por clave primaria. Si el cliente ya tiene esa versión, se contesta 304 sin
+# cargar nada más.
+#
+# Las versiones solo suben, así que para los detalles (que no se editan después
+# del alta) alcanza con la suma de las versiones de sus insumos y la cantidad.
+#
+# EDICIÓN CON If-Match: el primer número del ETag es la versión de la fila. Los
+# PATCH/PUT que reciben If-Match comparan solo ese número (que cambie el stock de
+# un insumo no invalida la edición de la cabecera de una compra) y contestan 409
+# si la fila ya cambió. La carrera entre esa verificación y el commit la cubre
+# version_id_col (ver models.py).
+
+CACHE_CONTROL = "private, no-cache"  # el navegador puede guardar, pero revalida siempre
+
+
+def _versiones_insumos(detalle, fk_padre, pk_padre, optica_padre):
+    """(suma de versiones, cantidad) de los insumos del detalle, correlacionadas con la fila padre."""
+    condicion = (detalle.optica_id == optica_padre, fk_padre == pk_padre)
+    suma = (
+        select(func.coalesce(func.sum(Insumo.version), 0))
+        .select_from(detalle)
+        .join(Insumo, Insumo.id_insumo == detalle.id_insumo)
+        .where(*condicion)
+        .scalar_subquery()
+    )
+    cantidad = select(func.count()).select_from(detalle).where(*condicion).scalar_subquery()
+    return suma, cantidad
+
+
+def _consulta_version(entidad: str, optica_id: str, id_: int):
+    if entidad == "cliente":
+        return select(Cliente.version).where(Cliente.id_cliente == id_, Cliente.optica_id == optica_id)
+
+    if entidad == "insumo":
+        return select(Insumo.version).where(Insumo.id_insumo == id_, Insumo.optica_id == optica_id)
+
+    if entidad == "proveedor":
+        return select(Proveedor.version).where(Proveedor.id_proveedor == id_, Proveedor.optica_id == optica_id)
+
+    if entidad == "receta":
+        return (
+            select(Receta.version, Cliente.version)
+            .outerjoin(Cliente, Cliente.id_cliente == Receta.id_cliente)
+            .where(Receta.id_receta == id_, Receta.optica_id == optica_id)
+        )
+
+    if entidad == "compra":
+        suma, cantidad = _versiones_insumos(
+            DetalleCompraInsumos, DetalleCompraInsumos.id_compra, CompraInsumos.id_compra, CompraInsumos.optica_id
+        )
+        return (
+            select(CompraInsumos.version, suma, cantidad)
+            .where(CompraInsumos.id_compra == id_, CompraInsumos.optica_id == optica_id)
+        )
+
+    if entidad == "pedido":
+        suma, cantidad = _versiones_insumos(
+            DetallePedidoLaboratorioInsumo,
+            DetallePedidoLaboratorioInsumo.id_pedido_lab,
+            PedidoLaboratorio.id_pedido_lab,
+            PedidoLaboratorio.optica_id,
+        )
+        return (
+            select(PedidoLaboratorio.version, Proveedor.version, Receta.version, suma, cantidad)
+            .outerjoin(Proveedor, Proveedor.id_proveedor == PedidoLaboratorio.id_proveedor)
+            .outerjoin(Receta, Receta.id_receta == PedidoLaboratorio.id_receta)
+            .where(PedidoLaboratorio.id_pedido_lab == id_, PedidoLaboratorio.optica_id == optica_id)
+        )
+
+    raise ValueError(f"Entidad sin ETag: {entidad}")
+
+
+def versiones(db: Session, entidad: str, optica_id: str, id_: int) -> Optional[Tuple]:
+    """Versiones que componen el ETag de la entidad, o None si no existe en la óptica."""
+    fila = db.execute(_consulta_version(entidad, optica_id, id_)).first()
+    return tuple(fila) if fila is not None else None
+
+
+def calcular(partes: Tuple) -> str:
+    return '"' + ".".join(str(p or 0) for p in partes) + '"'
+
+
+def coincide(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # If-None-Match compara en forma débil: "W/" no importa
+    return any(v.strip().removeprefix("W/") == etag for v in if_none_match.split(","))
+
+
+def condicional(
+    db: Session, request: Request, response: Response, entidad: str, optica_id: str, id_: int, detalle_404: str
+) -> Optional[Response]:
+    """
+    Para el comienzo de un GET de detalle: 404 si no existe, un 304 listo para
+    devolver si el cliente ya tiene la versión actual, o None (y deja el ETag
+    puesto en `response`) si hay que armar el payload.
+    """
+    partes = versiones(db, entidad, optica_id, id_)
+    if partes is None:
+        raise HTTPException(status_code=404, detail=detalle_404)
+
+    etag = calcular(partes)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if coincide(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    response.headers.update(headers)
+    return None
+
+
+def etag_actual(db: Session, response: Response, entidad: str, optica_id: str, id_: int) -> None:
+    """Después de una edición: deja en `response` el ETag nuevo (el mismo que daría el GET)."""
+    partes = versiones(db, entidad, optica_id, id_)
+    if partes is not None:
+        response.headers["ETag"] = calcular(partes)
+
+
+def exigir_version(request: Request, version_actual: int) -> None:
+    """
+    If-Match (opcional): 409 si el cliente está editando sobre una versión que ya
+    no es la actual. Sin el header no se verifica nada (compatibilidad).
+    """
+    if_match = request.headers.get("if-match")
+    if not if_match or if_match.strip() == "*":
+        return
+
+    pedidas = set()
+    for valor in if_match.split(","):
+        valor = valor.strip().removeprefix("W/").strip('"')
+        version = valor.split(".", 1)[0]
+        if not version.isdigit():
+            raise HTTPException(status_code=400, detail=f"If-Match inválido: {if_match}")
+        pedidas.add(int(version))
+
+    if version_actual not in pedidas:
+        raise HTTPException(
+            status_code=409,
+            detail=f"El registro fue modificado por otro usuario (versión actual {version_actual}). "
+                   "Recargar y volver a intentar.",
+        )
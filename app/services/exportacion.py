@@ -0,0 +1,81 @@
+import csv
+import io
+import json
+from typing import Iterator, Optional
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+# EXPORTACIÓN EN STREAMING (NDJSON / CSV)
+#
+# Los listados sin paginar arman todo el resultado como objetos ORM y después un
+# único JSON en memoria. Con format=ndjson|csv, en cambio, se ejecuta un SELECT de
+# columnas planas con cursor del lado del servidor (stream_results) y se escribe
+# cada lote a la respuesta a medida que llega: la memoria no depende de la
+# cantidad de filas y el primer byte sale enseguida.
+#
+# Usa su propia conexión: la sesión del request puede cerrarse antes de que se
+# termine de mandar el cuerpo.
+
+FORMATOS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+FILAS_POR_LOTE = 1000
+
+
+def validar_formato(formato: Optional[str]) -> Optional[str]:
+    """None = JSON de siempre; si no, 'ndjson' o 'csv' (400 si es otro)."""
+    if formato is None or formato.lower() == "json":
+        return None
+    formato = formato.lower()
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail="format inválido. Opciones: json, ndjson, csv")
+    return formato
+
+
+def _filas(db: Session, consulta) -> Iterator[tuple]:
+    conn = db.get_bind().connect()
+    try:
+        resultado = conn.execution_options(stream_results=True, yield_per=FILAS_POR_LOTE).execute(consulta)
+        yield tuple(resultado.keys())
+        for lote in resultado.partitions():
+            yield from lote
+    finally:
+        conn.close()
+
+
+def _ndjson(filas: Iterator[tuple]) -> Iterator[str]:
+    columnas = next(filas)
+    buffer = []
+    for fila in filas:
+        buffer.append(json.dumps(dict(zip(columnas, fila)), default=str, ensure_ascii=False))
+        if len(buffer) >= FILAS_POR_LOTE:
+            yield "\n".join(buffer) + "\n"
+            buffer = []
+    if buffer:
+        yield "\n".join(buffer) + "\n"
+
+
+def _csv(filas: Iterator[tuple]) -> Iterator[str]:
+    salida = io.StringIO()
+    escritor = csv.writer(salida)
+    escritor.writerow(next(filas))
+    for i, fila in enumerate(filas, start=1):
+        escritor.writerow(fila)
+        if i % FILAS_POR_LOTE == 0:
+            yield salida.getvalue()
+            salida.seek(0)
+            salida.truncate()
+    yield salida.getvalue()
+
+
+def exportar(db: Session, consulta, formato: str, nombre: str) -> StreamingResponse:
+    """
+    Devuelve un StreamingResponse con el resultado de la consulta (un Select de
+    columnas planas, ya filtrado y ordenado) en el formato pedido.
+    """
+    generador = _ndjson if formato == "ndjson" else _csv
+    return StreamingResponse(
+        generador(_filas(db, consulta)),
+        media_type=FORMATOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nombre}.{formato}"'},
+    )
@@ -0,0 +1,395 @@
+import csv
+import hashlib
+import json
+import sys
+from datetime import date
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Type
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models import Cliente, Insumo
+from app.schemas.insumo import CatalogoItemIn
+from app.services import tablero
+from app.services.busqueda import indexar
+from app.services.escrituras import registrar_escritura
+from app.services.stock import bajo_minimo
+
+# IMPORTACIÓN MASIVA (CSV / NDJSON)
+#
+# El archivo se recorre fila por fila (nunca se carga entero) y se inserta por
+# lotes: un INSERT multi-fila y un commit por lote, en vez de una consulta de DNI +
+# commit + refresh por cliente. Los DNI y los id_cliente_legacy ya cargados en la
+# óptica se traen una sola vez al empezar, así la deduplicación es en memoria.
+#
+# Reanudable: las filas cuyo id_cliente_legacy ya existe en la óptica se omiten,
+# así que si una importación se corta basta con volver a mandar el mismo archivo.
+#
+# Catálogo de proveedor: se carga (codigo_interno -> valores actuales) de la
+# óptica una vez, se compara cada línea por un hash de su contenido y solo se
+# escriben las nuevas o cambiadas, con INSERT ... ON DUPLICATE KEY UPDATE por lote.
+
+TAM_LOTE = 1000
+MAX_ERRORES_REPORTE = 1000
+
+Fila = Tuple[int, dict]  # (nro de fila en el archivo, valores)
+
+
+def _limpiar(valores: dict) -> dict:
+    # en CSV las celdas vacías llegan como "": se toman como "sin dato"
+    return {
+        k.strip(): (v.strip() or None) if isinstance(v, str) else v
+        for k, v in valores.items()
+        if k
+    }
+
+
+def leer_filas(archivo, formato: str) -> Iterator[Fila]:
+    """Recorre un archivo de texto (csv con encabezado, o ndjson) fila por fila."""
+    if formato == "csv":
+        lector = csv.DictReader(archivo)
+        for valores in lector:
+            yield lector.line_num, _limpiar(valores)
+    elif formato == "ndjson":
+        for nro, linea in enumerate(archivo, start=1):
+            if not linea.strip():
+                continue
+            try:
+                valores = json.loads(linea)
+            except ValueError:
+                yield nro, None
+                continue
+            yield nro, _limpiar(valores) if isinstance(valores, dict) else None
+    else:
+        raise ValueError(f"Formato no soportado: {formato}")
+
+
+def formato_desde_nombre(nombre: Optional[str], content_type: Optional[str] = None) -> str:
+    nombre = (nombre or "").lower()
+    content_type = (content_type or "").lower()
+    if nombre.endswith((".ndjson", ".jsonl")) or "ndjson" in content_type or "jsonl" in content_type:
+        return "ndjson"
+    return "csv"
+
+
+def _errores_validacion(exc: ValidationError) -> List[str]:
+    return [f"{'.'.join(map(str, e['loc'])) or 'fila'}: {e['msg']}" for e in exc.errors()]
+
+
+class ImportadorClientes:
+    """
+    Importa clientes de una óptica validando cada fila con el esquema recibido
+    (el mismo que usa POST /clientes/ más id_cliente_legacy y fecha_alta).
+    """
+
+    def __init__(self, db: Session, optica_id: str, esquema: Type[BaseModel], tam_lote: int = TAM_LOTE):
+        self.db = db
+        self.optica_id = optica_id
+        self.esquema = esquema
+        self.tam_lote = tam_lote
+
+        existentes = db.execute(
+            select(Cliente.dni, Cliente.id_cliente_legacy).where(Cliente.optica_id == optica_id)
+        ).all()
+        self.dnis = {dni for dni, _ in existentes}
+        self.legacy = {legacy for _, legacy in existentes if legacy}
+
+        self.leidas = 0
+        self.insertadas = 0
+        self.omitidas = 0
+        self.cantidad_errores = 0
+        self.errores: List[dict] = []
+        self._lote: List[Tuple[int, dict]] = []
+
+    def _error(self, nro: int, legacy: Optional[str], errores: List[str]) -> None:
+        self.cantidad_errores += 1
+        if len(self.errores) < MAX_ERRORES_REPORTE:
+            self.errores.append({"fila": nro, "id_cliente_legacy": legacy, "errores": errores})
+
+    def agregar(self, nro: int, valores: Optional[dict]) -> None:
+        self.leidas += 1
+        if valores is None:
+            self._error(nro, None, ["fila ilegible"])
+            return
+
+        legacy = valores.get("id_cliente_legacy")
+        legacy = valores["id_cliente_legacy"] = str(legacy) if legacy is not None else None
+        if legacy and legacy in self.legacy:
+            self.omitidas += 1
+            return
+
+        try:
+            cliente = self.esquema(**valores)
+        except ValidationError as exc:
+            self._error(nro, legacy, _errores_validacion(exc))
+            return
+
+        if cliente.dni in self.dnis:
+            self._error(nro, legacy, ["Ya existe un cliente con ese DNI en esta óptica"])
+            return
+
+        data = cliente.model_dump()
+        data["optica_id"] = self.optica_id
+        data["id_cliente_legacy"] = legacy
+        data["fecha_alta"] = data.get("fecha_alta") or date.today()
+
+        self.dnis.add(cliente.dni)
+        if legacy:
+            self.legacy.add(legacy)
+        self._lote.append((nro, data))
+
+        if len(self._lote) >= self.tam_lote:
+            self.confirmar_lote()
+
+    def confirmar_lote(self) -> None:
+        lote, self._lote = self._lote, []
+        if not lote:
+            return
+
+        try:
+            with self.db.begin_nested():
+                self.db.execute(insert(Cliente), [data for _, data in lote])
+            insertadas = lote
+        except IntegrityError:
+            # algún conflicto que no se vio en memoria: se reintenta de a una fila
+            insertadas = []
+            for nro, data in lote:
+                try:
+                    with self.db.begin_nested():
+                        self.db.execute(insert(Cliente), [data])
+                    insertadas.append((nro, data))
+                except IntegrityError as exc:
+                    self.dnis.discard(data["dni"])
+                    self._error(nro, data["id_cliente_legacy"], [f"Conflicto al insertar: {exc.orig}"])
+
+        if insertadas:
+            dnis = [data["dni"] for _, data in insertadas]
+            ids = self.db.execute(
+                select(Cliente.id_cliente).where(Cliente.optica_id == self.optica_id, Cliente.dni.in_(dnis))
+            ).scalars().all()
+            indexar(self.db.connection(), "cliente", ids)
+            registrar_escritura(self.db, "cliente", self.optica_id)
+            activos = sum(1 for _, data in insertadas if data.get("activo", True))
+            tablero.sumar(self.db, self.optica_id, {"clientes_activos": activos})
+
+        self.db.commit()
+        self.insertadas += len(insertadas)
+
+    def importar(self, filas: Iterable[Fila]) -> dict:
+        for nro, valores in filas:
+            self.agregar(nro, valores)
+        self.confirmar_lote()
+        return self.reporte()
+
+    def reporte(self) -> dict:
+        return {
+            "leidas": self.leidas,
+            "insertadas": self.insertadas,
+            "omitidas": self.omitidas,
+            "con_error": self.cantidad_errores,
+            "errores": self.errores,
+        }
+
+
+# ------------------- Catálogo de insumos -------------------
+
+_CAMPOS_CATALOGO = [c for c in CatalogoItemIn.model_fields if c != "codigo_interno"]
+
+
+def _normalizar_valor(v):
+    if isinstance(v, float):
+        return round(v, 4)
+    if isinstance(v, str):
+        return v.strip()
+    return v
+
+
+def _hash_contenido(valores: dict, campos: Iterable[str]) -> str:
+    contenido = [(c, _normalizar_valor(valores.get(c))) for c in campos]
+    return hashlib.sha1(json.dumps(contenido, default=str).encode()).hexdigest()
+
+
+class ImportadorCatalogo:
+    """
+    Aplica la lista de precios de un proveedor sobre los insumos de la óptica,
+    escribiendo solo las líneas nuevas o cambiadas. Solo se comparan y pisan las
+    columnas que trae cada línea (una celda vacía no borra el dato actual).
+    """
+
+    def __init__(self, db: Session, optica_id: str, id_proveedor: Optional[int] = None, tam_lote: int = TAM_LOTE):
+        self.db = db
+        self.optica_id = optica_id
+        self.id_proveedor = id_proveedor
+        self.tam_lote = tam_lote
+
+        columnas = [Insumo.id_insumo, Insumo.version, Insumo.codigo_interno, Insumo.id_proveedor] + [
+            getattr(Insumo, c) for c in _CAMPOS_CATALOGO
+        ]
+        self.actuales: Dict[str, dict] = {
+            fila.codigo_interno: dict(fila._mapping)
+            for fila in db.execute(
+                select(*columnas).where(Insumo.optica_id == optica_id, Insumo.codigo_interno.isnot(None))
+            )
+        }
+        self.vistos: set = set()
+
+        self.leidas = 0
+        self.nuevas = 0
+        self.modificadas = 0
+        self.sin_cambios = 0
+        self.cantidad_errores = 0
+        self.errores: List[dict] = []
+        self._lote: List[dict] = []
+
+    def _error(self, nro: int, codigo: Optional[str], errores: List[str]) -> None:
+        self.cantidad_errores += 1
+        if len(self.errores) < MAX_ERRORES_REPORTE:
+            self.errores.append({"fila": nro, "codigo_interno": codigo, "errores": errores})
+
+    def agregar(self, nro: int, valores: Optional[dict]) -> None:
+        self.leidas += 1
+        if valores is None:
+            self._error(nro, None, ["fila ilegible"])
+            return
+
+        try:
+            item = CatalogoItemIn(**valores)
+        except ValidationError as exc:
+            self._error(nro, valores.get("codigo_interno"), _errores_validacion(exc))
+            return
+
+        codigo = item.codigo_interno.strip()
+        if codigo in self.vistos:
+            self._error(nro, codigo, ["codigo_interno repetido en el archivo"])
+            return
+        self.vistos.add(codigo)
+
+        data = item.model_dump(exclude_none=True, exclude={"codigo_interno"})
+        if self.id_proveedor is not None:
+            data["id_proveedor"] = self.id_proveedor
+        campos = sorted(data)
+
+        actual = self.actuales.get(codigo)
+        if actual is not None and _hash_contenido(actual, campos) == _hash_contenido(data, campos):
+            self.sin_cambios += 1
+            return
+
+        data["codigo_interno"] = codigo
+        data["optica_id"] = self.optica_id
+        if actual is None:
+            self.nuevas += 1
+        else:
+            self.modificadas += 1
+            data["id_insumo"] = actual["id_insumo"]
+            data["version"] = actual["version"]
+        self._lote.append(data)
+
+        if len(self._lote) >= self.tam_lote:
+            self.confirmar_lote()
+
+    def _upsert(self, filas: List[dict]) -> None:
+        # mismo conjunto de columnas por sentencia (cada línea puede traer distintas)
+        por_columnas: Dict[tuple, List[dict]] = {}
+        for data in filas:
+            valores = {k: v for k, v in data.items() if k not in ("id_insumo", "version")}
+            por_columnas.setdefault(tuple(sorted(valores)), []).append(valores)
+
+        for columnas, grupo in por_columnas.items():
+            stmt = mysql_insert(Insumo).values(grupo)
+            cambios = {c: stmt.inserted[c] for c in columnas if c not in ("optica_id", "codigo_interno")}
+            cambios["version"] = Insumo.version + 1
+            stmt = stmt.on_duplicate_key_update(cambios)
+            self.db.execute(stmt)
+
+    def _insert_update(self, filas: List[dict]) -> None:
+        # otros motores (sin ON DUPLICATE KEY UPDATE): INSERT de las nuevas y
+        # UPDATE por clave primaria de las cambiadas, agrupadas por columnas
+        grupos: Dict[tuple, List[dict]] = {}
+        for data in filas:
+            grupos.setdefault(("id_insumo" in data, tuple(sorted(data))), []).append(data)
+
+        for (existe, _), grupo in grupos.items():
+            if existe:
+                # con version: UPDATE ... WHERE id_insumo = ? AND version = ? y la sube
+                self.db.execute(update(Insumo), grupo)
+            else:
+                self.db.execute(insert(Insumo), grupo)
+
+    def _marcar_stock_bajo(self, lote: List[dict]) -> None:
+        # el stock_minimo nuevo puede meter o sacar insumos de stock bajo: se calcula
+        # la marca contra el stock de la fila bloqueada (no la foto del inicio) y va
+        # en el mismo upsert. Las altas del catálogo no traen stock: quedan sin marca.
+        por_id = {d["id_insumo"]: d for d in lote if "id_insumo" in d and "stock_minimo" in d}
+        if not por_id:
+            return
+        filas = self.db.execute(
+            select(Insumo.id_insumo, Insumo.activo, Insumo.stock_actual, Insumo.stock_bajo)
+            .where(Insumo.optica_id == self.optica_id, Insumo.id_insumo.in_(sorted(por_id)))
+            .order_by(Insumo.id_insumo)
+            .with_for_update()
+        ).all()
+        cruces = 0
+        for f in filas:
+            data = por_id[f.id_insumo]
+            data["stock_bajo"] = bajo_minimo(f.stock_actual, data["stock_minimo"])
+            cruces += bool(f.activo) * (data["stock_bajo"] - bool(f.stock_bajo))
+        tablero.sumar(self.db, self.optica_id, {"stock_bajo": cruces})
+
+    def confirmar_lote(self) -> None:
+        lote, self._lote = self._lote, []
+        if not lote:
+            return
+
+        self._marcar_stock_bajo(lote)
+        if self.db.get_bind().dialect.name == "mysql":
+            self._upsert(lote)
+        else:
+            self._insert_update(lote)
+
+        codigos = [d["codigo_interno"] for d in lote]
+        ids = self.db.execute(
+            select(Insumo.id_insumo).where(Insumo.optica_id == self.optica_id, Insumo.codigo_interno.in_(codigos))
+        ).scalars().all()
+        indexar(self.db.connection(), "insumo", ids)
+        registrar_escritura(self.db, "insumo", self.optica_id, ids)
+        self.db.commit()
+
+    def importar(self, filas: Iterable[Fila]) -> dict:
+        for nro, valores in filas:
+            self.agregar(nro, valores)
+        self.confirmar_lote()
+        return {
+            "leidas": self.leidas,
+            "nuevas": self.nuevas,
+            "modificadas": self.modificadas,
+            "sin_cambios": self.sin_cambios,
+            "con_error": self.cantidad_errores,
+            "errores": self.errores,
+        }
+
+
+if __name__ == "__main__":
+    # python -m app.services.importacion clientes optica_id archivo.csv|archivo.ndjson
+    # python -m app.services.importacion catalogo optica_id archivo.csv|archivo.ndjson [id_proveedor]
+    from app.database import sesion_optica
+    from app.routers.clientes import ClienteImportIn
+
+    if len(sys.argv) < 4 or sys.argv[1] not in ("clientes", "catalogo"):
+        sys.exit("Uso: python -m app.services.importacion clientes|catalogo optica_id archivo [id_proveedor]")
+
+    tipo, optica_id, ruta = sys.argv[1], sys.argv[2], sys.argv[3]
+    db = sesion_optica(optica_id)
+    try:
+        with open(ruta, encoding="utf-8-sig", newline="") as archivo:
+            if tipo == "clientes":
+                importador = ImportadorClientes(db, optica_id, ClienteImportIn)
+            else:
+                id_proveedor = int(sys.argv[4]) if len(sys.argv) > 4 else None
+                importador = ImportadorCatalogo(db, optica_id, id_proveedor)
+            reporte = importador.importar(leer_filas(archivo, formato_desde_nombre(ruta)))
+    finally:
+        db.close()
+    print(json.dumps(reporte, ensure_ascii=False, indent=2, default=str))
@@ -0,0 +1,145 @@
+import logging
+import os
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# INSTRUMENTACIÓN SQL POR REQUEST
+#
+# Los eventos del engine (before/after_cursor_execute) cuentan, para el request
+# en curso, cuántas sentencias se ejecutaron, cuánto tiempo se pasó en la base y
+# cuántas filas se leyeron/afectaron. El request se identifica con un ContextVar
+# que fija el middleware: el threadpool de los handlers sync copia el contexto,
+# así que las consultas hechas desde ahí se cargan al mismo request.
+#
+# Al terminar, el middleware:
+#   - agrega el header Server-Timing (db, app) para verlo en las devtools;
+#   - marca N+1: la misma sentencia repetida muchas veces con otros parámetros;
+#   - loguea los requests que se pasan del presupuesto de consultas o de tiempo.
+#
+# Config (variables de entorno):
+#   OPTICA_INSTRUMENTACION=false      apaga todo (no registra los eventos)
+#   OPTICA_PRESUPUESTO_CONSULTAS=30   más consultas que esto -> warning
+#   OPTICA_PRESUPUESTO_MS=500         más ms de request que esto -> warning
+#   OPTICA_UMBRAL_N1=5                repeticiones de una misma sentencia para marcar N+1
+
+logger = logging.getLogger(__name__)
+
+INSTRUMENTACION = os.getenv("OPTICA_INSTRUMENTACION", "true").lower() in ("1", "true", "si", "yes")
+PRESUPUESTO_CONSULTAS = int(os.getenv("OPTICA_PRESUPUESTO_CONSULTAS", "30"))
+PRESUPUESTO_MS = float(os.getenv("OPTICA_PRESUPUESTO_MS", "500"))
+UMBRAL_N1 = int(os.getenv("OPTICA_UMBRAL_N1", "5"))
+
+
+class MedicionRequest:
+    """Acumulado de SQL de un request."""
+
+    __slots__ = ("inicio", "consultas", "tiempo_db", "filas", "sentencias")
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tiempo_db = 0.0
+        self.filas = 0
+        self.sentencias: Counter = Counter()
+
+    def repetidas(self, umbral: int = UMBRAL_N1) -> List[Tuple[str, int]]:
+        """Sentencias ejecutadas al menos `umbral` veces (sospechosas de N+1)."""
+        return [(s, n) for s, n in self.sentencias.most_common() if n >= umbral]
+
+
+_medicion: ContextVar[Optional[MedicionRequest]] = ContextVar("medicion_sql", default=None)
+
+
+def medicion_actual() -> Optional[MedicionRequest]:
+    return _medicion.get()
+
+
+# ------------------- Eventos del engine -------------------
+
+def _antes(conn, cursor, statement, parameters, context, executemany):
+    if _medicion.get() is not None:
+        context._inicio_medicion = time.perf_counter()
+
+
+def _despues(conn, cursor, statement, parameters, context, executemany):
+    medicion = _medicion.get()
+    inicio = getattr(context, "_inicio_medicion", None)
+    if medicion is None or inicio is None:
+        return
+    medicion.consultas += 1
+    medicion.tiempo_db += time.perf_counter() - inicio
+    medicion.sentencias[statement] += 1
+    if cursor.rowcount and cursor.rowcount > 0:
+        medicion.filas += cursor.rowcount
+
+
+def instalar(engine: Engine) -> None:
+    """Registra los eventos de medición en el engine (sync; para async pasar .sync_engine)."""
+    if not INSTRUMENTACION or event.contains(engine, "after_cursor_execute", _despues):
+        return
+    event.listen(engine, "before_cursor_execute", _antes)
+    event.listen(engine, "after_cursor_execute", _despues)
+
+
+# ------------------- Middleware -------------------
+
+def _resumen(statement: str, largo: int = 160) -> str:
+    return " ".join(statement.split())[:largo]
+
+
+class MedicionSQLMiddleware:
+    """
+    Middleware ASGI: abre una MedicionRequest por request HTTP, agrega
+    Server-Timing a la respuesta y loguea N+1 / presupuestos excedidos.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not INSTRUMENTACION:
+            await self.app(scope, receive, send)
+            return
+
+        medicion = MedicionRequest()
+        token = _medicion.set(medicion)
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                total_ms = (time.perf_counter() - medicion.inicio) * 1000
+                db_ms = medicion.tiempo_db * 1000
+                valor = (
+                    f'db;dur={db_ms:.1f};desc="{medicion.consultas} consultas", '
+                    f"app;dur={total_ms:.1f}"
+                )
+                if medicion.repetidas():
+                    valor += ', n1;desc="sentencias repetidas"'
+                mensaje["headers"] = list(mensaje.get("headers", [])) + [(b"server-timing", valor.encode("latin-1"))]
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _medicion.reset(token)
+            self._revisar(scope, medicion)
+
+    @staticmethod
+    def _revisar(scope, medicion: MedicionRequest) -> None:
+        total_ms = (time.perf_counter() - medicion.inicio) * 1000
+        ruta = getattr(scope.get("route"), "path", scope.get("path"))
+        destino = f'{scope.get("method")} {ruta}'
+
+        for statement, veces in medicion.repetidas():
+            logger.warning("Posible N+1 en %s: %s veces -> %s", destino, veces, _resumen(statement))
+
+        if medicion.consultas > PRESUPUESTO_CONSULTAS or total_ms > PRESUPUESTO_MS:
+            logger.warning(
+                "Request fuera de presupuesto: %s | %s consultas (máx %s), %.1f ms db, %.1f ms total (máx %.0f), %s filas",
+                destino, medicion.consultas, PRESUPUESTO_CONSULTAS,
+                medicion.tiempo_db * 1000, total_ms, PRESUPUESTO_MS, medicion.filas,
+            )
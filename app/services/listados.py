@@ -0,0 +1,279 @@
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import asc, desc, select
+from sqlalchemy.sql import Select
+
+from app.models import Cliente, Insumo, Proveedor
+from app.services.busqueda import subconsulta_busqueda
+from app.services.conteo import contar_total, contar_total_async
+from app.services.paginacion import Clave, cerrar_pagina, claves_orden, paginar
+from app.services.proyeccion import a_dicts, columnas
+
+# CONSULTAS DE LOS LISTADOS CON VERSIÓN SYNC Y ASYNC
+#
+# Los GET que también existen en app/routers/lectura_async.py (listados avanzados,
+# stock bajo y detalle) arman su consulta acá, como Select: filtros, whitelist de
+# orden, proyección y claves de paginación en un solo lugar. Los handlers solo la
+# ejecutan: los sync con ejecutar() y los async con ejecutar_async(), que hacen lo
+# mismo (validaciones, total, página) con Session o AsyncSession.
+
+# columnas que devuelven los listados (se piden solo estas, sin cargar entidades)
+CAMPOS_CLIENTES = ("id_cliente", "nombre", "apellido", "dni", "telefono", "email", "activo", "fecha_alta")
+CAMPOS_INSUMOS = (
+    "id_insumo", "descripcion", "tipo_insumo", "id_proveedor", "codigo_proveedor", "codigo_interno",
+    "precio_costo", "precio_sugerido", "stock_minimo", "stock_actual", "activo",
+)
+CAMPOS_STOCK_BAJO = (
+    "id_insumo", "descripcion", "tipo_insumo", "id_proveedor", "codigo_interno",
+    "stock_minimo", "stock_actual", "activo",
+)
+
+PROVEEDOR_INEXISTENTE = "El proveedor indicado no existe en esta óptica."
+CLIENTE_NO_ENCONTRADO = "Cliente no encontrado"
+INSUMO_NO_ENCONTRADO = "Insumo no encontrado en esta óptica."
+
+
+class Listado:
+    """
+    Consulta de un listado paginado, lista para ejecutar.
+
+    - requisitos: (Select, detalle) que tienen que devolver alguna fila antes de
+      listar (p. ej. que el proveedor del filtro sea de la óptica); si no, 400.
+    - tablas / filtros: los de contar_total().
+    - con_offset: el listado acepta offset y total estimado (los avanzados); el de
+      stock bajo es solo por cursor y su respuesta no trae esas claves.
+    """
+
+    def __init__(
+        self,
+        consulta: Select,
+        claves: List[Clave],
+        firma: str,
+        campos: Sequence[str],
+        tablas: Sequence[str],
+        filtros: Dict[str, Any],
+        requisitos: Sequence[Tuple[Select, str]] = (),
+        con_offset: bool = True,
+    ):
+        self.consulta = consulta
+        self.claves = claves
+        self.firma = firma
+        self.campos = campos
+        self.tablas = tablas
+        self.filtros = filtros
+        self.requisitos = requisitos
+        self.con_offset = con_offset
+
+    def pagina(self, limit: int, offset: int, cursor: Optional[str]) -> Select:
+        return paginar(self.consulta, self.claves, limit, offset, cursor, self.firma)
+
+    def respuesta(self, pagina, limit: int, offset: int, total: Optional[int], es_estimado: bool) -> dict:
+        filas, next_cursor = cerrar_pagina(pagina, self.claves, limit, self.firma)
+        if not self.con_offset:
+            return {"total": total, "limit": limit, "next_cursor": next_cursor, "items": a_dicts(filas, self.campos)}
+        return {
+            "total": total,
+            "total_estimado": es_estimado,
+            "limit": limit,
+            "offset": offset,
+            "next_cursor": next_cursor,
+            "items": a_dicts(filas, self.campos),
+        }
+
+
+def ejecutar(
+    db,
+    listado: Listado,
+    optica_id: str,
+    limit: int,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    total_estimado: bool = False,
+) -> dict:
+    for consulta, detalle in listado.requisitos:
+        if db.execute(consulta).first() is None:
+            raise HTTPException(status_code=400, detail=detalle)
+    total, es_estimado = contar_total(
+        db, listado.consulta, optica_id, listado.tablas, listado.filtros, include_total, total_estimado
+    )
+    pagina = db.execute(listado.pagina(limit, offset, cursor)).all()
+    return listado.respuesta(pagina, limit, offset, total, es_estimado)
+
+
+async def ejecutar_async(
+    db,
+    listado: Listado,
+    optica_id: str,
+    limit: int,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    include_total: bool = True,
+    total_estimado: bool = False,
+) -> dict:
+    """Igual que ejecutar(), con AsyncSession (modo async)."""
+    for consulta, detalle in listado.requisitos:
+        if (await db.execute(consulta)).first() is None:
+            raise HTTPException(status_code=400, detail=detalle)
+    total, es_estimado = await contar_total_async(
+        db, listado.consulta, optica_id, listado.tablas, listado.filtros, include_total, total_estimado
+    )
+    pagina = (await db.execute(listado.pagina(limit, offset, cursor))).all()
+    return listado.respuesta(pagina, limit, offset, total, es_estimado)
+
+
+def _orden(columnas_validas: Dict[str, Any], order_by: str, detalle: str):
+    col = columnas_validas.get(order_by)
+    if col is None:
+        raise HTTPException(status_code=400, detail=detalle)
+    return col
+
+
+def _direccion(order_dir: str):
+    return asc if order_dir.lower() == "asc" else desc
+
+
+def proveedor_de_optica(optica_id: str, id_proveedor: int) -> Select:
+    return select(Proveedor.id_proveedor).where(
+        Proveedor.id_proveedor == id_proveedor, Proveedor.optica_id == optica_id
+    )
+
+
+# ------------------- Clientes -------------------
+
+def clientes_avanzado(
+    optica_id: str,
+    q: Optional[str],
+    dni: Optional[int],
+    activo: Optional[bool],
+    fecha_desde: Optional[date],
+    fecha_hasta: Optional[date],
+    order_by: str,
+    order_dir: str,
+) -> Listado:
+    consulta = select(*columnas(Cliente, CAMPOS_CLIENTES)).where(Cliente.optica_id == optica_id)
+
+    # Búsqueda libre (índice de búsqueda)
+    busqueda = subconsulta_busqueda(optica_id, "cliente", q) if q else None
+    if busqueda is not None:
+        consulta = consulta.join(busqueda, busqueda.c.id_entidad == Cliente.id_cliente)
+    if dni is not None:
+        consulta = consulta.where(Cliente.dni == dni)
+    if activo is not None:
+        consulta = consulta.where(Cliente.activo == activo)
+    if fecha_desde:
+        consulta = consulta.where(Cliente.fecha_alta >= fecha_desde)
+    if fecha_hasta:
+        consulta = consulta.where(Cliente.fecha_alta <= fecha_hasta)
+
+    # Orden seguro (whitelist)
+    columnas_validas = {
+        "nombre": Cliente.nombre,
+        "apellido": Cliente.apellido,
+        "dni": Cliente.dni,
+        "fecha_alta": Cliente.fecha_alta,
+        "id_cliente": Cliente.id_cliente,
+    }
+    if busqueda is not None:
+        columnas_validas["relevancia"] = busqueda.c.puntaje
+    col = _orden(
+        columnas_validas, order_by.lower(), f"order_by inválido. Opciones: {', '.join(columnas_validas.keys())}"
+    )
+
+    return Listado(
+        consulta,
+        claves_orden(col, _direccion(order_dir), [Cliente.apellido, Cliente.nombre, Cliente.id_cliente]),
+        f"{order_by.lower()}:{order_dir.lower()}",
+        CAMPOS_CLIENTES,
+        ("cliente",),
+        {"q": q, "dni": dni, "activo": activo, "fecha_desde": fecha_desde, "fecha_hasta": fecha_hasta},
+    )
+
+
+def cliente(optica_id: str, id_cliente: int) -> Select:
+    return select(Cliente).where(Cliente.id_cliente == id_cliente, Cliente.optica_id == optica_id)
+
+
+# ------------------- Insumos -------------------
+
+def insumos_avanzado(
+    optica_id: str,
+    q: Optional[str],
+    activo: Optional[bool],
+    proveedor_id: Optional[int],
+    tipo_insumo: Optional[str],
+    order_by: str,
+    order_dir: str,
+) -> Listado:
+    consulta = select(*columnas(Insumo, CAMPOS_INSUMOS)).where(Insumo.optica_id == optica_id)
+    requisitos = []
+
+    if activo is not None:
+        consulta = consulta.where(Insumo.activo == activo)
+
+    if proveedor_id is not None:
+        requisitos.append((proveedor_de_optica(optica_id, proveedor_id), PROVEEDOR_INEXISTENTE))
+        consulta = consulta.where(Insumo.id_proveedor == proveedor_id)
+
+    if tipo_insumo:
+        consulta = consulta.where(Insumo.tipo_insumo.ilike(f"%{tipo_insumo.strip()}%"))
+
+    busqueda = subconsulta_busqueda(optica_id, "insumo", q) if q else None
+    if busqueda is not None:
+        consulta = consulta.join(busqueda, busqueda.c.id_entidad == Insumo.id_insumo)
+
+    allowed_order = {
+        "descripcion": Insumo.descripcion,
+        "tipo_insumo": Insumo.tipo_insumo,
+        "stock_actual": Insumo.stock_actual,
+        "stock_minimo": Insumo.stock_minimo,
+        "precio_costo": Insumo.precio_costo,
+        "precio_sugerido": Insumo.precio_sugerido,
+        "id_insumo": Insumo.id_insumo,
+        "id_proveedor": Insumo.id_proveedor,
+    }
+    if busqueda is not None:
+        allowed_order["relevancia"] = busqueda.c.puntaje
+    col = _orden(allowed_order, order_by, f"order_by inválido. Permitidos: {list(allowed_order.keys())}")
+
+    return Listado(
+        consulta,
+        claves_orden(col, _direccion(order_dir), [Insumo.id_insumo]),
+        f"{order_by}:{order_dir.lower()}",
+        CAMPOS_INSUMOS,
+        ("insumo",),
+        {"q": q, "activo": activo, "proveedor_id": proveedor_id, "tipo_insumo": tipo_insumo},
+        requisitos,
+    )
+
+
+def insumos_stock_bajo(optica_id: str, activo: Optional[bool], proveedor_id: Optional[int]) -> Listado:
+    # solo las marcadas con stock_bajo, recorridas en orden desde ix_insumo_optica_stock_bajo
+    consulta = select(*columnas(Insumo, CAMPOS_STOCK_BAJO)).where(
+        Insumo.optica_id == optica_id,
+        Insumo.stock_bajo == True,
+    )
+    requisitos = []
+    if activo is not None:
+        consulta = consulta.where(Insumo.activo == activo)
+
+    if proveedor_id is not None:
+        requisitos.append((proveedor_de_optica(optica_id, proveedor_id), PROVEEDOR_INEXISTENTE))
+        consulta = consulta.where(Insumo.id_proveedor == proveedor_id)
+
+    return Listado(
+        consulta,
+        claves_orden(Insumo.descripcion, asc, [Insumo.id_insumo]),
+        "stock_bajo",
+        CAMPOS_STOCK_BAJO,
+        ("insumo",),
+        {"stock_bajo": True, "activo": activo, "proveedor_id": proveedor_id},
+        requisitos,
+        con_offset=False,
+    )
+
+
+def insumo(optica_id: str, id_insumo: int) -> Select:
+    return select(Insumo).where(Insumo.id_insumo == id_insumo, Insumo.optica_id == optica_id)
@@ -0,0 +1,201 @@
+import bisect
+import os
+import time
+from typing import Dict, List, Tuple
+
+from app.services.instrumentacion import medicion_actual
+
+# MÉTRICAS EN FORMATO PROMETHEUS
+#
+# Contadores en memoria del proceso, actualizados por MetricasMiddleware. El
+# middleware corre en el event loop (un solo hilo), así que se actualizan con
+# operaciones simples sobre dicts, sin locks. /metrics también es async y lee
+# desde el mismo hilo.
+#
+# Series (ver render()):
+#   - requests por ruta/método/estado, histograma de latencia por ruta y por óptica
+#   - requests en curso
+#   - consultas y tiempo de base por ruta (de la instrumentación SQL)
+#   - requests por óptica
+#   - esperas del pool de conexiones (de PoolMedido), por engine: principal,
+#     réplica y cada shard
+#
+# La ruta es el template ("/clientes/{id_cliente}"), no el path real; lo que no
+# matchea ninguna ruta va como "sin_ruta". Para acotar la cardinalidad, a partir de
+# OPTICA_METRICAS_MAX_OPTICAS ópticas distintas el resto se agrupa en "otras".
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MAX_OPTICAS = int(os.getenv("OPTICA_METRICAS_MAX_OPTICAS", "1000"))
+
+
+class Histograma:
+    __slots__ = ("cuentas", "suma", "total")
+
+    def __init__(self):
+        self.cuentas = [0] * (len(BUCKETS) + 1)  # el último es +Inf
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float) -> None:
+        self.cuentas[bisect.bisect_left(BUCKETS, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+
+_requests: Dict[Tuple[str, str, str], int] = {}           # (metodo, ruta, estado)
+_latencias: Dict[Tuple[str, str], Histograma] = {}        # (metodo, ruta)
+_latencias_optica: Dict[str, Histograma] = {}             # optica_id
+_requests_optica: Dict[str, int] = {}                     # optica_id
+_db_consultas: Dict[Tuple[str, str], int] = {}            # (metodo, ruta)
+_db_segundos: Dict[Tuple[str, str], float] = {}           # (metodo, ruta)
+_en_curso = [0]
+
+
+def _optica_label(optica_id: str) -> str:
+    if optica_id in _requests_optica or len(_requests_optica) < MAX_OPTICAS:
+        return optica_id
+    return "otras"
+
+
+def registrar(metodo: str, ruta: str, estado: int, segundos: float, optica_id: str = None,
+              consultas: int = 0, segundos_db: float = 0.0) -> None:
+    clave = (metodo, ruta)
+    clave_estado = (metodo, ruta, str(estado))
+    _requests[clave_estado] = _requests.get(clave_estado, 0) + 1
+
+    hist = _latencias.get(clave)
+    if hist is None:
+        hist = _latencias[clave] = Histograma()
+    hist.observar(segundos)
+
+    _db_consultas[clave] = _db_consultas.get(clave, 0) + consultas
+    _db_segundos[clave] = _db_segundos.get(clave, 0.0) + segundos_db
+
+    if optica_id:
+        optica = _optica_label(optica_id)
+        _requests_optica[optica] = _requests_optica.get(optica, 0) + 1
+        hist = _latencias_optica.get(optica)
+        if hist is None:
+            hist = _latencias_optica[optica] = Histograma()
+        hist.observar(segundos)
+
+
+class MetricasMiddleware:
+    """Middleware ASGI que alimenta los contadores de este módulo."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        inicio = time.perf_counter()
+        estado = [500]
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado[0] = mensaje["status"]
+            await send(mensaje)
+
+        _en_curso[0] += 1
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _en_curso[0] -= 1
+            ruta = getattr(scope.get("route"), "path", "sin_ruta")
+            optica_id = None
+            for nombre, valor in scope.get("headers", []):
+                if nombre == b"x-optica-id":
+                    optica_id = valor.decode("latin-1").strip() or None
+                    break
+            medicion = medicion_actual()
+            registrar(
+                scope["method"], ruta, estado[0], time.perf_counter() - inicio, optica_id,
+                medicion.consultas if medicion else 0,
+                medicion.tiempo_db if medicion else 0.0,
+            )
+
+
+# ------------------- Exposición -------------------
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{k}="{_escapar(v)}"' for k, v in labels.items()) + "}"
+
+
+def _histograma(lineas: List[str], nombre: str, labels: dict, hist: Histograma) -> None:
+    acumulado = 0
+    for limite, cuenta in zip(BUCKETS, hist.cuentas):
+        acumulado += cuenta
+        lineas.append(f"{nombre}_bucket{_labels(**labels, le=repr(limite))} {acumulado}")
+    lineas.append(f'{nombre}_bucket{_labels(**labels, le="+Inf")} {hist.total}')
+    lineas.append(f"{nombre}_sum{_labels(**labels)} {hist.suma}")
+    lineas.append(f"{nombre}_count{_labels(**labels)} {hist.total}")
+
+
+def render(pools: Dict[str, dict] = None) -> str:
+    """Todas las series en formato de texto de Prometheus (0.0.4).
+
+    `pools` son las estadísticas de cada PoolMedido por nombre de engine
+    ("principal", "replica", y el nombre de cada shard); van con el label `engine`.
+    """
+    lineas: List[str] = []
+
+    lineas += ["# HELP optica_http_requests_total Requests HTTP atendidos.",
+               "# TYPE optica_http_requests_total counter"]
+    for (metodo, ruta, estado), n in sorted(_requests.items()):
+        lineas.append(f"optica_http_requests_total{_labels(metodo=metodo, ruta=ruta, estado=estado)} {n}")
+
+    lineas += ["# HELP optica_http_request_duration_seconds Latencia de los requests por ruta.",
+               "# TYPE optica_http_request_duration_seconds histogram"]
+    for (metodo, ruta), hist in sorted(_latencias.items()):
+        _histograma(lineas, "optica_http_request_duration_seconds", {"metodo": metodo, "ruta": ruta}, hist)
+
+    lineas += ["# HELP optica_http_requests_en_curso Requests que se están atendiendo.",
+               "# TYPE optica_http_requests_en_curso gauge",
+               f"optica_http_requests_en_curso {_en_curso[0]}"]
+
+    lineas += ["# HELP optica_db_consultas_total Sentencias SQL ejecutadas, por ruta.",
+               "# TYPE optica_db_consultas_total counter"]
+    for (metodo, ruta), n in sorted(_db_consultas.items()):
+        lineas.append(f"optica_db_consultas_total{_labels(metodo=metodo, ruta=ruta)} {n}")
+
+    lineas += ["# HELP optica_db_segundos_total Tiempo en la base de datos, por ruta.",
+               "# TYPE optica_db_segundos_total counter"]
+    for (metodo, ruta), s in sorted(_db_segundos.items()):
+        lineas.append(f"optica_db_segundos_total{_labels(metodo=metodo, ruta=ruta)} {s}")
+
+    lineas += ["# HELP optica_requests_por_optica_total Requests por óptica (X-Optica-Id).",
+               "# TYPE optica_requests_por_optica_total counter"]
+    for optica, n in sorted(_requests_optica.items()):
+        lineas.append(f"optica_requests_por_optica_total{_labels(optica_id=optica)} {n}")
+
+    lineas += ["# HELP optica_request_duration_por_optica_seconds Latencia de los requests por óptica.",
+               "# TYPE optica_request_duration_por_optica_seconds histogram"]
+    for optica, hist in sorted(_latencias_optica.items()):
+        _histograma(lineas, "optica_request_duration_por_optica_seconds", {"optica_id": optica}, hist)
+
+    series_pool = (
+        ("optica_db_pool_checkouts_total", "counter", "Conexiones pedidas al pool.",
+         lambda e: e["checkouts"]),
+        ("optica_db_pool_checkouts_con_espera_total", "counter",
+         "Checkouts que tuvieron que esperar (> 1 ms).", lambda e: e["checkouts_con_espera"]),
+        ("optica_db_pool_espera_segundos_total", "counter", "Tiempo total esperando conexión del pool.",
+         lambda e: e["espera_total_ms"] / 1000),
+        ("optica_db_pool_timeouts_total", "counter", "Checkouts que vencieron por pool_timeout.",
+         lambda e: e["timeouts"]),
+        ("optica_db_pool_conexiones_en_uso", "gauge", "Conexiones tomadas del pool.",
+         lambda e: e["checked_out"]),
+    )
+    if pools:
+        for nombre, tipo, ayuda, valor in series_pool:
+            lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} {tipo}"]
+            for motor, estadisticas in pools.items():
+                lineas.append(f"{nombre}{_labels(engine=motor)} {valor(estadisticas)}")
+
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,133 @@
+import sys
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import and_, delete, exists, func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from app.models import Insumo, MovimientoStock, StockCheckpoint
+
+# LIBRO DE MOVIMIENTOS DE STOCK
+#
+# movimiento_stock es append-only: cada compra, anulación, recepción o ajuste deja
+# una fila con la cantidad y el stock resultante (ver services/stock.py). La foto
+# actual sigue siendo Insumo.stock_actual, que se actualiza en la misma
+# transacción que el movimiento.
+#
+# Para que el libro no crezca sin límite, compactar() resume los movimientos
+# anteriores a una fecha de corte en un stock_checkpoint por insumo y los borra.
+# El stock a una fecha se resuelve así:
+#   1) último movimiento <= fecha -> su stock_resultante (una fila por índice);
+#   2) si no hay, último checkpoint <= fecha -> su stock;
+#   3) si no hay ninguno, el stock anterior al primer movimiento posterior, o el
+#      stock actual si el insumo nunca se movió.
+# Entre dos checkpoints la resolución es la de la compactación (cada corte).
+
+
+def stock_a_fecha(db: Session, optica_id: str, id_insumo: int, fecha: datetime) -> Optional[int]:
+    """Stock del insumo al momento indicado. None si esa fecha ya fue compactada sin checkpoint."""
+    mov = MovimientoStock
+    ultimo = db.execute(
+        select(mov.stock_resultante)
+        .where(mov.optica_id == optica_id, mov.id_insumo == id_insumo, mov.fecha <= fecha)
+        .order_by(mov.fecha.desc(), mov.id_movimiento.desc())
+        .limit(1)
+    ).scalar()
+    if ultimo is not None:
+        return ultimo
+
+    cp = StockCheckpoint
+    checkpoint = db.execute(
+        select(cp.stock)
+        .where(cp.optica_id == optica_id, cp.id_insumo == id_insumo, cp.fecha_corte <= fecha)
+        .order_by(cp.fecha_corte.desc())
+        .limit(1)
+    ).first()
+    if checkpoint is not None:
+        return checkpoint.stock
+    posterior = db.execute(
+        select(cp.fecha_corte).where(cp.optica_id == optica_id, cp.id_insumo == id_insumo).limit(1)
+    ).first()
+    if posterior is not None:
+        # todos los cortes son posteriores: lo anterior ya no está en el libro
+        return None
+
+    siguiente = db.execute(
+        select(mov.stock_resultante, mov.cantidad)
+        .where(mov.optica_id == optica_id, mov.id_insumo == id_insumo, mov.fecha > fecha)
+        .order_by(mov.fecha.asc(), mov.id_movimiento.asc())
+        .limit(1)
+    ).first()
+    if siguiente is not None:
+        return siguiente.stock_resultante - siguiente.cantidad
+
+    return db.execute(
+        select(func.coalesce(Insumo.stock_actual, 0)).where(
+            Insumo.optica_id == optica_id, Insumo.id_insumo == id_insumo
+        )
+    ).scalar()
+
+
+def compactar(db: Session, antes_de: datetime, optica_id: Optional[str] = None, lote: int = 5000) -> int:
+    """
+    Resume en checkpoints (fecha_corte = antes_de) los movimientos con fecha <= antes_de
+    y los borra en lotes. Devuelve la cantidad de movimientos borrados.
+
+    Se puede volver a correr con el mismo antes_de si se cortó a mitad de camino:
+    los insumos que ya tienen el checkpoint de ese corte no se vuelven a insertar
+    (sus movimientos pendientes terminan en el mismo stock) y se sigue borrando.
+    """
+    mov = MovimientoStock
+    filtro = [mov.fecha <= antes_de]
+    if optica_id:
+        filtro.append(mov.optica_id == optica_id)
+
+    ultimos = (
+        select(func.max(mov.id_movimiento).label("id_movimiento"))
+        .where(*filtro)
+        .group_by(mov.optica_id, mov.id_insumo)
+        .subquery()
+    )
+    cp = StockCheckpoint
+    ya_resumido = exists().where(
+        and_(cp.optica_id == mov.optica_id, cp.id_insumo == mov.id_insumo, cp.fecha_corte == antes_de)
+    )
+    db.execute(
+        insert(StockCheckpoint).from_select(
+            ["optica_id", "id_insumo", "fecha_corte", "stock", "id_ultimo_movimiento"],
+            select(mov.optica_id, mov.id_insumo, literal(antes_de), mov.stock_resultante, mov.id_movimiento)
+            .join(ultimos, ultimos.c.id_movimiento == mov.id_movimiento)
+            .where(~ya_resumido),
+        )
+    )
+    db.commit()
+
+    borrados = 0
+    while True:
+        ids = db.execute(
+            select(mov.id_movimiento).where(*filtro).order_by(mov.id_movimiento).limit(lote)
+        ).scalars().all()
+        if not ids:
+            break
+        db.execute(delete(mov).where(mov.id_movimiento.in_(ids)))
+        db.commit()
+        borrados += len(ids)
+    return borrados
+
+
+if __name__ == "__main__":
+    # python -m app.services.movimientos YYYY-MM-DD [optica_id]
+    from app.database import sesion_optica, shard_engines
+
+    if len(sys.argv) < 2:
+        sys.exit("Uso: python -m app.services.movimientos YYYY-MM-DD [optica_id]")
+
+    optica = sys.argv[2] if len(sys.argv) > 2 else None
+    n = 0
+    # una óptica: su shard; todas: cada shard
+    for db in [sesion_optica(optica)] if optica else [Session(bind=m) for m in shard_engines.values()]:
+        try:
+            n += compactar(db, datetime.fromisoformat(sys.argv[1]), optica)
+        finally:
+            db.close()
+    print(f"Movimientos compactados: {n}")
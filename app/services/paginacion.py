@@ -0,0 +1,149 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from typing import Any, List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, asc, false, or_
+
+# PAGINACIÓN POR CURSOR (KEYSET)
+#
+# En lugar de OFFSET, el cursor guarda los valores de las columnas de orden de la
+# última fila entregada. La página siguiente filtra "filas posteriores a ese
+# punto", así MySQL arranca desde el índice en vez de descartar N filas.
+#
+# Convención de NULLs: MySQL ordena NULL como el valor más chico (primero en ASC,
+# último en DESC). Las condiciones de abajo respetan eso.
+
+Clave = Tuple[Any, Any]  # (columna, asc|desc)
+
+# order_dir de los listados paginados (documentación de la API)
+ORDER_DIR_DESCRIPCION = (
+    "asc | desc. Vale para toda la clave de orden: los empates se resuelven con las "
+    "columnas de desempate (terminando en el id) en la misma dirección."
+)
+
+
+def _codificar_valor(v: Any) -> Any:
+    if isinstance(v, datetime):
+        return {"dt": v.isoformat()}
+    if isinstance(v, date):
+        return {"d": v.isoformat()}
+    return v
+
+
+def _decodificar_valor(v: Any) -> Any:
+    if isinstance(v, dict):
+        if "dt" in v:
+            return datetime.fromisoformat(v["dt"])
+        if "d" in v:
+            return date.fromisoformat(v["d"])
+    return v
+
+
+def codificar_cursor(firma: str, valores: Sequence[Any]) -> str:
+    payload = {"o": firma, "v": [_codificar_valor(v) for v in valores]}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str, firma: str, cantidad: int) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        valores = [_decodificar_valor(v) for v in payload["v"]]
+        firma_cursor = payload["o"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    if firma_cursor != firma or len(valores) != cantidad:
+        raise HTTPException(
+            status_code=400,
+            detail="El cursor no corresponde al orden solicitado (order_by/order_dir)",
+        )
+    return valores
+
+
+def _igual(col, v):
+    return col.is_(None) if v is None else col == v
+
+
+def _posterior(col, v, direccion):
+    if direccion is asc:
+        return col.isnot(None) if v is None else col > v
+    # desc: los NULL van al final
+    if v is None:
+        return false()
+    return or_(col < v, col.is_(None))
+
+
+def condicion_keyset(claves: Sequence[Clave], valores: Sequence[Any]):
+    """
+    Arma la condición lexicográfica "fila posterior a (valores)" para el orden dado:
+    k1 > v1 OR (k1 = v1 AND k2 > v2) OR ...
+    """
+    ramas = []
+    for i, (col, direccion) in enumerate(claves):
+        previas = [_igual(c, valores[j]) for j, (c, _) in enumerate(claves[:i])]
+        ramas.append(and_(*previas, _posterior(col, valores[i], direccion)))
+    return or_(*ramas)
+
+
+def claves_orden(col, direccion, desempate: Sequence[Any]) -> List[Clave]:
+    """
+    Orden completo para paginar: col y después los desempates (el último, el id),
+    todos en la misma dirección y sin repetir columnas. Así un único índice
+    (optica_id, col, desempates...) sirve para asc y desc sin filesort (MySQL lo
+    recorre hacia atrás). Si col ya es el id, no hace falta desempatar.
+
+    Antes los desempates tenían dirección fija (p. ej. id siempre desc, apellido y
+    nombre siempre asc): con order_dir=asc los empates ahora salen con el id
+    ascendente. Está documentado en order_dir (ORDER_DIR_DESCRIPCION).
+    """
+    if col is desempate[-1]:
+        return [(col, direccion)]
+    return [(col, direccion)] + [(c, direccion) for c in desempate if c is not col]
+
+
+def paginar(
+    query,
+    claves: Sequence[Clave],
+    limit: int,
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    firma: str = "",
+):
+    """
+    Aplica orden + paginación a una Query (o Select) y devuelve la query lista
+    para ejecutar. El resultado se pasa a cerrar_pagina().
+
+    - claves: lista (columna, asc|desc) que define el orden completo; la última
+      debe ser el id (desempate único).
+    - Con cursor se usa keyset y se ignora offset; sin cursor se mantiene el modo
+      offset de siempre.
+    - Cada fila trae la(s) columna(s) originales de la query y, al final, los
+      valores de las claves (se usan para armar el next_cursor).
+    """
+    query = query.add_columns(*[col for col, _ in claves])
+    query = query.order_by(*[direccion(col) for col, direccion in claves])
+
+    if cursor:
+        valores = decodificar_cursor(cursor, firma, len(claves))
+        query = query.filter(condicion_keyset(claves, valores))
+    elif offset:
+        query = query.offset(offset)
+
+    # se pide una fila de más para saber si hay página siguiente
+    return query.limit(limit + 1)
+
+
+def cerrar_pagina(filas, claves: Sequence[Clave], limit: int, firma: str = ""):
+    """Recorta la fila extra y devuelve (filas, next_cursor)."""
+    filas = list(filas)
+    next_cursor = None
+    if len(filas) > limit:
+        filas = filas[:limit]
+        ultima = filas[-1]
+        next_cursor = codificar_cursor(firma, list(ultima[-len(claves):]))
+    return filas, next_cursor
@@ -0,0 +1,41 @@
+from typing import Any, Dict, Iterable, List, Sequence
+
+from sqlalchemy import func, select
+
+# PROYECCIÓN DE COLUMNAS PARA LOS LISTADOS
+#
+# Los listados devuelven dicts de 6 a 12 campos planos. Cargar entidades ORM
+# enteras para eso paga la hidratación de cada fila (identity map, estado,
+# columnas que no se muestran) y, con joinedload + LIMIT, además obliga a envolver
+# el SELECT en una subconsulta. Acá los listados piden solo las columnas que
+# devuelven: cada fila llega como tupla y se arma el dict directo.
+#
+# - columnas(): las columnas del modelo para una lista de campos.
+# - a_dicts(): tuplas -> dicts. Ignora las columnas de más al final de cada fila
+#   (las claves de orden que agrega paginar()).
+# - cantidad_detalles(): COUNT(*) de los detalles de cada fila como subconsulta
+#   escalar correlacionada (resuelve con el índice de la FK, sin traer detalles).
+
+
+def columnas(modelo, campos: Iterable[str]) -> List[Any]:
+    return [getattr(modelo, c) for c in campos]
+
+
+def campos_tabla(modelo) -> List[str]:
+    """Todos los campos de la tabla (para los listados que devuelven la fila completa)."""
+    return [c.key for c in modelo.__table__.columns]
+
+
+def a_dicts(filas: Iterable[Sequence[Any]], campos: Sequence[str]) -> List[Dict[str, Any]]:
+    return [dict(zip(campos, fila)) for fila in filas]
+
+
+def cantidad_detalles(fk_detalle, pk_padre):
+    """COUNT(*) de detalle por fila padre (fk_detalle = pk_padre), correlacionado con el padre."""
+    return (
+        select(func.count())
+        .select_from(fk_detalle.class_)
+        .where(fk_detalle == pk_padre)
+        .correlate(pk_padre.class_)
+        .scalar_subquery()
+    )
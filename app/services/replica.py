@@ -0,0 +1,117 @@
+import logging
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+from app.services.escrituras import Escrituras, suscribir
+
+# LECTURAS DESDE LA RÉPLICA: CUÁNDO NO USARLA
+#
+# Con MYSQL_REPLICA_HOST configurado, los GET leen de la réplica (get_read_db en
+# database.py). La réplica va un poco atrasada, así que:
+#
+# - leer lo propio: cuando una óptica confirma una escritura, sus lecturas van a
+#   la primaria durante OPTICA_DB_REPLICA_PIN_SEGUNDOS (así el listado que se
+#   recarga después de guardar ya muestra el cambio).
+# - atraso medido (opcional): con OPTICA_DB_REPLICA_LAG_MAX, cada
+#   OPTICA_DB_REPLICA_CHEQUEO_SEGUNDOS se consulta SHOW REPLICA STATUS; si el atraso
+#   supera el máximo (o no se puede medir: replicación cortada, sin permisos) todas
+#   las lecturas van a la primaria hasta el próximo chequeo bueno.
+#
+# Igual que los cachés de conteo, el pin es por proceso: con varios workers, una
+# escritura hecha en otro worker no fija la óptica en este. Para eso conviene que
+# el balanceador mande cada óptica siempre al mismo worker.
+
+logger = logging.getLogger(__name__)
+
+PIN_SEGUNDOS = float(os.getenv("OPTICA_DB_REPLICA_PIN_SEGUNDOS", "5"))
+_lag_max = os.getenv("OPTICA_DB_REPLICA_LAG_MAX", "")
+LAG_MAX: Optional[float] = float(_lag_max) if _lag_max else None
+CHEQUEO_SEGUNDOS = float(os.getenv("OPTICA_DB_REPLICA_CHEQUEO_SEGUNDOS", "2"))
+
+_lock = threading.Lock()
+_fijadas: Dict[str, float] = {}  # optica_id -> hasta cuándo (monotonic) lee de la primaria
+_lag = {"ok": True, "segundos": None, "proximo": 0.0}
+
+
+@suscribir
+def _fijar(escrituras: Escrituras) -> None:
+    hasta = time.monotonic() + PIN_SEGUNDOS
+    with _lock:
+        for _, optica_id in escrituras:
+            _fijadas[optica_id] = hasta
+
+
+def fijada(optica_id: Optional[str]) -> bool:
+    """True si la óptica escribió hace menos de PIN_SEGUNDOS (tiene que leer de la primaria)."""
+    if not optica_id:
+        return False
+    ahora = time.monotonic()
+    with _lock:
+        hasta = _fijadas.get(optica_id)
+        if hasta is None:
+            return False
+        if hasta > ahora:
+            return True
+        del _fijadas[optica_id]
+        return False
+
+
+def _medir_lag(replica: Engine) -> Optional[float]:
+    with replica.connect() as conn:
+        try:
+            fila = conn.execute(text("SHOW REPLICA STATUS")).mappings().first()
+            columna = "Seconds_Behind_Source"
+        except Exception:
+            # MySQL < 8.0.22
+            fila = conn.execute(text("SHOW SLAVE STATUS")).mappings().first()
+            columna = "Seconds_Behind_Master"
+    if fila is None or fila.get(columna) is None:
+        return None
+    return float(fila[columna])
+
+
+def replica_al_dia(replica: Engine) -> bool:
+    """False si el atraso medido supera LAG_MAX (o no se puede medir). Sin LAG_MAX, siempre True."""
+    if LAG_MAX is None:
+        return True
+
+    ahora = time.monotonic()
+    with _lock:
+        if ahora < _lag["proximo"]:
+            return _lag["ok"]
+        # un solo hilo mide; el resto usa el último resultado mientras tanto
+        _lag["proximo"] = ahora + CHEQUEO_SEGUNDOS
+
+    try:
+        segundos = _medir_lag(replica)
+    except Exception:
+        # se avisa una vez, en el cambio de estado de abajo
+        logger.debug("No se pudo medir el atraso de la réplica", exc_info=True)
+        segundos = None
+
+    ok = segundos is not None and segundos <= LAG_MAX
+    with _lock:
+        if ok != _lag["ok"]:
+            logger.warning(
+                "Réplica %s (atraso: %s s, máximo %s s)",
+                "al día: vuelven las lecturas" if ok else "atrasada: lecturas a la primaria",
+                segundos, LAG_MAX,
+            )
+        _lag.update(ok=ok, segundos=segundos)
+    return ok
+
+
+def estado() -> dict:
+    with _lock:
+        return {
+            "pin_segundos": PIN_SEGUNDOS,
+            "opticas_fijadas": sum(1 for hasta in _fijadas.values() if hasta > time.monotonic()),
+            "lag_max": LAG_MAX,
+            "lag_segundos": _lag["segundos"],
+            "al_dia": _lag["ok"],
+        }
@@ -0,0 +1,173 @@
+import math
+from datetime import date, timedelta
+from statistics import NormalDist
+from typing import Dict, List, Optional
+
+import numpy as np
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from app.models import DetallePedidoLaboratorioInsumo, Insumo, PedidoLaboratorio, Proveedor
+from app.services.tablero import ESTADOS_CERRADOS
+
+# SUGERENCIA DE COMPRA (PUNTO DE PEDIDO)
+#
+# El consumo de un insumo son las cantidades de los pedidos al laboratorio ya
+# recibidos (la recepción es la que descuenta el stock), por fecha_recepcion. Se
+# trae agrupado por (insumo, día) y se arma una matriz insumos x días con NumPy;
+# todo lo demás se calcula en bloque, sin loops por insumo:
+#
+#   demanda diaria   d = promedio de las sumas móviles de VENTANA días / VENTANA
+#   variabilidad     s = desvío de esas sumas / raíz(VENTANA)
+#   entrega          L = dias_entrega (parámetro, igual para todos los proveedores)
+#   punto de pedido  PP = max(d*L + z*s*raíz(L), stock_minimo)
+#   posición         stock_actual - lo comprometido en pedidos abiertos
+#   a pedir          si posición <= PP: PP + d*dias_cobertura - posición (redondeado arriba)
+#
+# L no se saca de la historia: las compras tienen una sola fecha (no hay pedido
+# vs. llegada) y el envío -> recepción de los pedidos al laboratorio mide cuánto
+# tarda el laboratorio en hacer un trabajo, no cuánto tarda en llegar una compra
+# al proveedor del insumo, aunque los dos estén en la tabla proveedor.
+#
+# z sale del nivel de servicio pedido (0.95 -> 1.64). Los insumos inactivos no se
+# sugieren. El resultado va agrupado por proveedor del insumo.
+
+VENTANA = 7
+
+
+def sugerir(
+    db: Session,
+    optica_id: str,
+    hoy: date,
+    dias_historia: int = 90,
+    dias_cobertura: int = 30,
+    dias_entrega: int = 7,
+    nivel_servicio: float = 0.95,
+    id_proveedor: Optional[int] = None,
+    incluir_todos: bool = False,
+) -> dict:
+    desde = hoy - timedelta(days=dias_historia)
+    conn = db.connection()  # filas planas, sin pasar por el ORM
+
+    # --- insumos activos: posición actual ---
+    consulta = (
+        select(
+            Insumo.id_insumo, Insumo.descripcion, Insumo.codigo_proveedor, Insumo.id_proveedor,
+            Insumo.stock_actual, Insumo.stock_minimo, Insumo.precio_costo,
+        )
+        .where(Insumo.optica_id == optica_id, Insumo.activo == True)
+        .order_by(Insumo.id_insumo)
+    )
+    if id_proveedor is not None:
+        consulta = consulta.where(Insumo.id_proveedor == id_proveedor)
+    insumos = conn.execute(consulta).all()
+
+    parametros = {
+        "desde": desde, "hasta": hoy, "dias_cobertura": dias_cobertura,
+        "dias_entrega": dias_entrega, "nivel_servicio": nivel_servicio,
+    }
+    if not insumos:
+        return {"parametros": parametros, "proveedores": []}
+
+    n = len(insumos)
+    ids = np.fromiter((f.id_insumo for f in insumos), dtype=np.int64, count=n)
+    stock = np.fromiter((f.stock_actual or 0 for f in insumos), dtype=np.float64, count=n)
+    minimo = np.fromiter((f.stock_minimo or 0 for f in insumos), dtype=np.float64, count=n)
+
+    # --- consumo por (insumo, día) del período -> matriz n x dias_historia ---
+    p, det = PedidoLaboratorio, DetallePedidoLaboratorioInsumo
+    consumos = conn.execute(
+        select(det.id_insumo, p.fecha_recepcion, func.sum(det.cantidad))
+        .join(p, p.id_pedido_lab == det.id_pedido_lab)
+        .where(
+            det.optica_id == optica_id,
+            p.optica_id == optica_id,
+            p.fecha_recepcion >= desde,
+            p.fecha_recepcion < hoy,
+        )
+        .group_by(det.id_insumo, p.fecha_recepcion)
+    ).all()
+
+    demanda = np.zeros((n, dias_historia), dtype=np.float64)
+    if consumos:
+        c_ids = np.fromiter((f[0] for f in consumos), dtype=np.int64, count=len(consumos))
+        c_dias = np.fromiter(((f[1] - desde).days for f in consumos), dtype=np.int64, count=len(consumos))
+        c_cant = np.fromiter((f[2] for f in consumos), dtype=np.float64, count=len(consumos))
+        fila = np.searchsorted(ids, c_ids)
+        # descarta insumos que no están en la lista (inactivos, de otro proveedor)
+        validos = (fila < n) & (ids[np.minimum(fila, n - 1)] == c_ids)
+        np.add.at(demanda, (fila[validos], c_dias[validos]), c_cant[validos])
+
+    # sumas móviles de VENTANA días (con acumulada: una resta por columna)
+    ventana = min(VENTANA, dias_historia)
+    acumulada = np.concatenate([np.zeros((n, 1)), np.cumsum(demanda, axis=1)], axis=1)
+    moviles = acumulada[:, ventana:] - acumulada[:, :-ventana]
+    diaria = moviles.mean(axis=1) / ventana
+    desvio = moviles.std(axis=1) / math.sqrt(ventana)
+
+    # --- comprometido: insumos de pedidos abiertos (se descuentan al recibirlos) ---
+    comprometido = np.zeros(n, dtype=np.float64)
+    abiertos = conn.execute(
+        select(det.id_insumo, func.sum(det.cantidad))
+        .join(p, p.id_pedido_lab == det.id_pedido_lab)
+        .where(
+            det.optica_id == optica_id,
+            p.optica_id == optica_id,
+            p.fecha_recepcion.is_(None),
+            or_(p.estado.is_(None), p.estado.notin_(ESTADOS_CERRADOS)),
+        )
+        .group_by(det.id_insumo)
+    ).all()
+    if abiertos:
+        a_ids = np.fromiter((f[0] for f in abiertos), dtype=np.int64, count=len(abiertos))
+        a_cant = np.fromiter((f[1] for f in abiertos), dtype=np.float64, count=len(abiertos))
+        fila = np.searchsorted(ids, a_ids)
+        validos = (fila < n) & (ids[np.minimum(fila, n - 1)] == a_ids)
+        np.add.at(comprometido, fila[validos], a_cant[validos])
+
+    # --- punto de pedido y cantidad ---
+    entrega = np.full(n, float(dias_entrega))
+
+    z = NormalDist().inv_cdf(nivel_servicio)
+    punto_pedido = np.maximum(diaria * entrega + z * desvio * np.sqrt(entrega), minimo)
+    posicion_stock = stock - comprometido
+    objetivo = punto_pedido + diaria * dias_cobertura
+    a_pedir = np.where(posicion_stock <= punto_pedido, np.ceil(np.maximum(objetivo - posicion_stock, 0)), 0)
+
+    elegidos = np.arange(n) if incluir_todos else np.flatnonzero(a_pedir > 0)
+
+    # --- salida agrupada por proveedor ---
+    nombres = dict(
+        conn.execute(select(Proveedor.id_proveedor, Proveedor.nombre).where(Proveedor.optica_id == optica_id)).all()
+    )
+    grupos: Dict[int, dict] = {}
+    for i in elegidos.tolist():
+        f = insumos[i]
+        grupo = grupos.setdefault(f.id_proveedor, {
+            "id_proveedor": f.id_proveedor,
+            "nombre": nombres.get(f.id_proveedor),
+            "dias_entrega": round(float(entrega[i]), 1),
+            "items": [],
+            "total_estimado": 0.0,
+        })
+        cantidad = int(a_pedir[i])
+        subtotal = round(cantidad * f.precio_costo, 2) if f.precio_costo is not None else None
+        grupo["items"].append({
+            "id_insumo": f.id_insumo,
+            "descripcion": f.descripcion,
+            "codigo_proveedor": f.codigo_proveedor,
+            "stock_actual": f.stock_actual,
+            "stock_minimo": f.stock_minimo,
+            "comprometido": int(comprometido[i]),
+            "demanda_diaria": round(float(diaria[i]), 3),
+            "punto_pedido": round(float(punto_pedido[i]), 1),
+            "cantidad_sugerida": cantidad,
+            "precio_costo": f.precio_costo,
+            "subtotal_estimado": subtotal,
+        })
+        grupo["total_estimado"] = round(grupo["total_estimado"] + (subtotal or 0), 2)
+
+    proveedores: List[dict] = sorted(
+        grupos.values(), key=lambda g: (g["id_proveedor"] is None, g["nombre"] or "", g["id_proveedor"] or 0)
+    )
+    return {"parametros": parametros, "proveedores": proveedores}
@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+# SHARDS: EN QUÉ BASE ESTÁN LOS DATOS DE CADA ÓPTICA
+#
+# OPTICA_SHARDS="b=10.0.0.12,c=10.0.0.13:3307" agrega bases además de la
+# principal (mismo usuario, clave y nombre de base; cada una con su pool, ver
+# database.py). El directorio (tabla optica_shard, en la principal) dice en qué
+# shard está cada óptica; las que no figuran están en la principal. Sin
+# OPTICA_SHARDS no se consulta nada: todo va a la principal.
+#
+# El directorio se cachea por proceso DIRECTORIO_TTL segundos. Mientras una óptica
+# se está moviendo (app/migraciones/mover_optica.py) figura "bloqueada": los GET
+# siguen leyendo del shard de origen y las escrituras reciben 503. El caché solo
+# adelanta el rechazo: lo que garantiza que no se pierda nada es el chequeo de
+# cada commit contra la fila del directorio (ver database.py), que la herramienta
+# espera a que termine antes de la copia final.
+#
+# Los ids son autoincrementales por base: para poder mover ópticas, los shards
+# tienen que generar ids que no choquen (auto_increment_increment igual en todos y
+# auto_increment_offset distinto). mover_optica lo verifica igual antes de copiar.
+
+PRINCIPAL = "principal"
+DIRECTORIO_TTL = float(os.getenv("OPTICA_SHARDS_TTL", "2"))
+
+
+def _leer_config(valor: str) -> Dict[str, str]:
+    hosts = {}
+    for parte in valor.split(","):
+        if not parte.strip():
+            continue
+        nombre, _, host = parte.partition("=")
+        nombre, host = nombre.strip(), host.strip()
+        if not nombre or not host or nombre == PRINCIPAL:
+            raise ValueError(f"OPTICA_SHARDS inválido: {parte!r} (formato: nombre=host[:puerto],...)")
+        hosts[nombre] = host
+    return hosts
+
+
+HOSTS = _leer_config(os.getenv("OPTICA_SHARDS", ""))  # shards además de la principal: nombre -> host
+
+_lock = threading.Lock()
+_directorio: Dict[str, Tuple[str, bool, float]] = {}  # optica_id -> (shard, bloqueada, vence)
+
+
+class OpticaEnMudanza(Exception):
+    """La óptica se está moviendo (o ya se movió) de shard: la escritura no se confirma."""
+
+
+def leer_directorio(conn, optica_id: str, compartido: bool = False) -> Tuple[str, bool]:
+    """
+    (shard, bloqueada) de la óptica según la tabla, sin caché. Con compartido=True
+    deja la fila tomada en modo compartido hasta que termine la transacción de conn.
+    """
+    sql = "SELECT shard, bloqueada FROM optica_shard WHERE optica_id = :optica_id"
+    if compartido and conn.dialect.name == "mysql":
+        sql += " LOCK IN SHARE MODE"
+    fila = conn.execute(text(sql), {"optica_id": optica_id}).first()
+    if fila is None:
+        return PRINCIPAL, False
+    return fila[0], bool(fila[1])
+
+
+def ubicar(principal: Engine, optica_id: Optional[str]) -> Tuple[str, bool]:
+    """(shard, bloqueada) de la óptica, con el caché del directorio."""
+    if not HOSTS or not optica_id:
+        return PRINCIPAL, False
+
+    ahora = time.monotonic()
+    with _lock:
+        hit = _directorio.get(optica_id)
+    if hit and hit[2] > ahora:
+        return hit[0], hit[1]
+
+    with principal.connect() as conn:
+        shard, bloqueada = leer_directorio(conn, optica_id)
+    with _lock:
+        _directorio[optica_id] = (shard, bloqueada, ahora + DIRECTORIO_TTL)
+    return shard, bloqueada
+
+
+def invalidar(optica_id: str) -> None:
+    with _lock:
+        _directorio.pop(optica_id, None)
@@ -0,0 +1,166 @@
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import and_, case, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app.models import Insumo, MovimientoStock
+from app.schemas.enums import TipoMovimientoStock
+from app.services import tablero
+from app.services.escrituras import registrar_escritura
+
+# MOVIMIENTOS DE STOCK
+#
+# Único punto por donde pasan compras, anulaciones y recepciones. En vez de
+# leer-modificar-escribir en Python (que pierde actualizaciones con requests
+# concurrentes), se hace:
+#   1) SELECT ... FOR UPDATE de los insumos, siempre en orden de id: dos
+#      transacciones que tocan los mismos insumos los bloquean en el mismo orden
+#      y no pueden quedar en deadlock;
+#   2) un único UPDATE set-based: stock_actual = stock_actual + delta, con la
+#      guarda "stock_actual + delta >= 0" en el WHERE;
+#   3) un único INSERT multi-fila en movimiento_stock con el motivo y el stock
+#      resultante de cada insumo, en la misma transacción.
+#
+# STOCK BAJO
+#
+# Insumo.stock_bajo marca stock_actual <= stock_minimo, para que los listados de
+# stock bajo lean solo las marcadas desde su índice. Se recalcula donde cambia
+# alguno de los dos: aquí (en el mismo UPDATE del stock), en el alta y la edición
+# del insumo y en la importación del catálogo (stock_minimo).
+
+
+def bajo_minimo(stock_actual: Optional[int], stock_minimo: Optional[int]) -> bool:
+    return stock_actual is not None and stock_minimo is not None and stock_actual <= stock_minimo
+
+
+def marca_stock_bajo(stock_actual, stock_minimo):
+    """La regla de bajo_minimo() en SQL, como valor para stock_bajo."""
+    return case(
+        (and_(stock_actual.isnot(None), stock_minimo.isnot(None), stock_actual <= stock_minimo), True),
+        else_=False,
+    )
+
+
+def sumar_deltas(pares: Iterable[Tuple[int, int]]) -> Dict[int, int]:
+    """Agrupa (id_insumo, cantidad) por insumo (un insumo puede repetirse)."""
+    deltas: Dict[int, int] = {}
+    for id_insumo, cantidad in pares:
+        deltas[id_insumo] = deltas.get(id_insumo, 0) + cantidad
+    return deltas
+
+
+def registrar_movimientos(db: Session, movimientos: List[dict]) -> None:
+    """Agrega movimientos al libro (un INSERT multi-fila). Cada dict ya trae stock_resultante."""
+    if not movimientos:
+        return
+    ahora = datetime.utcnow()
+    for mov in movimientos:
+        mov.setdefault("fecha", ahora)
+        mov["tipo"] = TipoMovimientoStock(mov["tipo"]).value
+    db.execute(insert(MovimientoStock), movimientos)
+
+
+def aplicar_deltas(
+    db: Session,
+    optica_id: str,
+    deltas: Dict[int, int],
+    tipo: TipoMovimientoStock,
+    id_origen: Optional[int] = None,
+    observaciones: Optional[str] = None,
+    motivo: str = "Stock insuficiente",
+    bloqueadas: Optional[Iterable[Insumo]] = None,
+) -> Dict[int, int]:
+    """
+    Suma los deltas al stock de los insumos de la óptica, dentro de la transacción
+    del request, y deja un movimiento por insumo en el libro. Devuelve el stock
+    resultante por insumo.
+
+    Si algún insumo no existe en la óptica o quedaría con stock negativo, no se
+    aplica nada y se informa la lista completa en un 400.
+
+    bloqueadas: los insumos si el llamador ya los trajo FOR UPDATE en esta
+    transacción (cargar_insumos_optica(bloquear=True)); así no se leen dos veces.
+    """
+    deltas = {i: d for i, d in deltas.items() if d}
+    if not deltas:
+        return {}
+    ids = sorted(deltas)
+
+    if bloqueadas is not None:
+        bloqueadas = sorted((f for f in bloqueadas if f.id_insumo in deltas), key=lambda f: f.id_insumo)
+    else:
+        bloqueadas = db.execute(
+            select(Insumo.id_insumo, Insumo.descripcion, Insumo.stock_actual, Insumo.stock_minimo, Insumo.activo, Insumo.stock_bajo)
+            .where(Insumo.optica_id == optica_id, Insumo.id_insumo.in_(ids))
+            .order_by(Insumo.id_insumo)
+            .with_for_update()
+        ).all()
+    actuales = {f.id_insumo: (f.descripcion, f.stock_actual or 0) for f in bloqueadas}
+    # (activo, stock_minimo, stock_bajo) antes del UPDATE, para el contador del tablero
+    marcas = {f.id_insumo: (bool(f.activo), f.stock_minimo, bool(f.stock_bajo)) for f in bloqueadas}
+
+    faltantes = [i for i in ids if i not in actuales]
+    if faltantes:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Insumos inexistentes o fuera de esta óptica: {', '.join(map(str, faltantes))}",
+        )
+
+    rechazados = [
+        f"insumo id={i} ({actuales[i][0]}) stock={actuales[i][1]}, requiere={-deltas[i]}"
+        for i in ids
+        if actuales[i][1] + deltas[i] < 0
+    ]
+    if rechazados:
+        raise HTTPException(status_code=400, detail=f"{motivo}: {'; '.join(rechazados)}")
+
+    delta = case(deltas, value=Insumo.id_insumo, else_=0)
+    nuevo_stock = func.coalesce(Insumo.stock_actual, 0) + delta
+
+    resultado = db.execute(
+        update(Insumo)
+        .where(Insumo.optica_id == optica_id, Insumo.id_insumo.in_(ids), nuevo_stock >= 0)
+        .values(
+            stock_actual=nuevo_stock,
+            stock_bajo=marca_stock_bajo(nuevo_stock, Insumo.stock_minimo),
+            version=Insumo.version + 1,
+        )
+        .execution_options(synchronize_session=False)
+    )
+    if resultado.rowcount != len(ids):
+        # no debería pasar con las filas bloqueadas; si pasa, que no se confirme nada
+        raise HTTPException(status_code=409, detail="Conflicto actualizando stock, reintente la operación")
+
+    # los objetos ya cargados en la sesión tienen el stock viejo
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, Insumo) and obj.id_insumo in deltas:
+            db.expire(obj, ["stock_actual", "stock_bajo", "version"])
+
+    registrar_escritura(db, "insumo", optica_id, ids)
+
+    resultantes = {i: actuales[i][1] + deltas[i] for i in ids}
+
+    # insumos que entran o salen de stock bajo (contador del tablero)
+    cruces = sum(
+        activo * (bajo_minimo(resultantes[i], minimo) - bajo)
+        for i, (activo, minimo, bajo) in marcas.items()
+    )
+    tablero.sumar(db, optica_id, {"stock_bajo": cruces})
+    registrar_movimientos(
+        db,
+        [
+            {
+                "optica_id": optica_id,
+                "id_insumo": i,
+                "tipo": tipo,
+                "cantidad": deltas[i],
+                "stock_resultante": resultantes[i],
+                "id_origen": id_origen,
+                "observaciones": observaciones,
+            }
+            for i in ids
+        ],
+    )
+    return resultantes
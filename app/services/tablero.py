@@ -0,0 +1,348 @@
+import sys
+from datetime import date
+from typing import Dict, List, Optional
+
+from sqlalchemy import delete, event, func, insert, or_, select, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session
+
+from app.models import Cliente, CompraInsumos, Insumo, PedidoLaboratorio, Receta, TableroOptica
+
+# TABLERO: CONTADORES POR ÓPTICA MANTENIDOS EN CADA ESCRITURA
+#
+# /dashboard lee unas pocas filas de tablero_optica (clave -> valor por óptica) en
+# vez de contar pedidos, compras, insumos, clientes y recetas. Las claves:
+#
+#   pedidos:<ESTADO>        pedidos por estado
+#   vence:<AAAA-MM-DD>      pedidos abiertos por fecha estimada de recepción
+#   vencidos                pedidos abiertos con fecha estimada anterior a
+#   vencidos_hasta          esta fecha (guardada como date.toordinal())
+#   compras:<AAAA-MM>       monto de las compras no anuladas del mes
+#   compras_cantidad:<AAAA-MM>
+#   recetas:<AAAA-MM>       recetas por mes de fecha_receta
+#   clientes_activos
+#   stock_bajo              insumos activos marcados con stock_bajo
+#
+# Las claves por mes hacen que "del mes" no necesite ningún proceso al cambiar el
+# día: se elige qué fila leer. Los vencidos son "vencidos" más las filas vence:
+# entre vencidos_hasta y ayer; plegar_vencidos() (una vez por día, ver abajo) las
+# suma a "vencidos", las borra y corre vencidos_hasta a hoy, así la lectura es
+# siempre de unas pocas filas y no crece con la historia. Una escritura sobre un
+# pedido cuya fecha ya se plegó suma directo en "vencidos" (_aplicar lo resuelve
+# con vencidos_hasta bloqueada, igual que el plegado: no se cruzan).
+#
+# Cada escritura calcula el aporte de la fila antes y después del cambio
+# (de_pedido(), de_compra(), ...) y suma la diferencia con sumar()/cambio(). Las
+# sumas se juntan en la sesión y se aplican todas juntas al confirmar, en la
+# misma transacción y en orden de clave: los contadores quedan bloqueados lo
+# mínimo y dos transacciones no pueden bloquearlos en distinto orden. Si hay
+# rollback, no se aplica nada.
+#
+# Para armar los contadores de datos que ya existían (o para reconciliarlos):
+#   python -m app.services.tablero [optica_id]
+# Recalcula desde las tablas; conviene correrlo con la óptica quieta.
+#
+# Plegado diario de los vencidos (cron, después de medianoche; si un día no
+# corre, la lectura suma las filas de los días que faltan):
+#   python -m app.services.tablero --vencidos [optica_id]
+
+Deltas = Dict[str, float]
+
+VENCIDOS = "vencidos"
+VENCIDOS_HASTA = "vencidos_hasta"
+
+ESTADOS_CERRADOS = ("RECIBIDO", "CANCELADO")
+
+
+# ------------------- Aportes de cada fila -------------------
+
+def _mes(fecha: date) -> str:
+    return fecha.strftime("%Y-%m")
+
+
+def pedido_abierto(estado: Optional[str], fecha_recepcion: Optional[date]) -> bool:
+    return fecha_recepcion is None and estado not in ESTADOS_CERRADOS
+
+
+def de_pedido(pedido) -> Deltas:
+    aporte = {f"pedidos:{pedido.estado or 'SIN_ESTADO'}": 1}
+    if pedido_abierto(pedido.estado, pedido.fecha_recepcion) and pedido.fecha_estimada_rec is not None:
+        aporte[f"vence:{pedido.fecha_estimada_rec.isoformat()}"] = 1
+    return aporte
+
+
+def de_compra(compra) -> Deltas:
+    if compra.anulada:
+        return {}
+    mes = _mes(compra.fecha_compra)
+    return {f"compras:{mes}": compra.monto_total or 0.0, f"compras_cantidad:{mes}": 1}
+
+
+def de_receta(receta) -> Deltas:
+    return {f"recetas:{_mes(receta.fecha_receta)}": 1}
+
+
+def de_cliente(cliente) -> Deltas:
+    return {"clientes_activos": 1} if cliente.activo else {}
+
+
+def de_insumo(insumo) -> Deltas:
+    return {"stock_bajo": 1} if insumo.activo and insumo.stock_bajo else {}
+
+
+# ------------------- Escritura -------------------
+
+def sumar(db: Session, optica_id: str, deltas: Deltas, signo: int = 1) -> None:
+    """Suma los deltas a los contadores de la óptica al confirmar la transacción actual."""
+    pendientes: Dict[tuple, float] = db.info.setdefault("tablero", {})
+    for clave, delta in deltas.items():
+        pendientes[(optica_id, clave)] = pendientes.get((optica_id, clave), 0) + signo * delta
+
+
+def cambio(db: Session, optica_id: str, antes: Deltas, despues: Deltas) -> None:
+    sumar(db, optica_id, antes, -1)
+    sumar(db, optica_id, despues)
+
+
+def _hasta(db: Session, optica_id: str, bloquear: bool = False) -> Optional[date]:
+    """Fecha hasta la que los vence:<fecha> ya están plegados en "vencidos" (None: nunca se plegó)."""
+    tabla = TableroOptica.__table__
+    consulta = select(tabla.c.valor).where(tabla.c.optica_id == optica_id, tabla.c.clave == VENCIDOS_HASTA)
+    if bloquear:
+        consulta = consulta.with_for_update()
+    valor = db.execute(consulta).scalar()
+    return date.fromordinal(int(valor)) if valor else None
+
+
+def _a_vencidos(db: Session, pendientes: Dict[tuple, float]) -> Dict[tuple, float]:
+    """Pasa a "vencidos" los deltas de vence:<fecha> ya plegadas (deja vencidos_hasta bloqueada)."""
+    hasta = {
+        optica_id: _hasta(db, optica_id, bloquear=True)
+        for optica_id in sorted({o for o, clave in pendientes if clave.startswith("vence:")})
+    }
+    resultado: Dict[tuple, float] = {}
+    for (optica_id, clave), delta in pendientes.items():
+        limite = hasta.get(optica_id)
+        if limite is not None and clave.startswith("vence:") and clave < f"vence:{limite.isoformat()}":
+            clave = VENCIDOS
+        resultado[(optica_id, clave)] = resultado.get((optica_id, clave), 0) + delta
+    return resultado
+
+
+def _sumar_clave(db: Session, optica_id: str, clave: str, delta: float) -> None:
+    tabla = TableroOptica.__table__
+    if db.get_bind().dialect.name == "mysql":
+        stmt = mysql_insert(tabla).values(optica_id=optica_id, clave=clave, valor=delta)
+        db.execute(stmt.on_duplicate_key_update(valor=tabla.c.valor + stmt.inserted.valor))
+        return
+    # otros motores: UPDATE y, si la clave no existía, INSERT
+    resultado = db.execute(
+        update(tabla)
+        .where(tabla.c.optica_id == optica_id, tabla.c.clave == clave)
+        .values(valor=tabla.c.valor + delta)
+    )
+    if resultado.rowcount == 0:
+        db.execute(insert(tabla).values(optica_id=optica_id, clave=clave, valor=delta))
+
+
+def _aplicar(db: Session, pendientes: Dict[tuple, float]) -> None:
+    for (optica_id, clave), delta in sorted(_a_vencidos(db, pendientes).items()):
+        if abs(delta) < 1e-9:
+            continue
+        _sumar_clave(db, optica_id, clave, delta)
+
+
+def plegar_vencidos(db: Session, optica_id: str, hoy: date) -> int:
+    """
+    Suma a "vencidos" las filas vence:<fecha> anteriores a hoy, las borra y deja
+    vencidos_hasta = hoy. Devuelve cuántas filas plegó. El llamador confirma.
+    """
+    tabla = TableroOptica.__table__
+    hasta = _hasta(db, optica_id, bloquear=True)
+    if hasta is not None and hasta >= hoy:
+        return 0
+    en_rango = (
+        (tabla.c.optica_id == optica_id)
+        & (tabla.c.clave >= f"vence:{hasta.isoformat() if hasta else ''}")
+        & (tabla.c.clave < f"vence:{hoy.isoformat()}")
+    )
+    filas = db.execute(select(tabla.c.clave, tabla.c.valor).where(en_rango).with_for_update()).all()
+    total = sum(valor for _, valor in filas)
+    if filas:
+        db.execute(delete(tabla).where(en_rango))
+    if abs(total) >= 1e-9:
+        _sumar_clave(db, optica_id, VENCIDOS, total)
+    _sumar_clave(db, optica_id, VENCIDOS_HASTA, hoy.toordinal() - (hasta.toordinal() if hasta else 0))
+    return len(filas)
+
+
+@event.listens_for(Session, "before_commit")
+def _antes_de_commit(session):
+    pendientes = session.info.pop("tablero", None)
+    if pendientes:
+        _aplicar(session, pendientes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _despues_de_rollback(session):
+    session.info.pop("tablero", None)
+
+
+# ------------------- Lectura -------------------
+
+def leer(db: Session, optica_id: str, hoy: date) -> dict:
+    tabla = TableroOptica.__table__
+    mes = _mes(hoy)
+    fijas = [
+        "clientes_activos", "stock_bajo", f"compras:{mes}", f"compras_cantidad:{mes}", f"recetas:{mes}",
+        VENCIDOS, VENCIDOS_HASTA,
+    ]
+    filas = db.execute(
+        select(tabla.c.clave, tabla.c.valor).where(
+            tabla.c.optica_id == optica_id,
+            or_(tabla.c.clave.in_(fijas), tabla.c.clave.like("pedidos:%")),
+        )
+    ).all()
+    hasta = next((date.fromordinal(int(valor)) for clave, valor in filas if clave == VENCIDOS_HASTA and valor), None)
+    # vence:<fecha> todavía sin plegar: de vencidos_hasta a ayer (las fechas ISO se ordenan como texto);
+    # con el plegado diario es a lo sumo una fila
+    filas += db.execute(
+        select(tabla.c.clave, tabla.c.valor).where(
+            tabla.c.optica_id == optica_id,
+            tabla.c.clave >= f"vence:{hasta.isoformat() if hasta else ''}",
+            tabla.c.clave < f"vence:{hoy.isoformat()}",
+        )
+    ).all()
+
+    valores: Dict[str, float] = {}
+    por_estado: Dict[str, int] = {}
+    vencidos = 0
+    for clave, valor in filas:
+        if clave.startswith("pedidos:"):
+            if round(valor):
+                por_estado[clave.split(":", 1)[1]] = int(round(valor))
+        elif clave.startswith("vence:") or clave == VENCIDOS:
+            vencidos += int(round(valor))
+        else:
+            valores[clave] = valor
+
+    return {
+        "fecha": hoy,
+        "pedidos_por_estado": dict(sorted(por_estado.items())),
+        "pedidos_abiertos_vencidos": vencidos,
+        "compras_mes": {
+            "mes": mes,
+            "cantidad": int(round(valores.get(f"compras_cantidad:{mes}", 0))),
+            "monto_total": round(valores.get(f"compras:{mes}", 0.0), 2),
+        },
+        "recetas_mes": int(round(valores.get(f"recetas:{mes}", 0))),
+        "clientes_activos": int(round(valores.get("clientes_activos", 0))),
+        "insumos_stock_bajo": int(round(valores.get("stock_bajo", 0))),
+    }
+
+
+# ------------------- Recalcular desde las tablas -------------------
+
+def _calcular(db: Session, optica_id: str) -> Deltas:
+    contadores: Deltas = {}
+
+    def agregar(clave: str, valor) -> None:
+        contadores[clave] = contadores.get(clave, 0) + (valor or 0)
+
+    p = PedidoLaboratorio
+    for estado, cantidad in db.execute(
+        select(p.estado, func.count()).where(p.optica_id == optica_id).group_by(p.estado)
+    ):
+        agregar(f"pedidos:{estado or 'SIN_ESTADO'}", cantidad)
+    for fecha, cantidad in db.execute(
+        select(p.fecha_estimada_rec, func.count())
+        .where(
+            p.optica_id == optica_id,
+            p.fecha_recepcion.is_(None),
+            or_(p.estado.is_(None), p.estado.notin_(ESTADOS_CERRADOS)),
+            p.fecha_estimada_rec.isnot(None),
+        )
+        .group_by(p.fecha_estimada_rec)
+    ):
+        agregar(f"vence:{fecha.isoformat()}", cantidad)
+
+    c = CompraInsumos
+    for fecha, monto, cantidad in db.execute(
+        select(c.fecha_compra, func.sum(c.monto_total), func.count())
+        .where(c.optica_id == optica_id, c.anulada == False)
+        .group_by(c.fecha_compra)
+    ):
+        agregar(f"compras:{_mes(fecha)}", monto)
+        agregar(f"compras_cantidad:{_mes(fecha)}", cantidad)
+
+    for fecha, cantidad in db.execute(
+        select(Receta.fecha_receta, func.count()).where(Receta.optica_id == optica_id).group_by(Receta.fecha_receta)
+    ):
+        agregar(f"recetas:{_mes(fecha)}", cantidad)
+
+    agregar("clientes_activos", db.execute(
+        select(func.count()).select_from(Cliente).where(Cliente.optica_id == optica_id, Cliente.activo == True)
+    ).scalar())
+
+    i = Insumo
+    agregar("stock_bajo", db.execute(
+        select(func.count()).select_from(i).where(i.optica_id == optica_id, i.stock_bajo == True, i.activo == True)
+    ).scalar())
+
+    return {k: v for k, v in contadores.items() if v}
+
+
+def recalcular(db: Session, optica_id: Optional[str] = None, hoy: Optional[date] = None) -> int:
+    """Reemplaza los contadores de la óptica (o de todas) por los calculados desde las tablas (ya plegados)."""
+    if optica_id is None:
+        opticas = set()
+        for modelo in (Cliente, Insumo, Receta, CompraInsumos, PedidoLaboratorio):
+            opticas.update(db.execute(select(modelo.optica_id).distinct()).scalars())
+        opticas.update(db.execute(select(TableroOptica.optica_id).distinct()).scalars())
+    else:
+        opticas = {optica_id}
+
+    for optica in sorted(opticas):
+        contadores = _calcular(db, optica)
+        db.execute(delete(TableroOptica).where(TableroOptica.optica_id == optica))
+        if contadores:
+            db.execute(
+                insert(TableroOptica),
+                [{"optica_id": optica, "clave": k, "valor": v} for k, v in sorted(contadores.items())],
+            )
+        plegar_vencidos(db, optica, hoy or date.today())
+        db.commit()
+    return len(opticas)
+
+
+def _opticas_del_tablero(db: Session) -> List[str]:
+    return sorted(db.execute(select(TableroOptica.optica_id).distinct()).scalars())
+
+
+def plegar_todas(db: Session, optica_id: Optional[str] = None, hoy: Optional[date] = None) -> int:
+    """plegar_vencidos() de la óptica (o de todas las del tablero), un commit por óptica."""
+    plegadas = 0
+    for optica in [optica_id] if optica_id else _opticas_del_tablero(db):
+        plegadas += plegar_vencidos(db, optica, hoy or date.today())
+        db.commit()
+    return plegadas
+
+
+if __name__ == "__main__":
+    # python -m app.services.tablero [--vencidos] [optica_id]
+    from app.database import sesion_optica, shard_engines
+
+    argumentos = [a for a in sys.argv[1:] if not a.startswith("--")]
+    optica = argumentos[0] if argumentos else None
+    solo_vencidos = "--vencidos" in sys.argv
+    total = 0
+    # una óptica: su shard; todas: cada shard
+    for sesion in [sesion_optica(optica)] if optica else [Session(bind=m) for m in shard_engines.values()]:
+        try:
+            total += plegar_todas(sesion, optica) if solo_vencidos else recalcular(sesion, optica)
+        finally:
+            sesion.close()
+    if solo_vencidos:
+        print(f"Vencidos plegados ({total} filas vence:).")
+    else:
+        print(f"Tablero recalculado ({total} ópticas).")
@@ -0,0 +1,276 @@
+import os
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models import Cliente, Insumo, Proveedor
+from app.services.busqueda import normalizar, tokenizar, tokenizar_campo
+from app.services.escrituras import Escrituras, suscribir
+
+# ÍNDICE EN MEMORIA PARA LOS /select (AUTOCOMPLETE)
+#
+# Por (entidad, óptica) se arma, la primera vez que se usa, un índice de prefijos:
+# una lista ordenada de (token, id) donde "per" se resuelve con bisect, sin ir a
+# MySQL. Las altas/cambios/bajas se enteran por el registro de escrituras: los ids
+# tocados quedan pendientes y se recargan (una sola query por IN) en el próximo
+# /select de esa óptica.
+#
+# Mientras se arma un índice, la clave ya figura en _pendientes (un set vacío):
+# lo que se confirme durante la carga queda anotado y, al guardar el índice, sigue
+# pendiente para el próximo /select (la carga pudo haberlo leído antes o después
+# del cambio). Si durante la carga se invalida todo (None), el índice armado se
+# usa para ese pedido pero no se guarda.
+#
+# Como vive en el proceso, cada worker tiene el suyo; se reconstruye igual cada
+# TYPEAHEAD_TTL segundos para tomar cambios hechos en otros workers.
+
+TYPEAHEAD_TTL = float(os.getenv("OPTICA_TYPEAHEAD_TTL", "600"))
+
+# si un prefijo matchea más ids que esto, conviene recorrer el orden y filtrar
+_RECORRER_DESDE = 2000
+
+
+# ------------------- Definición por entidad -------------------
+
+def _entrada_cliente(fila):
+    id_cliente, apellido, nombre, dni, activo = fila
+    return {
+        "tokens": set(tokenizar(apellido) + tokenizar(nombre) + tokenizar_campo(str(dni))),
+        "orden": (normalizar(apellido), normalizar(nombre), id_cliente),
+        "activo": bool(activo),
+        "item": {"id": id_cliente, "label": f"{apellido}, {nombre} (DNI {dni})", "dni": dni},
+    }
+
+
+def _entrada_insumo(fila):
+    id_insumo, descripcion, codigo_interno, codigo_proveedor, id_proveedor, stock_actual, precio_costo, activo = fila
+    return {
+        "tokens": set(
+            tokenizar(descripcion)
+            + tokenizar_campo(codigo_interno, es_codigo=True)
+            + tokenizar_campo(codigo_proveedor, es_codigo=True)
+        ),
+        "orden": (normalizar(descripcion), id_insumo),
+        "activo": bool(activo),
+        "id_proveedor": id_proveedor,
+        "item": {
+            "id": id_insumo,
+            "label": f"{descripcion} ({codigo_interno or '-'})",
+            "stock_actual": stock_actual,
+            "precio_costo": precio_costo,
+        },
+    }
+
+
+def _entrada_proveedor(fila):
+    id_proveedor, nombre, activo = fila
+    return {
+        "tokens": set(tokenizar(nombre)),
+        "orden": (normalizar(nombre), id_proveedor),
+        "activo": bool(activo),
+        "item": {"id": id_proveedor, "label": nombre},
+    }
+
+
+_ENTIDADES = {
+    "cliente": (
+        Cliente.id_cliente,
+        [Cliente.id_cliente, Cliente.apellido, Cliente.nombre, Cliente.dni, Cliente.activo],
+        _entrada_cliente,
+    ),
+    "insumo": (
+        Insumo.id_insumo,
+        [
+            Insumo.id_insumo, Insumo.descripcion, Insumo.codigo_interno, Insumo.codigo_proveedor,
+            Insumo.id_proveedor, Insumo.stock_actual, Insumo.precio_costo, Insumo.activo,
+        ],
+        _entrada_insumo,
+    ),
+    "proveedor": (
+        Proveedor.id_proveedor,
+        [Proveedor.id_proveedor, Proveedor.nombre, Proveedor.activo],
+        _entrada_proveedor,
+    ),
+}
+
+
+# ------------------- Índice -------------------
+
+class IndicePrefijos:
+    def __init__(self):
+        self.entradas: Dict[int, dict] = {}
+        self.tokens: List[Tuple[str, int]] = []
+        self.orden: List[tuple] = []
+        self.construido = time.monotonic()
+        self.lock = threading.Lock()
+
+    def cargar(self, entradas) -> None:
+        # carga inicial: ordenar una vez sale mucho más barato que insertar de a uno
+        for id_, entrada in entradas:
+            self.entradas[id_] = entrada
+        self.tokens = sorted((t, id_) for id_, e in self.entradas.items() for t in e["tokens"])
+        self.orden = sorted(e["orden"] for e in self.entradas.values())
+
+    def poner(self, id_: int, entrada: dict) -> None:
+        self.quitar(id_)
+        self.entradas[id_] = entrada
+        for t in entrada["tokens"]:
+            insort(self.tokens, (t, id_))
+        insort(self.orden, entrada["orden"])
+
+    def quitar(self, id_: int) -> None:
+        vieja = self.entradas.pop(id_, None)
+        if not vieja:
+            return
+        for t in vieja["tokens"]:
+            i = bisect_left(self.tokens, (t, id_))
+            if i < len(self.tokens) and self.tokens[i] == (t, id_):
+                del self.tokens[i]
+        i = bisect_left(self.orden, vieja["orden"])
+        if i < len(self.orden) and self.orden[i] == vieja["orden"]:
+            del self.orden[i]
+
+    def _con_prefijo(self, prefijo: str) -> Set[int]:
+        ids = set()
+        i = bisect_left(self.tokens, (prefijo,))
+        while i < len(self.tokens) and self.tokens[i][0].startswith(prefijo):
+            ids.add(self.tokens[i][1])
+            i += 1
+        return ids
+
+    def buscar(self, terminos: List[str], limit: int, filtro: Optional[Callable[[dict], bool]] = None) -> List[dict]:
+        candidatos: Optional[Set[int]] = None
+        for t in sorted(terminos, key=len, reverse=True):
+            ids = self._con_prefijo(t)
+            candidatos = ids if candidatos is None else candidatos & ids
+            if not candidatos:
+                return []
+
+        def sirve(id_):
+            e = self.entradas[id_]
+            return e["activo"] and (filtro is None or filtro(e))
+
+        resultado = []
+        if candidatos is None or len(candidatos) > _RECORRER_DESDE:
+            for clave in self.orden:
+                id_ = clave[-1]
+                if (candidatos is None or id_ in candidatos) and sirve(id_):
+                    resultado.append(self.entradas[id_]["item"])
+                    if len(resultado) >= limit:
+                        break
+        else:
+            for id_ in sorted(candidatos, key=lambda i: self.entradas[i]["orden"]):
+                if sirve(id_):
+                    resultado.append(self.entradas[id_]["item"])
+                    if len(resultado) >= limit:
+                        break
+        return resultado
+
+
+_lock = threading.Lock()
+_indices: Dict[Tuple[str, str], IndicePrefijos] = {}
+_pendientes: Dict[Tuple[str, str], Optional[Set[int]]] = {}  # ids a recargar; None = todo invalidado
+
+
+@suscribir
+def _marcar_pendientes(escrituras: Escrituras) -> None:
+    with _lock:
+        for (tabla, optica_id), ids in escrituras.items():
+            clave = (tabla, optica_id)
+            if clave not in _indices and clave not in _pendientes:
+                continue  # nadie lo tiene ni lo está armando
+            if ids is None:
+                _indices.pop(clave, None)
+                _pendientes[clave] = None
+            elif clave not in _pendientes:
+                _pendientes[clave] = set(ids)
+            elif _pendientes[clave] is not None:
+                _pendientes[clave].update(ids)
+
+
+def invalidar(entidad: str, optica_id: str) -> None:
+    with _lock:
+        _indices.pop((entidad, optica_id), None)
+        if (entidad, optica_id) in _pendientes:
+            _pendientes[(entidad, optica_id)] = None  # si se está armando, que no se guarde
+
+
+def _cargar(db: Session, entidad: str, optica_id: str, ids: Optional[Set[int]] = None):
+    pk, columnas, _ = _ENTIDADES[entidad]
+    consulta = select(*columnas).where(pk.class_.optica_id == optica_id)
+    if ids is not None:
+        consulta = consulta.where(pk.in_(ids))
+    return db.execute(consulta).all()
+
+
+def _indice(db: Session, entidad: str, optica_id: str) -> IndicePrefijos:
+    clave = (entidad, optica_id)
+    _, _, armar = _ENTIDADES[entidad]
+
+    with _lock:
+        indice = _indices.get(clave)
+        if indice and time.monotonic() - indice.construido > TYPEAHEAD_TTL:
+            indice = None
+        if indice:
+            pendientes = _pendientes.pop(clave, None)
+        elif _pendientes.get(clave) is None:
+            _pendientes[clave] = set()  # "armando": desde acá se anotan las escrituras
+
+    if indice is None:
+        indice = IndicePrefijos()
+        indice.cargar((fila[0], armar(fila)) for fila in _cargar(db, entidad, optica_id))
+        with _lock:
+            pendientes = _pendientes.pop(clave, None)
+            if pendientes is None:
+                return indice  # invalidado mientras se cargaba: sirve para este pedido, no se guarda
+            _indices[clave] = indice
+            if pendientes:
+                _pendientes[clave] = pendientes  # se recargan en el próximo pedido (otra transacción)
+        return indice
+
+    if pendientes:
+        filas = {fila[0]: fila for fila in _cargar(db, entidad, optica_id, pendientes)}
+        with indice.lock:
+            for id_ in pendientes:
+                if id_ in filas:
+                    indice.poner(id_, armar(filas[id_]))
+                else:
+                    indice.quitar(id_)
+    return indice
+
+
+def buscar(
+    db: Session,
+    entidad: str,
+    optica_id: str,
+    q: Optional[str],
+    limit: int,
+    filtro: Optional[Callable[[dict], bool]] = None,
+) -> List[dict]:
+    indice = _indice(db, entidad, optica_id)
+    terminos = list(dict.fromkeys(tokenizar(q)))
+    with indice.lock:
+        return indice.buscar(terminos, limit, filtro)
+
+
+def buscar_insumos(
+    db: Session, optica_id: str, q: Optional[str], limit: int, proveedor_id: Optional[int] = None
+) -> List[dict]:
+    """/insumos/select (sync y async): buscar() con el filtro opcional por proveedor de la óptica."""
+    filtro = None
+    if proveedor_id is not None:
+        if not existe(db, "proveedor", optica_id, proveedor_id):
+            raise HTTPException(status_code=400, detail="El proveedor indicado no existe en esta óptica.")
+        filtro = lambda e: e["id_proveedor"] == proveedor_id
+
+    return buscar(db, "insumo", optica_id, q, limit, filtro)
+
+
+def existe(db: Session, entidad: str, optica_id: str, id_: int) -> bool:
+    """True si el id existe en la óptica (activo o no), resuelto desde el índice."""
+    return id_ in _indice(db, entidad, optica_id).entradas
@@ -0,0 +1,110 @@
+"""
+Benchmark de throughput con clientes concurrentes (modo sync vs async).
+
+Levantar la API dos veces contra la misma base, una en cada modo:
+
+    uvicorn app.main:app --port 8000
+    OPTICA_DB_MODO=async uvicorn app.main:app --port 8001
+
+y correr:
+
+    python bench/carga_concurrente.py --optica o1 \\
+        --url sync=http://localhost:8000 --url async=http://localhost:8001
+
+Cada cliente hace requests en loop (rotando entre las rutas) durante --segundos.
+Informa requests/s, errores y latencias p50/p95/p99 por URL.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+RUTAS = [
+    "/clientes/select?q=per",
+    "/clientes/avanzado?limit=50&include_total=false",
+    "/insumos/select?q=len",
+    "/insumos/avanzado?limit=50",
+    "/proveedores/select",
+]
+
+
+async def _cliente(http: httpx.AsyncClient, rutas, hasta: float, latencias: list, errores: list, desfase: int):
+    i = desfase
+    while time.perf_counter() < hasta:
+        ruta = rutas[i % len(rutas)]
+        i += 1
+        inicio = time.perf_counter()
+        try:
+            r = await http.get(ruta)
+            if r.status_code >= 400:
+                errores.append(r.status_code)
+                continue
+        except httpx.HTTPError as exc:
+            errores.append(type(exc).__name__)
+            continue
+        latencias.append(time.perf_counter() - inicio)
+
+
+async def medir(url: str, optica: str, clientes: int, segundos: float, rutas) -> dict:
+    limites = httpx.Limits(max_connections=clientes, max_keepalive_connections=clientes)
+    async with httpx.AsyncClient(
+        base_url=url, headers={"X-Optica-Id": optica}, limits=limites, timeout=60
+    ) as http:
+        # calentamiento: arma índices en memoria y abre conexiones del pool
+        for ruta in rutas:
+            await http.get(ruta)
+
+        latencias: list = []
+        errores: list = []
+        inicio = time.perf_counter()
+        hasta = inicio + segundos
+        await asyncio.gather(
+            *[_cliente(http, rutas, hasta, latencias, errores, n) for n in range(clientes)]
+        )
+        duracion = time.perf_counter() - inicio
+
+    latencias.sort()
+
+    def pct(p):
+        return round(latencias[min(len(latencias) - 1, int(len(latencias) * p))] * 1000, 1) if latencias else None
+
+    return {
+        "requests": len(latencias),
+        "errores": len(errores),
+        "req_s": round(len(latencias) / duracion, 1),
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "media_ms": round(statistics.mean(latencias) * 1000, 1) if latencias else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", action="append", required=True, help="nombre=url (repetible)")
+    parser.add_argument("--optica", required=True, help="X-Optica-Id a usar")
+    parser.add_argument("--clientes", type=int, default=200)
+    parser.add_argument("--segundos", type=float, default=30)
+    parser.add_argument("--ruta", action="append", help="ruta a pedir (repetible; por defecto las de lectura)")
+    args = parser.parse_args()
+
+    rutas = args.ruta or RUTAS
+    resultados = {}
+    for item in args.url:
+        nombre, _, url = item.partition("=")
+        if not url:
+            nombre, url = item, item
+        print(f"-> {nombre}: {args.clientes} clientes durante {args.segundos:g}s contra {url}")
+        resultados[nombre] = asyncio.run(medir(url, args.optica, args.clientes, args.segundos, rutas))
+
+    columnas = ["requests", "errores", "req_s", "p50_ms", "p95_ms", "p99_ms", "media_ms"]
+    print()
+    print(f"{'':<10}" + "".join(f"{c:>10}" for c in columnas))
+    for nombre, res in resultados.items():
+        print(f"{nombre:<10}" + "".join(f"{str(res[c]):>10}" for c in columnas))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Runner de benchmarks: recorre los endpoints calientes de cada router y mide
+p50/p95/p99, throughput, consultas SQL por request y RSS pico; opcionalmente
+guarda los resultados como línea base o los compara contra una guardada.
+
+Primero generar datos (bench/generar_datos.py). Después, en proceso (la app se
+importa y se llama por ASGI, sin levantar el servidor):
+
+    python bench/correr.py --optica bench-01 --guardar bench/baseline.json
+    python bench/correr.py --optica bench-01 --comparar bench/baseline.json
+
+    # contra la SQLite generada en vez del MySQL de app/database.py
+    python bench/correr.py --db-url sqlite:///bench.db --optica bench-01
+
+o contra un servidor ya levantado (--url http://localhost:8000; ahí el RSS es el
+del propio runner, no el del servidor).
+
+Las consultas por request salen del header Server-Timing (instrumentación SQL).
+Los escenarios de escritura (crear compra/pedido, stock concurrente) agregan
+filas a la óptica: usar --solo-lectura para no tocar los datos.
+
+Con --comparar sale con código 1 si algún escenario empeoró su p95 más que
+--tolerancia o hace más consultas por request que en la línea base. La línea
+base conviene generarla en la misma máquina y con el mismo volumen de datos.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import resource
+import sys
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx  # noqa: E402
+
+_CONSULTAS = re.compile(r'db;dur=([\d.]+);desc="(\d+) consultas"')
+
+
+# ------------------- Escenarios -------------------
+# Cada escenario es (nombre, escritura, armar) y armar(rng, ids) devuelve
+# (método, ruta, json). ids tiene ids reales de la óptica (ver _cargar_ids).
+
+def _items(rng, ids, cantidad=3):
+    return [
+        {"id_insumo": i, "cantidad": rng.randint(1, 5), "precio_unitario": round(rng.uniform(100, 9000), 2)}
+        for i in rng.sample(ids["insumo"], min(cantidad, len(ids["insumo"])))
+    ]
+
+
+ESCENARIOS = [
+    ("clientes_avanzado", False, lambda r, ids: ("GET", "/clientes/avanzado?limit=50", None)),
+    ("clientes_avanzado_q", False, lambda r, ids: ("GET", "/clientes/avanzado?limit=50&q=gonz", None)),
+    ("clientes_avanzado_sin_total", False,
+     lambda r, ids: ("GET", "/clientes/avanzado?limit=50&include_total=false&order_by=fecha_alta&order_dir=desc", None)),
+    ("clientes_select", False, lambda r, ids: ("GET", "/clientes/select?q=mar", None)),
+    ("cliente_detalle", False, lambda r, ids: ("GET", f"/clientes/{r.choice(ids['cliente'])}", None)),
+    ("insumos_avanzado", False, lambda r, ids: ("GET", "/insumos/avanzado?limit=50", None)),
+    ("insumos_select", False, lambda r, ids: ("GET", "/insumos/select?q=len", None)),
+    ("insumos_stock_bajo", False, lambda r, ids: ("GET", "/insumos/?con_stock_bajo=true", None)),
+    ("insumos_stock_bajo_paginado", False, lambda r, ids: ("GET", "/insumos/stock-bajo?limit=50", None)),
+    ("insumo_detalle", False, lambda r, ids: ("GET", f"/insumos/{r.choice(ids['insumo'])}", None)),
+    ("recetas_avanzado", False, lambda r, ids: ("GET", "/recetas/avanzado?limit=50", None)),
+    ("receta_detalle", False, lambda r, ids: ("GET", f"/recetas/{r.choice(ids['receta'])}", None)),
+    ("compras_avanzado", False, lambda r, ids: ("GET", "/compras-insumos/avanzado?limit=50", None)),
+    ("compras_sugerencia", False, lambda r, ids: ("GET", "/compras-insumos/sugerencia", None)),
+    ("compra_detalle", False, lambda r, ids: ("GET", f"/compras-insumos/{r.choice(ids['compra'])}", None)),
+    ("pedidos_avanzado", False, lambda r, ids: ("GET", "/pedidos-laboratorio/avanzado?limit=50", None)),
+    ("pedido_detalle", False, lambda r, ids: ("GET", f"/pedidos-laboratorio/{r.choice(ids['pedido'])}", None)),
+    ("proveedores_avanzado", False, lambda r, ids: ("GET", "/proveedores/avanzado?limit=50", None)),
+    ("proveedores_select", False, lambda r, ids: ("GET", "/proveedores/select", None)),
+    ("compra_crear", True, lambda r, ids: ("POST", "/compras-insumos/", {
+        "id_proveedor": r.choice(ids["proveedor"]),
+        "fecha_compra": date.today().isoformat(),
+        "items": _items(r, ids),
+    })),
+    ("pedido_crear", True, lambda r, ids: ("POST", "/pedidos-laboratorio/", {
+        "id_receta": r.choice(ids["receta"]),
+        "id_proveedor": r.choice(ids["proveedor"]),
+        "fecha_envio": date.today().isoformat(),
+        "items": _items(r, ids, 2),
+    })),
+    # todas las compras sobre los mismos insumos: mide la contención del bloqueo de stock
+    ("stock_concurrente", True, lambda r, ids: ("POST", "/compras-insumos/", {
+        "id_proveedor": ids["proveedor"][0],
+        "fecha_compra": date.today().isoformat(),
+        "items": [{"id_insumo": i, "cantidad": 1, "precio_unitario": 100.0} for i in ids["insumo"][:3]],
+    })),
+]
+
+
+async def _cargar_ids(http: httpx.AsyncClient) -> dict:
+    ids = {}
+    for clave, ruta, campo in [
+        ("cliente", "/clientes/avanzado", "id_cliente"),
+        ("insumo", "/insumos/avanzado", "id_insumo"),
+        ("receta", "/recetas/avanzado", "id_receta"),
+        ("compra", "/compras-insumos/avanzado", "id_compra"),
+        ("pedido", "/pedidos-laboratorio/avanzado", "id_pedido_lab"),
+        ("proveedor", "/proveedores/avanzado?activo=true", "id_proveedor"),
+    ]:
+        separador = "&" if "?" in ruta else "?"
+        r = await http.get(f"{ruta}{separador}limit=200&include_total=false")
+        r.raise_for_status()
+        cuerpo = r.json()
+        # pedidos devuelve la página en "data"; el resto, en "items"
+        ids[clave] = sorted(item[campo] for item in cuerpo.get("items", cuerpo.get("data", [])))
+        if not ids[clave]:
+            sys.exit(f"La óptica no tiene datos de {clave}: generar con bench/generar_datos.py")
+    return ids
+
+
+# ------------------- Medición -------------------
+
+def _rss_pico_mb() -> float:
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _percentil(valores, p):
+    return round(valores[min(len(valores) - 1, int(len(valores) * p))] * 1000, 2) if valores else None
+
+
+async def medir(http, armar, ids, requests: int, concurrencia: int, semilla: int) -> dict:
+    rng = random.Random(semilla)
+    pedidos = [armar(rng, ids) for _ in range(requests)]
+    latencias, consultas, db_ms, errores = [], [], [], []
+    cola = iter(pedidos)
+
+    async def trabajador():
+        for metodo, ruta, cuerpo in cola:
+            inicio = time.perf_counter()
+            try:
+                r = await http.request(metodo, ruta, json=cuerpo)
+            except httpx.HTTPError as exc:
+                errores.append(type(exc).__name__)
+                continue
+            if r.status_code >= 400:
+                errores.append(r.status_code)
+                continue
+            latencias.append(time.perf_counter() - inicio)
+            m = _CONSULTAS.search(r.headers.get("server-timing", ""))
+            if m:
+                db_ms.append(float(m.group(1)))
+                consultas.append(int(m.group(2)))
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*[trabajador() for _ in range(concurrencia)])
+    duracion = time.perf_counter() - inicio
+    latencias.sort()
+
+    return {
+        "requests": len(latencias),
+        "errores": len(errores),
+        "req_s": round(len(latencias) / duracion, 1),
+        "p50_ms": _percentil(latencias, 0.50),
+        "p95_ms": _percentil(latencias, 0.95),
+        "p99_ms": _percentil(latencias, 0.99),
+        "consultas": round(sum(consultas) / len(consultas), 1) if consultas else None,
+        "db_ms": round(sum(db_ms) / len(db_ms), 2) if db_ms else None,
+        "rss_pico_mb": _rss_pico_mb(),
+    }
+
+
+def _cliente_en_proceso(db_url, optica: str) -> httpx.AsyncClient:
+    from app.main import app
+
+    if db_url:
+        from sqlalchemy import create_engine
+        from sqlalchemy.orm import sessionmaker
+
+        from app.database import get_db, get_read_db
+        from app.services import instrumentacion
+
+        engine = create_engine(db_url, connect_args={"check_same_thread": False} if db_url.startswith("sqlite") else {})
+        instrumentacion.instalar(engine)
+        Sesion = sessionmaker(bind=engine, autoflush=False, future=True)
+
+        def get_db_bench():
+            db = Sesion()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = get_db_bench
+        app.dependency_overrides[get_read_db] = get_db_bench
+
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://bench", headers={"X-Optica-Id": optica}, timeout=120
+    )
+
+
+async def correr(args) -> dict:
+    if args.url:
+        http = httpx.AsyncClient(base_url=args.url, headers={"X-Optica-Id": args.optica}, timeout=120)
+    else:
+        http = _cliente_en_proceso(args.db_url, args.optica)
+
+    resultados = {}
+    async with http:
+        ids = await _cargar_ids(http)
+        for n, (nombre, escritura, armar) in enumerate(ESCENARIOS):
+            if args.escenario and nombre not in args.escenario:
+                continue
+            if escritura and args.solo_lectura:
+                continue
+            concurrencia = args.concurrencia * 4 if nombre == "stock_concurrente" else args.concurrencia
+            # calentamiento: cachés en memoria, conexiones del pool
+            await medir(http, armar, ids, min(10, args.requests), 1, args.semilla + n)
+            resultados[nombre] = await medir(http, armar, ids, args.requests, concurrencia, args.semilla + n)
+            print(f"  {nombre:<30} {resultados[nombre]}", flush=True)
+    return resultados
+
+
+# ------------------- Reporte -------------------
+
+COLUMNAS = ["requests", "errores", "req_s", "p50_ms", "p95_ms", "p99_ms", "consultas", "db_ms", "rss_pico_mb"]
+
+
+def comparar(actual: dict, base: dict, tolerancia: float) -> int:
+    regresiones = 0
+    print(f"\n{'escenario':<30}{'p95 base':>10}{'p95':>10}{'Δ%':>8}{'consultas':>16}")
+    for nombre, res in actual.items():
+        ref = base.get(nombre)
+        if not ref:
+            print(f"{nombre:<30}{'-':>10}{res['p95_ms']:>10}{'nuevo':>8}")
+            continue
+        delta = (res["p95_ms"] / ref["p95_ms"] - 1) * 100 if ref["p95_ms"] else 0
+        mas_consultas = (res["consultas"] or 0) > (ref["consultas"] or 0)
+        marca = ""
+        if delta > tolerancia * 100 or mas_consultas:
+            marca = "  <-- REGRESIÓN"
+            regresiones += 1
+        print(
+            f"{nombre:<30}{ref['p95_ms']:>10}{res['p95_ms']:>10}{delta:>7.0f}%"
+            f"{str(ref['consultas']) + ' -> ' + str(res['consultas']):>16}{marca}"
+        )
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--optica", required=True, help="X-Optica-Id (una de las generadas)")
+    parser.add_argument("--url", help="servidor ya levantado; si no se indica, se corre en proceso")
+    parser.add_argument("--db-url", help="en proceso: URL SQLAlchemy a usar en vez de la de app/database.py")
+    parser.add_argument("--requests", type=int, default=200, help="requests por escenario")
+    parser.add_argument("--concurrencia", type=int, default=10)
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--escenario", action="append", help="correr solo estos (repetible)")
+    parser.add_argument("--solo-lectura", action="store_true")
+    parser.add_argument("--guardar", help="guardar los resultados como línea base (JSON)")
+    parser.add_argument("--comparar", help="comparar contra una línea base guardada")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="empeoramiento de p95 aceptado (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    print(f"-> {args.url or 'en proceso'} óptica={args.optica} requests={args.requests} concurrencia={args.concurrencia}")
+    resultados = asyncio.run(correr(args))
+
+    print()
+    print(f"{'escenario':<30}" + "".join(f"{c:>12}" for c in COLUMNAS))
+    for nombre, res in resultados.items():
+        print(f"{nombre:<30}" + "".join(f"{str(res[c]):>12}" for c in COLUMNAS))
+
+    if args.guardar:
+        with open(args.guardar, "w", encoding="utf-8") as f:
+            json.dump(
+                {"fecha": date.today().isoformat(), "requests": args.requests,
+                 "concurrencia": args.concurrencia, "escenarios": resultados},
+                f, indent=2, ensure_ascii=False,
+            )
+        print(f"\nLínea base guardada en {args.guardar}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            base = json.load(f)["escenarios"]
+        regresiones = comparar(resultados, base, args.tolerancia)
+        print(f"\n{regresiones} escenario(s) con regresión.")
+        sys.exit(1 if regresiones else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Chequeo con EXPLAIN: cada orden de los /avanzado tiene que resolverse por índice
+(sin "Using filesort") contra MySQL.
+
+Llama a los endpoints reales (TestClient, sin levantar el servidor), captura el
+SELECT paginado que emiten y le corre EXPLAIN. Conviene correrlo sobre una óptica
+con volumen (con pocas filas el optimizador puede preferir ordenar en memoria).
+
+    python bench/explain_ordenes.py --optica o1
+
+Sale con código 1 si algún orden hace filesort (salvo los esperados, ver abajo).
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from app.database import engine  # noqa: E402
+from app.main import app  # noqa: E402
+
+# ruta -> (tabla principal, órdenes del whitelist)
+ORDENES = {
+    "/clientes/avanzado": ("cliente", ["apellido", "nombre", "dni", "fecha_alta", "id_cliente"]),
+    "/insumos/avanzado": (
+        "insumo",
+        ["descripcion", "tipo_insumo", "stock_actual", "stock_minimo", "precio_costo",
+         "precio_sugerido", "id_insumo", "id_proveedor"],
+    ),
+    "/recetas/avanzado": (
+        "receta",
+        ["fecha_receta", "id_receta", "estado", "tipo_lente", "profesional",
+         "cliente_apellido", "cliente_nombre", "dni"],
+    ),
+    "/compras-insumos/avanzado": ("compra_insumos", ["fecha_compra", "monto_total", "id_compra"]),
+    "/pedidos-laboratorio/avanzado": (
+        "pedido_laboratorio",
+        ["fecha_envio", "fecha_estimada_rec", "fecha_recepcion", "estado", "nro_orden_lab",
+         "id_proveedor", "id_receta", "id_pedido_lab"],
+    ),
+    "/proveedores/avanzado": ("proveedor", ["nombre", "email", "telefono", "direccion", "activo", "id_proveedor"]),
+}
+
+# ordenar recetas por columnas del cliente mezcla dos tablas en el ORDER BY:
+# ningún índice lo cubre. Se informan pero no hacen fallar el chequeo.
+FILESORT_ESPERADO = {
+    ("/recetas/avanzado", "cliente_apellido"),
+    ("/recetas/avanzado", "cliente_nombre"),
+    ("/recetas/avanzado", "dni"),
+}
+
+
+def _capturar():
+    capturadas = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _antes(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and " LIMIT " in statement.upper():
+            capturadas.append((statement, parameters))
+
+    return capturadas
+
+
+def _explain(statement, parameters, tabla):
+    """Devuelve (usa_filesort, índice usado) para el bloque que lee la tabla principal."""
+    with engine.connect() as conn:
+        filas = conn.exec_driver_sql(f"EXPLAIN {statement}", parameters).mappings().all()
+
+    bloques = {}
+    for fila in filas:
+        bloques.setdefault(fila["id"], []).append(fila)
+
+    for bloque in bloques.values():
+        lectura = [f for f in bloque if f["table"] == tabla]
+        if lectura:
+            filesort = any("filesort" in (f["Extra"] or "") for f in bloque)
+            return filesort, lectura[0]["key"]
+    return False, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--optica", required=True)
+    args = parser.parse_args()
+
+    if engine.dialect.name != "mysql":
+        sys.exit("El chequeo es contra MySQL (EXPLAIN).")
+
+    client = TestClient(app)
+    capturadas = _capturar()
+    fallas = 0
+
+    for ruta, (tabla, ordenes) in ORDENES.items():
+        for orden in ordenes:
+            for direccion in ("asc", "desc"):
+                capturadas.clear()
+                r = client.get(
+                    ruta,
+                    params={"order_by": orden, "order_dir": direccion, "limit": 50, "include_total": "false"},
+                    headers={"X-Optica-Id": args.optica},
+                )
+                if r.status_code != 200 or not capturadas:
+                    print(f"??  {ruta} {orden} {direccion}: HTTP {r.status_code}")
+                    fallas += 1
+                    continue
+
+                filesort, indice = _explain(*capturadas[-1], tabla)
+                esperado = (ruta, orden) in FILESORT_ESPERADO
+                if filesort and not esperado:
+                    estado = "FILESORT"
+                    fallas += 1
+                elif filesort:
+                    estado = "filesort (esperado)"
+                else:
+                    estado = "ok"
+                print(f"{estado:<20} {ruta} order_by={orden} {direccion} índice={indice}")
+
+    print(f"\n{fallas} orden(es) con problemas.")
+    sys.exit(1 if fallas else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+"""
+Generador de datos sintéticos multi-óptica para los benchmarks.
+
+Carga N ópticas ("bench-01", "bench-02", ...) con volúmenes realistas de clientes,
+recetas, proveedores, insumos, compras y pedidos. Es determinístico: con la misma
+semilla, la misma base vacía y los mismos parámetros genera exactamente los mismos
+datos, así los resultados de bench/correr.py son comparables entre corridas.
+
+    # MySQL configurado en app/database.py (variables MYSQL_*)
+    python bench/generar_datos.py --opticas 3
+
+    # SQLite local como reemplazo (más chico)
+    python bench/generar_datos.py --url sqlite:///bench.db --opticas 2 --escala 0.1
+
+--reemplazar borra antes los datos de esas ópticas. También arma el índice de
+búsqueda y deja en el libro de stock un AJUSTE inicial por insumo con su stock.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sqlalchemy import create_engine, delete, func, insert, select  # noqa: E402
+
+from app.database import DATABASE_URL, Base  # noqa: E402
+from app.models import (  # noqa: E402
+    Cliente,
+    CompraInsumos,
+    DetalleCompraInsumos,
+    DetallePedidoLaboratorioInsumo,
+    IndiceBusqueda,
+    Insumo,
+    MovimientoStock,
+    PedidoLaboratorio,
+    Proveedor,
+    Receta,
+    StockCheckpoint,
+)
+from app.schemas.enums import TipoMovimientoStock  # noqa: E402
+from app.services.busqueda import indexar  # noqa: E402
+
+# volúmenes por óptica con --escala 1
+VOLUMENES = {
+    "clientes": 100_000,
+    "recetas": 120_000,
+    "proveedores": 40,
+    "insumos": 5_000,
+    "compras": 20_000,
+    "pedidos": 60_000,
+}
+LOTE = 5000
+HOY = date(2026, 1, 1)  # fija, para que los datos no dependan del día en que se generan
+
+NOMBRES = [
+    "Juan", "María", "José", "Ana", "Carlos", "Laura", "Luis", "Sofía", "Jorge", "Lucía",
+    "Miguel", "Valentina", "Diego", "Camila", "Pablo", "Martina", "Andrés", "Julieta", "Fernando", "Paula",
+    "Ricardo", "Florencia", "Gustavo", "Agustina", "Sergio", "Carolina", "Martín", "Gabriela", "Hernán", "Romina",
+]
+APELLIDOS = [
+    "González", "Rodríguez", "Gómez", "Fernández", "López", "Díaz", "Martínez", "Pérez", "García", "Sánchez",
+    "Romero", "Sosa", "Álvarez", "Torres", "Ruiz", "Ramírez", "Flores", "Acosta", "Benítez", "Medina",
+    "Suárez", "Herrera", "Aguirre", "Pereyra", "Gutiérrez", "Giménez", "Molina", "Silva", "Castro", "Rojas",
+]
+PROFESIONALES = [f"Dr. {n} {a}" for n, a in zip(NOMBRES[::3], APELLIDOS[::2])]
+TIPOS_LENTE = ["MONOFOCAL", "BIFOCAL", "MULTIFOCAL", "OCUPACIONAL", "CONTACTO"]
+ESTADOS_RECETA = ["ACTIVA"] * 6 + ["CERRADA"] * 3 + ["ANULADA"]
+ESTADOS_PEDIDO = ["PENDIENTE", "ENVIADO", "EN_PROCESO"]
+TIPOS_INSUMO = {
+    "LENTE": ["Orgánico 1.50", "Policarbonato", "Alto índice 1.67", "Fotocromático", "Antirreflejo"],
+    "ARMAZON": ["Metal", "Acetato", "TR90", "Titanio", "Al aire"],
+    "CONTACTO": ["Blanda diaria", "Blanda mensual", "Tórica", "Cosmética"],
+    "LIQUIDO": ["Solución multipropósito", "Gotas lubricantes", "Peróxido"],
+    "ACCESORIO": ["Estuche rígido", "Paño microfibra", "Cordón", "Spray limpiador"],
+}
+MARCAS = ["Essilor", "Zeiss", "Hoya", "Rodenstock", "Ray-Ban", "Vulk", "Acuvue", "Bausch"]
+
+
+def _siguiente_id(conn, columna) -> int:
+    return (conn.execute(select(func.max(columna))).scalar() or 0) + 1
+
+
+def _insertar(conn, modelo, filas, entidad=None, id_col=None):
+    """Inserta por lotes (y los indexa para la búsqueda si corresponde)."""
+    for i in range(0, len(filas), LOTE):
+        lote = filas[i:i + LOTE]
+        conn.execute(insert(modelo), lote)
+        if entidad:
+            indexar(conn, entidad, [f[id_col] for f in lote])
+        conn.commit()
+
+
+def borrar_optica(conn, optica_id: str) -> None:
+    """Borra todos los datos de una óptica (en orden inverso de claves foráneas)."""
+    for modelo in (
+        IndiceBusqueda, StockCheckpoint, MovimientoStock, DetallePedidoLaboratorioInsumo,
+        PedidoLaboratorio, DetalleCompraInsumos, CompraInsumos, Receta, Insumo, Proveedor, Cliente,
+    ):
+        conn.execute(delete(modelo).where(modelo.optica_id == optica_id))
+    conn.commit()
+
+
+def generar_optica(conn, rng: random.Random, nro: int, optica_id: str, vol: dict) -> dict:
+    desde = HOY - timedelta(days=3 * 365)
+
+    def fecha(dias_max: int = 3 * 365) -> date:
+        return HOY - timedelta(days=rng.randrange(dias_max))
+
+    # --- proveedores ---
+    id_prov = _siguiente_id(conn, Proveedor.id_proveedor)
+    proveedores = [
+        {
+            "optica_id": optica_id,
+            "id_proveedor": id_prov + i,
+            "nombre": f"{rng.choice(['Laboratorio', 'Distribuidora', 'Óptica Mayorista'])} {rng.choice(APELLIDOS)} {i + 1}",
+            "telefono": f"11{rng.randrange(10**7, 10**8)}",
+            "email": f"ventas{i + 1}@proveedor{nro}.com.ar",
+            "direccion": f"Av. {rng.choice(APELLIDOS)} {rng.randrange(100, 9000)}",
+            "activo": rng.random() < 0.9,
+        }
+        for i in range(vol["proveedores"])
+    ]
+    _insertar(conn, Proveedor, proveedores, "proveedor", "id_proveedor")
+    ids_prov = [p["id_proveedor"] for p in proveedores]
+    ids_prov_activos = [p["id_proveedor"] for p in proveedores if p["activo"]] or ids_prov
+
+    # --- insumos ---
+    id_ins = _siguiente_id(conn, Insumo.id_insumo)
+    insumos = []
+    for i in range(vol["insumos"]):
+        tipo = rng.choice(list(TIPOS_INSUMO))
+        costo = round(rng.uniform(500, 80_000), 2)
+        minimo = rng.randrange(0, 20)
+        # ~10% queda por debajo del mínimo
+        actual = rng.randrange(0, minimo + 1) if rng.random() < 0.1 else rng.randrange(minimo, minimo + 200)
+        insumos.append({
+            "optica_id": optica_id,
+            "id_insumo": id_ins + i,
+            "descripcion": f"{rng.choice(TIPOS_INSUMO[tipo])} {rng.choice(MARCAS)} #{i + 1}",
+            "tipo_insumo": tipo,
+            "id_proveedor": rng.choice(ids_prov),
+            "codigo_proveedor": f"P{rng.randrange(10**5, 10**6)}",
+            "codigo_interno": f"INS-{i + 1:06d}",
+            "precio_costo": costo,
+            "precio_sugerido": round(costo * rng.uniform(1.4, 2.2), 2),
+            "stock_minimo": minimo,
+            "stock_actual": actual,
+            "stock_bajo": actual <= minimo,
+            "activo": rng.random() < 0.95,
+        })
+    _insertar(conn, Insumo, insumos, "insumo", "id_insumo")
+    _insertar(conn, MovimientoStock, [
+        {
+            "optica_id": optica_id,
+            "id_insumo": ins["id_insumo"],
+            "fecha": datetime.combine(desde, datetime.min.time()),
+            "tipo": TipoMovimientoStock.AJUSTE.value,
+            "cantidad": ins["stock_actual"],
+            "stock_resultante": ins["stock_actual"],
+            "observaciones": "Stock inicial (datos de benchmark)",
+        }
+        for ins in insumos
+    ])
+    ids_ins = [i["id_insumo"] for i in insumos]
+    ins_por_prov = {}
+    for ins in insumos:
+        ins_por_prov.setdefault(ins["id_proveedor"], []).append(ins["id_insumo"])
+
+    # --- clientes (nombre es único por óptica y dni en toda la base) ---
+    id_cli = _siguiente_id(conn, Cliente.id_cliente)
+    dni_base = max(_siguiente_id(conn, Cliente.dni), 20_000_000)
+    vistos = set()
+    clientes = []
+    for i in range(vol["clientes"]):
+        nombre = f"{rng.choice(NOMBRES)} {rng.choice(NOMBRES)}"
+        if nombre in vistos:
+            nombre = f"{nombre} {i + 1}"
+        vistos.add(nombre)
+        apellido = rng.choice(APELLIDOS)
+        clientes.append({
+            "optica_id": optica_id,
+            "id_cliente": id_cli + i,
+            "nombre": nombre,
+            "apellido": apellido,
+            "dni": dni_base + i,
+            "fecha_nacimiento": HOY - timedelta(days=rng.randrange(6 * 365, 90 * 365)),
+            "telefono": f"11{rng.randrange(10**7, 10**8)}",
+            "email": f"{apellido.lower()}.{i + 1}@mail.com" if rng.random() < 0.7 else None,
+            "direccion": f"{rng.choice(APELLIDOS)} {rng.randrange(100, 9000)}",
+            "fecha_alta": fecha(),
+            "activo": rng.random() < 0.95,
+        })
+    _insertar(conn, Cliente, clientes, "cliente", "id_cliente")
+
+    # --- recetas ---
+    id_rec = _siguiente_id(conn, Receta.id_receta)
+    recetas = []
+    for i in range(vol["recetas"]):
+        recetas.append({
+            "optica_id": optica_id,
+            "id_receta": id_rec + i,
+            "id_cliente": id_cli + rng.randrange(vol["clientes"]),
+            "fecha_receta": fecha(),
+            "profesional": rng.choice(PROFESIONALES),
+            "tipo_lente": rng.choice(TIPOS_LENTE),
+            "od_esfera": rng.randrange(-24, 17) * 0.25,
+            "od_cilindro": rng.randrange(-12, 1) * 0.25,
+            "od_eje": rng.randrange(0, 181),
+            "ol_esfera": rng.randrange(-24, 17) * 0.25,
+            "ol_cilindro": rng.randrange(-12, 1) * 0.25,
+            "ol_eje": rng.randrange(0, 181),
+            "adicion": rng.choice([None, 1.0, 1.5, 2.0, 2.5]),
+            "dp": rng.randrange(56, 72),
+            "estado": rng.choice(ESTADOS_RECETA),
+            "fecha_creacion_reg": HOY,
+        })
+    _insertar(conn, Receta, recetas, "receta", "id_receta")
+
+    # --- compras con detalle ---
+    id_com = _siguiente_id(conn, CompraInsumos.id_compra)
+    id_det = _siguiente_id(conn, DetalleCompraInsumos.id_detalle_compra)
+    compras, detalles = [], []
+    for i in range(vol["compras"]):
+        prov = rng.choice(ids_prov)
+        candidatos = ins_por_prov.get(prov) or ids_ins
+        total = 0.0
+        for id_insumo in rng.sample(candidatos, min(len(candidatos), rng.randint(1, 6))):
+            cantidad = rng.randint(1, 20)
+            precio = round(rng.uniform(500, 80_000), 2)
+            total += cantidad * precio
+            detalles.append({
+                "optica_id": optica_id, "id_detalle_compra": id_det + len(detalles), "id_compra": id_com + i,
+                "id_insumo": id_insumo, "cantidad": cantidad, "precio_unitario": precio,
+                "subtotal": round(cantidad * precio, 2),
+            })
+        compras.append({
+            "optica_id": optica_id,
+            "id_compra": id_com + i,
+            "id_proveedor": prov,
+            "fecha_compra": fecha(),
+            "tipo_comprobante": rng.choice(["FACTURA A", "FACTURA B", "REMITO"]),
+            "nro_comprobante": f"0001-{i + 1:08d}",
+            "monto_total": round(total, 2),
+            "anulada": False,
+        })
+    _insertar(conn, CompraInsumos, compras, "compra_insumos", "id_compra")
+    _insertar(conn, DetalleCompraInsumos, detalles)
+
+    # --- pedidos al laboratorio con detalle (los más viejos, ya recibidos) ---
+    id_ped = _siguiente_id(conn, PedidoLaboratorio.id_pedido_lab)
+    id_dped = _siguiente_id(conn, DetallePedidoLaboratorioInsumo.id_detalle_pedido_lab_insumo)
+    pedidos, detalles = [], []
+    for i in range(vol["pedidos"]):
+        envio = fecha()
+        recibido = (HOY - envio).days > 30 and rng.random() < 0.9
+        pedidos.append({
+            "optica_id": optica_id,
+            "id_pedido_lab": id_ped + i,
+            "id_receta": id_rec + rng.randrange(vol["recetas"]),
+            "id_proveedor": rng.choice(ids_prov_activos),
+            "fecha_envio": envio,
+            "fecha_estimada_rec": envio + timedelta(days=rng.randint(3, 15)),
+            "fecha_recepcion": envio + timedelta(days=rng.randint(3, 20)) if recibido else None,
+            "estado": "RECIBIDO" if recibido else rng.choice(ESTADOS_PEDIDO),
+            "nro_orden_lab": f"OL-{id_ped + i:08d}",
+        })
+        for id_insumo in rng.sample(ids_ins, min(len(ids_ins), rng.randint(1, 3))):
+            detalles.append({
+                "optica_id": optica_id, "id_detalle_pedido_lab_insumo": id_dped + len(detalles),
+                "id_pedido_lab": id_ped + i, "id_insumo": id_insumo, "cantidad": rng.randint(1, 2),
+                "precio_unitario": round(rng.uniform(500, 80_000), 2),
+            })
+    _insertar(conn, PedidoLaboratorio, pedidos, "pedido_laboratorio", "id_pedido_lab")
+    _insertar(conn, DetallePedidoLaboratorioInsumo, detalles)
+
+    return {k: vol[k] for k in VOLUMENES}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=DATABASE_URL, help="URL SQLAlchemy (por defecto la de app/database.py)")
+    parser.add_argument("--opticas", type=int, default=3)
+    parser.add_argument("--prefijo", default="bench-")
+    parser.add_argument("--escala", type=float, default=1.0, help="multiplica todos los volúmenes")
+    parser.add_argument("--semilla", type=int, default=42)
+    parser.add_argument("--reemplazar", action="store_true", help="borra antes los datos de esas ópticas")
+    for nombre in VOLUMENES:
+        parser.add_argument(f"--{nombre}", type=int, help=f"{nombre} por óptica (pisa --escala)")
+    args = parser.parse_args()
+
+    vol = {k: getattr(args, k) or max(1, int(v * args.escala)) for k, v in VOLUMENES.items()}
+    engine = create_engine(args.url)
+    Base.metadata.create_all(engine)
+
+    with engine.connect() as conn:
+        for nro in range(1, args.opticas + 1):
+            optica_id = f"{args.prefijo}{nro:02d}"
+            existe = conn.execute(select(Cliente.id_cliente).where(Cliente.optica_id == optica_id).limit(1)).first()
+            if existe and not args.reemplazar:
+                print(f"{optica_id}: ya tiene datos (usar --reemplazar), se saltea")
+                continue
+            if existe:
+                borrar_optica(conn, optica_id)
+
+            inicio = time.perf_counter()
+            # una semilla por óptica: regenerar una sola da lo mismo que en la corrida completa
+            generar_optica(conn, random.Random(f"{args.semilla}-{nro}"), nro, optica_id, vol)
+            print(f"{optica_id}: {vol} en {time.perf_counter() - inicio:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+# q admite hasta MAX_TERMINOS términos distintos; con más, 400 en vez de ignorar el resto
+
+import random
+
+from app.services.busqueda import MAX_TERMINOS
+
+
+def test_demasiados_terminos(cliente_http):
+    r = cliente_http.post("/clientes/", json={"nombre": "Ana María", "apellido": "Pérez", "dni": random.randrange(10**7, 10**8)})
+    assert r.status_code == 201, r.text
+
+    # los términos repetidos cuentan una vez
+    r = cliente_http.get("/clientes/avanzado", params={"q": "per " + " ".join("ana" for _ in range(MAX_TERMINOS))})
+    assert r.status_code == 200, r.text
+    assert r.json()["total"] == 1
+
+    q = " ".join(f"t{i}" for i in range(MAX_TERMINOS + 1))
+    for ruta in ("/clientes/avanzado", "/insumos/avanzado", "/proveedores/avanzado", "/recetas/avanzado",
+                 "/compras-insumos/avanzado", "/pedidos-laboratorio/avanzado"):
+        r = cliente_http.get(ruta, params={"q": q})
+        assert r.status_code == 400, (ruta, r.text)
+        assert str(MAX_TERMINOS) in r.json()["detail"]
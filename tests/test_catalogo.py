@@ -0,0 +1,55 @@
+from sqlalchemy import event, select
+
+from app.models import Insumo
+
+# Reimportar la lista de precios escribe solo las líneas nuevas o cambiadas.
+
+
+def _catalogo(lineas):
+    return "codigo_interno,descripcion,precio_costo\n" + "".join(f"{c},{d},{p}\n" for c, d, p in lineas)
+
+
+def test_reimportar_escribe_solo_lo_cambiado(cliente_http, motor, sesiones, optica_id):
+    id_proveedor = cliente_http.post("/proveedores/", json={"nombre": "Lab"}).json()["id_proveedor"]
+    lineas = [("C1", "Lente 1", 10.0), ("C2", "Lente 2", 20.0), ("C3", "Lente 3", 30.0)]
+
+    def importar(lineas_):
+        r = cliente_http.post(
+            "/insumos/importar-catalogo", params={"id_proveedor": id_proveedor},
+            content=_catalogo(lineas_).encode(), headers={"Content-Type": "text/csv"},
+        )
+        assert r.status_code == 200, r.text
+        return r.json()
+
+    def versiones():
+        with sesiones() as db:
+            filas = db.execute(
+                select(Insumo.codigo_interno, Insumo.version, Insumo.precio_costo).where(Insumo.optica_id == optica_id)
+            ).all()
+        return {codigo: (version, precio) for codigo, version, precio in filas}
+
+    reporte = importar(lineas)
+    assert (reporte["nuevas"], reporte["modificadas"], reporte["sin_cambios"]) == (3, 0, 0)
+    antes = versiones()
+
+    escrituras = []
+
+    def anotar(conn, cursor, sql, params, context, executemany):
+        if sql.lstrip().startswith(("INSERT INTO insumo ", "UPDATE insumo ")):
+            escrituras.append(params if executemany else [params])
+
+    event.listen(motor, "before_cursor_execute", anotar)
+    try:
+        # mismo archivo, con un precio distinto y espacios de más en otra línea
+        reporte = importar([("C1", "Lente 1", 10.0), ("C2", "Lente 2", 25.0), ("C3", " Lente 3 ", 30.0)])
+    finally:
+        event.remove(motor, "before_cursor_execute", anotar)
+
+    assert (reporte["nuevas"], reporte["modificadas"], reporte["sin_cambios"]) == (0, 1, 2)
+    assert sum(len(p) for p in escrituras) == 1
+    despues = versiones()
+    assert despues["C2"] == (antes["C2"][0] + 1, 25.0)
+    assert despues["C1"] == antes["C1"] and despues["C3"] == antes["C3"]
+
+    reporte = importar(lineas[:1])
+    assert (reporte["nuevas"], reporte["modificadas"], reporte["sin_cambios"]) == (0, 0, 1)
@@ -0,0 +1,81 @@
+import random
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+# Los insumos de una compra o de un pedido se validan con un solo IN: la
+# cantidad de SELECT a insumo no crece con los ítems, y todos los que fallan
+# se informan juntos.
+
+
+@pytest.fixture
+def insumos(cliente_http):
+    id_proveedor = cliente_http.post("/proveedores/", json={"nombre": "Lab"}).json()["id_proveedor"]
+    ids = []
+    for i in range(6):
+        r = cliente_http.post("/insumos/", json={"descripcion": f"I{i}", "id_proveedor": id_proveedor, "stock_actual": 10})
+        ids.append(r.json()["id_insumo"])
+    return id_proveedor, ids
+
+
+def _selects_de_insumo(motor, enviar):
+    sentencias = []
+
+    def anotar(conn, cursor, sql, params, context, executemany):
+        if sql.lstrip().upper().startswith("SELECT") and "FROM insumo" in sql:
+            sentencias.append(sql)
+
+    event.listen(motor, "before_cursor_execute", anotar)
+    try:
+        r = enviar()
+    finally:
+        event.remove(motor, "before_cursor_execute", anotar)
+    assert r.status_code == 201, r.text
+    assert sentencias
+    return len(sentencias)
+
+
+def _items(ids):
+    return [{"id_insumo": i, "cantidad": 1, "precio_unitario": 2} for i in ids]
+
+
+def test_un_solo_select_de_insumos(cliente_http, motor, insumos):
+    id_proveedor, ids = insumos
+
+    def compra(ids_):
+        return lambda: cliente_http.post("/compras-insumos/", json={
+            "id_proveedor": id_proveedor, "fecha_compra": "2026-02-01", "items": _items(ids_),
+        })
+
+    assert _selects_de_insumo(motor, compra(ids[:1])) == _selects_de_insumo(motor, compra(ids))
+
+    r = cliente_http.post("/clientes/", json={"nombre": "Ana", "apellido": "Paz", "dni": random.randrange(10**7, 10**8)})
+    r = cliente_http.post("/recetas/", json={"id_cliente": r.json()["id_cliente"], "fecha_receta": "2026-01-01"})
+    id_receta = r.json()["id_receta"]
+
+    def pedido(ids_):
+        return lambda: cliente_http.post("/pedidos-laboratorio/", json={
+            "id_receta": id_receta, "id_proveedor": id_proveedor, "items": _items(ids_),
+        })
+
+    assert _selects_de_insumo(motor, pedido(ids[:1])) == _selects_de_insumo(motor, pedido(ids))
+
+
+def test_errores_de_insumos_juntos(cliente_http, api, insumos):
+    id_proveedor, ids = insumos
+    otra = TestClient(api, headers={"X-Optica-Id": "otra-optica"})
+    r = otra.post("/proveedores/", json={"nombre": "Lab"})
+    r = otra.post("/insumos/", json={"descripcion": "Ajeno", "id_proveedor": r.json()["id_proveedor"]})
+    ajeno = r.json()["id_insumo"]
+    r = cliente_http.put(f"/insumos/{ids[0]}", json={"activo": False})
+    assert r.status_code == 200, r.text
+
+    compra = {"id_proveedor": id_proveedor, "fecha_compra": "2026-02-01"}
+    r = cliente_http.post("/compras-insumos/", json={**compra, "items": _items([ids[0], ids[1], ajeno, 999999])})
+    assert r.status_code == 400
+    assert r.json()["detail"].endswith(f"{ids[0]}, {ajeno}, 999999")
+
+    r = cliente_http.post("/compras-insumos/", json={**compra, "items": _items([ids[1], ids[2], ids[1]])})
+    assert r.status_code == 400
+    assert r.json()["detail"] == f"Insumos repetidos en los ítems: {ids[1]}"
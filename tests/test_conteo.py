@@ -0,0 +1,46 @@
+import random
+from datetime import date
+
+from sqlalchemy import insert
+
+from app.models import Cliente
+
+# El total de los /avanzado sale del caché hasta que una escritura confirmada de
+# la óptica lo invalida; un rollback no invalida nada.
+
+
+def _total(http):
+    r = http.get("/clientes/avanzado")
+    assert r.status_code == 200, r.text
+    return r.json()["total"]
+
+
+def _fila(optica_id, nombre):
+    return {"optica_id": optica_id, "nombre": nombre, "apellido": "Paz",
+            "dni": random.randrange(10**7, 10**8), "fecha_alta": date.today()}
+
+
+def test_total_cacheado_hasta_el_commit(cliente_http, motor, sesiones, optica_id):
+    r = cliente_http.post("/clientes/", json={"nombre": "Ana", "apellido": "Paz", "dni": random.randrange(10**7, 10**8)})
+    assert r.status_code == 201, r.text
+    assert _total(cliente_http) == 1
+
+    # SQL directo sin registrar_escritura: el caché no se entera
+    with motor.begin() as conn:
+        conn.execute(insert(Cliente), [_fila(optica_id, "Eva")])
+    assert _total(cliente_http) == 1
+
+    with sesiones() as db:
+        db.add(Cliente(**_fila(optica_id, "Lia")))
+        db.flush()
+        db.rollback()
+    assert _total(cliente_http) == 1
+
+    # una escritura confirmada con el ORM sube la generación
+    with sesiones() as db:
+        db.add(Cliente(**_fila(optica_id, "Sol")))
+        db.commit()
+    assert _total(cliente_http) == 3
+
+    r = cliente_http.get("/clientes/avanzado", params={"include_total": False})
+    assert r.json()["total"] is None
@@ -0,0 +1,104 @@
+from sqlalchemy import create_engine, inspect, select, text
+
+from app import database
+from app.migraciones import costo_promedio
+from app.models import HistorialCostoInsumo, Insumo
+
+
+def _insumo(http, id_proveedor, stock, precio_costo=None):
+    r = http.post("/insumos/", json={
+        "descripcion": f"Insumo {stock}-{precio_costo}", "id_proveedor": id_proveedor,
+        "stock_actual": stock, "precio_costo": precio_costo,
+    })
+    assert r.status_code == 201, r.text
+    return r.json()["id_insumo"]
+
+
+def _comprar(http, id_proveedor, items):
+    r = http.post("/compras-insumos/", json={
+        "id_proveedor": id_proveedor, "fecha_compra": "2026-03-01",
+        "items": [{"id_insumo": i, "cantidad": c, "precio_unitario": p} for i, c, p in items],
+    })
+    assert r.status_code == 201, r.text
+    return r.json()["id_compra"]
+
+
+def _anular(http, id_compra):
+    r = http.patch(f"/compras-insumos/{id_compra}/anular", json={"motivo": "prueba"})
+    assert r.status_code == 200, r.text
+
+
+def _costo(http, id_insumo):
+    return http.get(f"/insumos/{id_insumo}").json()["precio_costo"]
+
+
+def test_anular_compra_restaura_el_costo(cliente_http):
+    id_proveedor = cliente_http.post("/proveedores/", json={"nombre": "Lab Costos"}).json()["id_proveedor"]
+    id_insumo = _insumo(cliente_http, id_proveedor, stock=10, precio_costo=4.0)
+
+    id_compra = _comprar(cliente_http, id_proveedor, [(id_insumo, 30, 8.0)])
+    assert _costo(cliente_http, id_insumo) == 7.0  # (10*4 + 30*8) / 40
+    _anular(cliente_http, id_compra)
+    assert _costo(cliente_http, id_insumo) == 4.0
+
+    # con otra compra en el medio: anular la última vuelve al costo anterior a ella
+    _comprar(cliente_http, id_proveedor, [(id_insumo, 10, 10.0)])
+    costo = _costo(cliente_http, id_insumo)
+    assert costo == 7.0  # (10*4 + 10*10) / 20
+    id_compra = _comprar(cliente_http, id_proveedor, [(id_insumo, 5, 2.0)])
+    assert _costo(cliente_http, id_insumo) != costo
+    _anular(cliente_http, id_compra)
+    assert _costo(cliente_http, id_insumo) == costo
+
+
+def test_la_migracion_reproduce_el_costo_en_linea(cliente_http, motor, sesiones, optica_id):
+    id_proveedor = cliente_http.post("/proveedores/", json={"nombre": "Lab Replay"}).json()["id_proveedor"]
+    a = _insumo(cliente_http, id_proveedor, stock=0, precio_costo=9.0)
+    b = _insumo(cliente_http, id_proveedor, stock=6)
+
+    c1 = _comprar(cliente_http, id_proveedor, [(a, 10, 4.0), (b, 4, 3.0)])
+    _comprar(cliente_http, id_proveedor, [(a, 30, 8.0)])
+    r = cliente_http.post(f"/insumos/{a}/ajuste-stock", json={"cantidad": -15})
+    assert r.status_code == 200, r.text
+    c3 = _comprar(cliente_http, id_proveedor, [(a, 5, 1.5), (b, 10, 6.25)])
+    _anular(cliente_http, c3)
+    _anular(cliente_http, c1)
+    _comprar(cliente_http, id_proveedor, [(b, 2, 11.0)])
+
+    with sesiones() as db:
+        en_linea = dict(db.execute(
+            select(Insumo.id_insumo, Insumo.precio_costo).where(Insumo.optica_id == optica_id)
+        ).all())
+        historial = sorted(db.execute(
+            select(
+                HistorialCostoInsumo.id_insumo, HistorialCostoInsumo.id_compra, HistorialCostoInsumo.cantidad,
+                HistorialCostoInsumo.precio_unitario, HistorialCostoInsumo.costo_promedio,
+            ).where(HistorialCostoInsumo.optica_id == optica_id)
+        ).all())
+
+    with motor.connect() as conn:
+        costos, filas = costo_promedio._reproducir(conn)
+
+    assert {i: costos[(optica_id, i)] for i in (a, b)} == {a: en_linea[a], b: en_linea[b]}
+    repetido = sorted(
+        (f["id_insumo"], f["id_compra"], f["cantidad"], f["precio_unitario"], f["costo_promedio"])
+        for f in filas if f["optica_id"] == optica_id
+    )
+    assert repetido == [tuple(f) for f in historial]
+
+
+def test_la_migracion_borra_los_acumulados_viejos(tmp_path, monkeypatch):
+    motor = create_engine(f"sqlite:///{tmp_path / 'vieja.db'}")
+    database.Base.metadata.create_all(motor)
+    with motor.begin() as conn:
+        conn.execute(text("ALTER TABLE insumo ADD COLUMN costo_cantidad INTEGER DEFAULT 0 NOT NULL"))
+        conn.execute(text("ALTER TABLE insumo ADD COLUMN costo_valor FLOAT DEFAULT 0 NOT NULL"))
+    monkeypatch.setattr(costo_promedio, "shard_engines", {"vieja": motor})
+
+    costo_promedio.migrar(solo_mostrar=True)
+    assert {"costo_cantidad", "costo_valor"} <= {c["name"] for c in inspect(motor).get_columns("insumo")}
+
+    costo_promedio.migrar()
+    assert not {"costo_cantidad", "costo_valor"} & {c["name"] for c in inspect(motor).get_columns("insumo")}
+    costo_promedio.migrar()  # idempotente
+    motor.dispose()
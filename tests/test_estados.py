@@ -0,0 +1,31 @@
+# estado es VARCHAR(32): un valor más largo se rechaza con 422 (antes de llegar a MySQL)
+
+import random
+
+
+def test_estado_largo_se_rechaza(cliente_http):
+    r = cliente_http.post("/clientes/", json={"nombre": "Eva", "apellido": "Sol", "dni": random.randrange(10**7, 10**8)})
+    id_cliente = r.json()["id_cliente"]
+    largo = "X" * 33
+
+    r = cliente_http.post("/recetas/", json={"id_cliente": id_cliente, "fecha_receta": "2026-01-01", "estado": largo})
+    assert r.status_code == 422
+
+    r = cliente_http.post("/recetas/", json={"id_cliente": id_cliente, "fecha_receta": "2026-01-01"})
+    assert r.status_code == 201, r.text
+    id_receta = r.json()["id_receta"]
+    assert cliente_http.patch(f"/recetas/{id_receta}", json={"estado": largo}).status_code == 422
+
+    r = cliente_http.post("/proveedores/", json={"nombre": "Lab"})
+    id_proveedor = r.json()["id_proveedor"]
+    r = cliente_http.post("/insumos/", json={"descripcion": "Lente", "id_proveedor": id_proveedor, "stock_actual": 5})
+    pedido = {
+        "id_receta": id_receta, "id_proveedor": id_proveedor,
+        "items": [{"id_insumo": r.json()["id_insumo"], "cantidad": 1, "precio_unitario": 5}],
+    }
+    assert cliente_http.post("/pedidos-laboratorio/", json={**pedido, "estado": largo}).status_code == 422
+
+    r = cliente_http.post("/pedidos-laboratorio/", json=pedido)
+    assert r.status_code == 201, r.text
+    id_pedido = r.json()["id_pedido_lab"]
+    assert cliente_http.patch(f"/pedidos-laboratorio/{id_pedido}/recepcion", json={"estado": largo}).status_code == 422
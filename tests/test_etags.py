@@ -0,0 +1,79 @@
+import random
+
+# GET de detalle con ETag (If-None-Match -> 304) y edición con If-Match (409 si
+# la fila cambió desde que el cliente la leyó).
+
+
+def _cliente(http):
+    r = http.post("/clientes/", json={"nombre": "Ana", "apellido": "Paz", "dni": random.randrange(10**7, 10**8)})
+    assert r.status_code == 201, r.text
+    return r.json()["id_cliente"]
+
+
+def test_get_condicional(cliente_http):
+    id_cliente = _cliente(cliente_http)
+    r = cliente_http.get(f"/clientes/{id_cliente}")
+    etag = r.headers["etag"]
+
+    for valor in (etag, f"W/{etag}", f'"0", {etag}'):
+        r = cliente_http.get(f"/clientes/{id_cliente}", headers={"If-None-Match": valor})
+        assert r.status_code == 304
+        assert r.headers["etag"] == etag
+        assert r.content == b""
+
+    # la receta incluye al cliente: cambiarlo cambia el ETag de la receta
+    r = cliente_http.post("/recetas/", json={"id_cliente": id_cliente, "fecha_receta": "2026-01-01"})
+    id_receta = r.json()["id_receta"]
+    etag_receta = cliente_http.get(f"/recetas/{id_receta}").headers["etag"]
+
+    r = cliente_http.patch(f"/clientes/{id_cliente}", json={"telefono": "555"})
+    assert r.status_code == 200, r.text
+    assert r.headers["etag"] != etag
+
+    r = cliente_http.get(f"/clientes/{id_cliente}", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    r = cliente_http.get(f"/recetas/{id_receta}", headers={"If-None-Match": etag_receta})
+    assert r.status_code == 200
+    assert r.headers["etag"] != etag_receta
+
+    assert cliente_http.get("/clientes/999999999", headers={"If-None-Match": "*"}).status_code == 404
+
+
+def test_edicion_con_if_match(cliente_http):
+    id_cliente = _cliente(cliente_http)
+    leido = cliente_http.get(f"/clientes/{id_cliente}").headers["etag"]
+
+    r = cliente_http.patch(f"/clientes/{id_cliente}", json={"telefono": "1"}, headers={"If-Match": leido})
+    assert r.status_code == 200, r.text
+    nuevo = r.headers["etag"]
+
+    # otro usuario editó sobre la versión vieja
+    r = cliente_http.patch(f"/clientes/{id_cliente}", json={"telefono": "2"}, headers={"If-Match": leido})
+    assert r.status_code == 409
+    assert cliente_http.get(f"/clientes/{id_cliente}").json()["telefono"] == "1"
+
+    r = cliente_http.patch(f"/clientes/{id_cliente}", json={"telefono": "3"}, headers={"If-Match": "basura"})
+    assert r.status_code == 400
+
+    r = cliente_http.patch(f"/clientes/{id_cliente}", json={"telefono": "4"}, headers={"If-Match": nuevo})
+    assert r.status_code == 200, r.text
+    r = cliente_http.patch(f"/clientes/{id_cliente}", json={"telefono": "5"})
+    assert r.status_code == 200, r.text
+
+
+def test_if_match_de_compra_ignora_el_stock(cliente_http):
+    id_proveedor = cliente_http.post("/proveedores/", json={"nombre": "Lab"}).json()["id_proveedor"]
+    r = cliente_http.post("/insumos/", json={"descripcion": "Lente", "id_proveedor": id_proveedor, "stock_actual": 5})
+    id_insumo = r.json()["id_insumo"]
+    compra = {"id_proveedor": id_proveedor, "fecha_compra": "2026-02-01",
+              "items": [{"id_insumo": id_insumo, "cantidad": 1, "precio_unitario": 3}]}
+    id_compra = cliente_http.post("/compras-insumos/", json=compra).json()["id_compra"]
+    leido = cliente_http.get(f"/compras-insumos/{id_compra}").headers["etag"]
+
+    # otra compra mueve el stock (y la versión) del insumo del detalle
+    assert cliente_http.post("/compras-insumos/", json=compra).status_code == 201
+    r = cliente_http.get(f"/compras-insumos/{id_compra}", headers={"If-None-Match": leido})
+    assert r.status_code == 200
+
+    r = cliente_http.patch(f"/compras-insumos/{id_compra}", json={"observaciones": "ok"}, headers={"If-Match": leido})
+    assert r.status_code == 200, r.text
@@ -0,0 +1,45 @@
+import csv
+import io
+import json
+
+from app.services import exportacion
+
+# format=ndjson|csv en los listados sin paginar: las mismas filas que el JSON,
+# escritas por lotes.
+
+
+def test_exportar_insumos(cliente_http):
+    id_proveedor = cliente_http.post("/proveedores/", json={"nombre": "Lab"}).json()["id_proveedor"]
+    for descripcion in ("Lente, bifocal", "Armazón \"Aviador\"", "Estuche"):
+        r = cliente_http.post("/insumos/", json={"descripcion": descripcion, "id_proveedor": id_proveedor, "stock_actual": 3})
+        assert r.status_code == 201, r.text
+
+    esperado = cliente_http.get("/insumos/").json()
+    assert len(esperado) == 3
+
+    r = cliente_http.get("/insumos/", params={"format": "ndjson"})
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+    assert 'filename="insumos.ndjson"' in r.headers["content-disposition"]
+    assert [json.loads(l) for l in r.text.splitlines()] == esperado
+
+    r = cliente_http.get("/insumos/", params={"format": "csv"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/csv")
+    filas = list(csv.DictReader(io.StringIO(r.text)))
+    assert [f["descripcion"] for f in filas] == [i["descripcion"] for i in esperado]
+    assert [int(f["id_insumo"]) for f in filas] == [i["id_insumo"] for i in esperado]
+
+    assert cliente_http.get("/insumos/", params={"format": "xml"}).status_code == 400
+
+
+def test_se_escribe_por_lotes(monkeypatch):
+    monkeypatch.setattr(exportacion, "FILAS_POR_LOTE", 2)
+    filas = [("id", "nombre")] + [(i, f"N{i}") for i in range(5)]
+
+    partes = list(exportacion._ndjson(iter(filas)))
+    assert [len(p.splitlines()) for p in partes] == [2, 2, 1]
+
+    partes = list(exportacion._csv(iter(filas)))
+    assert [len(p.splitlines()) for p in partes] == [3, 2, 1]
+    assert "".join(partes).splitlines()[0] == "id,nombre"
@@ -0,0 +1,62 @@
+import json
+import random
+
+# Importación de clientes (CSV / NDJSON): reenviar el archivo retoma por
+# id_cliente_legacy, y los DNI repetidos salen en el reporte sin cortar el resto.
+
+
+def _dnis(n):
+    return random.sample(range(10**7, 10**8), n)
+
+
+def _csv(filas):
+    lineas = ["id_cliente_legacy,nombre,apellido,dni"]
+    lineas += [f"{legacy},{nombre},{apellido},{dni}" for legacy, nombre, apellido, dni in filas]
+    return "\n".join(lineas) + "\n"
+
+
+def _importar(http, cuerpo, content_type="text/csv"):
+    r = http.post("/clientes/importar", content=cuerpo.encode(), headers={"Content-Type": content_type})
+    assert r.status_code == 200, r.text
+    return r.json()
+
+
+def test_reenviar_el_archivo_retoma(cliente_http):
+    dnis = _dnis(4)
+    filas = [(f"L{i}", f"Ana{i}", "Paz", dni) for i, dni in enumerate(dnis)]
+
+    # la primera corrida se cortó después de las dos primeras filas
+    reporte = _importar(cliente_http, _csv(filas[:2]))
+    assert (reporte["insertadas"], reporte["omitidas"], reporte["con_error"]) == (2, 0, 0)
+
+    reporte = _importar(cliente_http, _csv(filas))
+    assert (reporte["leidas"], reporte["insertadas"], reporte["omitidas"], reporte["con_error"]) == (4, 2, 2, 0)
+
+    reporte = _importar(cliente_http, _csv(filas))
+    assert (reporte["insertadas"], reporte["omitidas"]) == (0, 4)
+
+    r = cliente_http.get("/clientes/avanzado", params={"limit": 50})
+    assert sorted(c["dni"] for c in r.json()["items"]) == sorted(dnis)
+
+
+def test_dni_repetido_en_el_reporte(cliente_http):
+    dni_existente, dni_nuevo, dni_archivo = _dnis(3)
+    r = cliente_http.post("/clientes/", json={"nombre": "Eva", "apellido": "Sol", "dni": dni_existente})
+    assert r.status_code == 201, r.text
+
+    filas = [
+        {"id_cliente_legacy": "A", "nombre": "Ana", "apellido": "Paz", "dni": dni_existente},
+        {"id_cliente_legacy": "B", "nombre": "Lia", "apellido": "Paz", "dni": dni_archivo},
+        {"id_cliente_legacy": "C", "nombre": "Sol", "apellido": "Paz", "dni": dni_archivo},
+        {"id_cliente_legacy": "D", "nombre": "Rui", "apellido": "Paz", "dni": dni_nuevo},
+        {"id_cliente_legacy": "E", "nombre": "Tom", "apellido": "Paz"},
+    ]
+    cuerpo = "\n".join(json.dumps(f) for f in filas) + "\n"
+    reporte = _importar(cliente_http, cuerpo, "application/x-ndjson")
+
+    assert (reporte["leidas"], reporte["insertadas"], reporte["con_error"]) == (5, 2, 3)
+    errores = {e["id_cliente_legacy"]: e for e in reporte["errores"]}
+    assert set(errores) == {"A", "C", "E"}
+    assert errores["A"]["fila"] == 1
+    assert errores["A"]["errores"] == ["Ya existe un cliente con ese DNI en esta óptica"]
+    assert errores["C"]["errores"] == ["Ya existe un cliente con ese DNI en esta óptica"]
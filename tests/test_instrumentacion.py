@@ -0,0 +1,45 @@
+import logging
+import re
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+
+from app.services import instrumentacion
+
+# Server-Timing con las consultas del request, y aviso de N+1 cuando una misma
+# sentencia se repite UMBRAL_N1 veces.
+
+
+def test_server_timing(cliente_http, motor):
+    instrumentacion.instalar(motor)
+
+    r = cliente_http.get("/status")
+    assert r.status_code == 200
+    timing = r.headers["server-timing"]
+    assert re.match(r'db;dur=[\d.]+;desc="\d+ consultas", app;dur=[\d.]+$', timing)
+    assert "n1" not in timing
+
+
+def test_n_mas_uno(motor, caplog):
+    instrumentacion.instalar(motor)
+    app = FastAPI()
+    app.add_middleware(instrumentacion.MedicionSQLMiddleware)
+
+    @app.get("/uno-por-uno")
+    def uno_por_uno(veces: int):
+        with motor.connect() as conn:
+            for i in range(veces):
+                conn.execute(text("SELECT :i"), {"i": i})
+        return {}
+
+    http = TestClient(app)
+    with caplog.at_level(logging.WARNING, logger=instrumentacion.__name__):
+        r = http.get("/uno-por-uno", params={"veces": instrumentacion.UMBRAL_N1 - 1})
+        assert "n1" not in r.headers["server-timing"]
+        assert not caplog.messages
+
+        r = http.get("/uno-por-uno", params={"veces": instrumentacion.UMBRAL_N1})
+        assert 'n1;desc="sentencias repetidas"' in r.headers["server-timing"]
+    [mensaje] = caplog.messages
+    assert mensaje.startswith(f"Posible N+1 en GET /uno-por-uno: {instrumentacion.UMBRAL_N1} veces")
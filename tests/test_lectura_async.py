@@ -0,0 +1,68 @@
+import importlib
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import database
+
+# MODO ASYNC (OPTICA_DB_MODO=async)
+#
+# Monta la app con las lecturas async (app/routers/lectura_async.py) y les da
+# una AsyncSession sobre la misma base de pruebas. Los datos se cargan con la
+# app sync (el fixture api, armado antes de recargar app.main).
+
+
+@pytest.fixture
+def api_async(api, motor, monkeypatch):
+    pytest.importorskip("greenlet")
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    if motor.dialect.name == "sqlite":
+        pytest.importorskip("aiosqlite")
+        url = motor.url.set(drivername="sqlite+aiosqlite")
+    else:
+        pytest.importorskip(database.DB_ASYNC_DRIVER)
+        url = motor.url.set(drivername=f"mysql+{database.DB_ASYNC_DRIVER}")
+    motor_async = create_async_engine(url)
+    sesiones_async = async_sessionmaker(motor_async, expire_on_commit=False)
+
+    async def get_async_db():
+        async with sesiones_async() as db:
+            yield db
+
+    import app.main
+
+    monkeypatch.setattr(database, "DB_ASYNC", True)
+    modulo = importlib.reload(app.main)
+    modulo.app.dependency_overrides[database.get_async_db] = get_async_db
+    yield modulo.app
+
+    monkeypatch.setattr(database, "DB_ASYNC", False)
+    importlib.reload(app.main)
+    motor_async.sync_engine.dispose()
+
+
+def test_stock_bajo_y_detalle_en_modo_async(api_async, cliente_http, optica_id):
+    r = cliente_http.post("/proveedores/", json={"nombre": "Lab Async"})
+    id_proveedor = r.json()["id_proveedor"]
+    ids = {}
+    for descripcion, stock in (("Bajo", 1), ("Alto", 20)):
+        r = cliente_http.post("/insumos/", json={
+            "descripcion": descripcion, "id_proveedor": id_proveedor, "stock_actual": stock, "stock_minimo": 5,
+        })
+        assert r.status_code == 201, r.text
+        ids[descripcion] = r.json()["id_insumo"]
+
+    http = TestClient(api_async, headers={"X-Optica-Id": optica_id})
+
+    # /insumos/stock-bajo no tiene que caer en la ruta de detalle
+    r = http.get("/insumos/stock-bajo")
+    assert r.status_code == 200, r.text
+    assert [i["id_insumo"] for i in r.json()["items"]] == [ids["Bajo"]]
+    assert r.json()["total"] == 1
+    assert r.json() == cliente_http.get("/insumos/stock-bajo").json()
+
+    r = http.get(f"/insumos/{ids['Alto']}")
+    assert r.status_code == 200, r.text
+    assert r.json()["descripcion"] == "Alto"
+    assert http.get("/insumos/999999999").status_code == 404
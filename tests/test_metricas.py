@@ -0,0 +1,34 @@
+from sqlalchemy import create_engine, text
+
+from app import database
+
+# /metrics exporta las esperas de todos los pools que muestra /status/pool
+# (principal, réplica y shards), cada uno con su label engine
+
+
+def _motor_medido(ruta):
+    return create_engine(f"sqlite:///{ruta}", poolclass=database.PoolMedido, pool_size=2, future=True)
+
+
+def test_metricas_de_todos_los_pools(cliente_http, monkeypatch, tmp_path):
+    principal = _motor_medido(tmp_path / "principal.db")
+    replica = _motor_medido(tmp_path / "replica.db")
+    shard = _motor_medido(tmp_path / "shard_b.db")
+    monkeypatch.setattr(database, "engine", principal)
+    monkeypatch.setattr(database, "replica_engine", replica)
+    monkeypatch.setattr(database, "shard_engines", {"principal": principal, "shard_b": shard})
+
+    for _ in range(3):
+        with shard.connect() as conn:
+            conn.execute(text("SELECT 1"))
+
+    r = cliente_http.get("/metrics")
+    assert r.status_code == 200
+    lineas = r.text.splitlines()
+    assert 'optica_db_pool_checkouts_total{engine="shard_b"} 3' in lineas
+    assert 'optica_db_pool_checkouts_total{engine="principal"} 0' in lineas
+    assert 'optica_db_pool_timeouts_total{engine="replica"} 0' in lineas
+    assert sum(l.startswith("# TYPE optica_db_pool_checkouts_total ") for l in lineas) == 1
+
+    for motor in (principal, replica, shard):
+        motor.dispose()
@@ -0,0 +1,65 @@
+import json
+import random
+
+from sqlalchemy import create_engine, select
+
+from app import database
+from app.migraciones import mover_optica
+from app.services import shards
+
+
+def _filas(motor, optica_id):
+    resultado = {}
+    with motor.connect() as conn:
+        for modelo in mover_optica.TABLAS:
+            tabla = modelo.__table__
+            pk = mover_optica._pk(tabla)
+            resultado[tabla.name] = [
+                tuple(f) for f in conn.execute(select(tabla).where(tabla.c.optica_id == optica_id).order_by(pk))
+            ]
+    return resultado
+
+
+def test_mudanza_despues_de_compra_ajuste_e_importacion(cliente_http, motor, optica_id, tmp_path, monkeypatch):
+    destino = create_engine(f"sqlite:///{tmp_path / 'shard_b.db'}")
+    monkeypatch.setattr(mover_optica, "engine", motor)
+    monkeypatch.setattr(mover_optica, "shard_engines", {shards.PRINCIPAL: motor, "b": destino})
+
+    # datos de la óptica y una primera copia (como la pasada en línea de una mudanza)
+    id_proveedor = cliente_http.post("/proveedores/", json={"nombre": "Lab Mudanza"}).json()["id_proveedor"]
+    cliente_http.post("/clientes/", json={"nombre": "Ana", "apellido": "Paz", "dni": random.randrange(10**7, 10**8)})
+    ids = []
+    for i in range(3):
+        r = cliente_http.post("/insumos/", json={
+            "descripcion": f"Lente {i}", "codigo_interno": f"M-{i}", "id_proveedor": id_proveedor,
+            "stock_actual": 10, "stock_minimo": 2, "precio_costo": 4.0,
+        })
+        ids.append(r.json()["id_insumo"])
+    database.Base.metadata.create_all(destino)
+    with motor.connect() as o, destino.connect() as d:
+        mover_optica.sincronizar(o, d, optica_id)
+
+    # escrituras por los caminos con UPDATE de Core: tienen que subir version para que la pasada las vea
+    r = cliente_http.post("/compras-insumos/", json={
+        "id_proveedor": id_proveedor, "fecha_compra": "2026-02-01",
+        "items": [{"id_insumo": ids[0], "cantidad": 5, "precio_unitario": 10.0}],
+    })
+    assert r.status_code == 201, r.text
+    assert cliente_http.post(f"/insumos/{ids[1]}/ajuste-stock", json={"cantidad": -9}).status_code == 200
+    catalogo = "\n".join(json.dumps(linea) for linea in (
+        {"codigo_interno": "M-2", "descripcion": "Lente 2 (nueva lista)", "precio_costo": 6.5, "stock_minimo": 12},
+        {"codigo_interno": "M-9", "descripcion": "Lente nuevo"},
+    ))
+    r = cliente_http.post(
+        "/insumos/importar-catalogo", params={"formato": "ndjson", "id_proveedor": id_proveedor}, content=catalogo
+    )
+    assert r.status_code == 200, r.text
+
+    mover_optica.mover(optica_id, "b")
+
+    origen, copia = _filas(motor, optica_id), _filas(destino, optica_id)
+    assert origen["insumo"] and origen["compra_insumos"] and origen["movimiento_stock"]
+    assert copia == origen
+    with motor.connect() as conn:
+        assert shards.leer_directorio(conn, optica_id) == ("b", False)
+    destino.dispose()
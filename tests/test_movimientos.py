@@ -0,0 +1,56 @@
+from datetime import datetime
+
+import pytest
+from sqlalchemy import func, select
+
+from app.models import MovimientoStock, StockCheckpoint
+from app.services import movimientos
+
+
+def test_compactar_retoma_despues_de_cortarse(cliente_http, sesiones, optica_id, monkeypatch):
+    r = cliente_http.post("/proveedores/", json={"nombre": "Lab"})
+    id_proveedor = r.json()["id_proveedor"]
+    ids = []
+    for i in range(3):
+        r = cliente_http.post("/insumos/", json={"descripcion": f"I{i}", "id_proveedor": id_proveedor, "stock_actual": 5})
+        ids.append(r.json()["id_insumo"])
+    for _ in range(2):
+        r = cliente_http.post("/compras-insumos/", json={
+            "id_proveedor": id_proveedor, "fecha_compra": "2026-02-01",
+            "items": [{"id_insumo": i, "cantidad": 1, "precio_unitario": 3} for i in ids],
+        })
+        assert r.status_code == 201, r.text
+
+    corte = datetime.utcnow()
+    borrar = movimientos.delete
+    lotes = []
+
+    def borrar_y_cortar(*args, **kwargs):
+        lotes.append(1)
+        if len(lotes) > 2:
+            raise RuntimeError("proceso cortado")
+        return borrar(*args, **kwargs)
+
+    # primera corrida: checkpoints confirmados y dos lotes borrados, después se corta
+    with sesiones() as db:
+        monkeypatch.setattr(movimientos, "delete", borrar_y_cortar)
+        with pytest.raises(RuntimeError):
+            movimientos.compactar(db, corte, optica_id, lote=2)
+        monkeypatch.setattr(movimientos, "delete", borrar)
+
+    # segunda corrida con el mismo corte: no choca con los checkpoints y termina
+    with sesiones() as db:
+        movimientos.compactar(db, corte, optica_id, lote=2)
+
+        pendientes = db.execute(
+            select(func.count()).select_from(MovimientoStock).where(MovimientoStock.optica_id == optica_id)
+        ).scalar()
+        checkpoints = dict(db.execute(
+            select(StockCheckpoint.id_insumo, StockCheckpoint.stock).where(StockCheckpoint.optica_id == optica_id)
+        ).all())
+        assert pendientes == 0
+        assert checkpoints == {i: 7 for i in ids}
+        for i in ids:
+            assert movimientos.stock_a_fecha(db, optica_id, i, corte) == 7
+            # antes del corte ya no hay libro
+            assert movimientos.stock_a_fecha(db, optica_id, i, datetime(2000, 1, 1)) is None
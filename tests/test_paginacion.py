@@ -0,0 +1,50 @@
+import random
+
+# Cursor de los /avanzado: recorrer página por página da las mismas filas que
+# pedirlas juntas (con empates en la columna de orden), y un cursor de otro
+# orden se rechaza.
+
+
+def _alta(http, nombre, apellido):
+    r = http.post("/clientes/", json={"nombre": nombre, "apellido": apellido, "dni": random.randrange(10**7, 10**8)})
+    assert r.status_code == 201, r.text
+
+
+def test_cursor_recorre_todas_las_filas(cliente_http):
+    for i, apellido in enumerate(("Paz", "Paz", "Abad", "Paz", "Zapata", "Abad", "Luna")):
+        _alta(cliente_http, f"Ana{i}", apellido)
+
+    for order_dir in ("asc", "desc"):
+        params = {"order_by": "apellido", "order_dir": order_dir}
+        todas = cliente_http.get("/clientes/avanzado", params={**params, "limit": 50}).json()
+        assert todas["next_cursor"] is None
+
+        vistas, cursor = [], None
+        while True:
+            r = cliente_http.get("/clientes/avanzado", params={**params, "limit": 2, "cursor": cursor})
+            assert r.status_code == 200, r.text
+            pagina = r.json()
+            assert len(pagina["items"]) <= 2
+            vistas += [c["id_cliente"] for c in pagina["items"]]
+            cursor = pagina["next_cursor"]
+            if cursor is None:
+                break
+
+        assert vistas == [c["id_cliente"] for c in todas["items"]]
+        assert len(vistas) == 7
+
+
+def test_cursor_de_otro_orden(cliente_http):
+    for i in range(3):
+        _alta(cliente_http, f"Eva{i}", "Sol")
+
+    r = cliente_http.get("/clientes/avanzado", params={"order_by": "apellido", "limit": 1})
+    cursor = r.json()["next_cursor"]
+    assert cursor
+
+    r = cliente_http.get("/clientes/avanzado", params={"order_by": "nombre", "limit": 1, "cursor": cursor})
+    assert r.status_code == 400
+    r = cliente_http.get("/clientes/avanzado", params={"order_by": "apellido", "order_dir": "desc", "limit": 1, "cursor": cursor})
+    assert r.status_code == 400
+    r = cliente_http.get("/clientes/avanzado", params={"order_by": "apellido", "limit": 1, "cursor": "no-es-un-cursor"})
+    assert r.status_code == 400
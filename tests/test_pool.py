@@ -0,0 +1,38 @@
+import pytest
+from sqlalchemy import create_engine, exc
+
+from app import database
+
+# PoolMedido cuenta checkouts, esperas y timeouts; /status/pool los muestra junto
+# con la configuración del pool y del threadpool.
+
+
+def test_pool_medido_cuenta_esperas_y_timeouts(tmp_path):
+    motor = create_engine(
+        f"sqlite:///{tmp_path / 'pool.db'}", poolclass=database.PoolMedido,
+        pool_size=1, max_overflow=0, pool_timeout=0.05, future=True,
+    )
+    with motor.connect():
+        with pytest.raises(exc.TimeoutError):
+            motor.connect()
+        estadisticas = motor.pool.estadisticas()
+        assert estadisticas["checked_out"] == 1
+    with motor.connect():
+        pass
+
+    estadisticas = motor.pool.estadisticas()
+    assert estadisticas["checkouts"] == 3
+    assert estadisticas["timeouts"] == 1
+    assert estadisticas["checkouts_con_espera"] == 1
+    assert estadisticas["espera_maxima_ms"] >= 50
+    assert estadisticas["checked_out"] == 0
+    motor.dispose()
+
+
+def test_status_pool(cliente_http):
+    r = cliente_http.get("/status/pool")
+    assert r.status_code == 200
+    cuerpo = r.json()
+    assert cuerpo["config"]["pool_size"] == database.DB_POOL_SIZE
+    assert cuerpo["config"]["threadpool_tokens"] == database.THREADPOOL_TOKENS
+    assert set(cuerpo["threadpool"]) == {"tokens", "en_uso", "esperando"}
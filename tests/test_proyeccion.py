@@ -0,0 +1,51 @@
+import random
+
+from sqlalchemy import event
+
+# Los listados piden solo las columnas que devuelven: una sola sentencia sin
+# importar cuántas filas haya, y los datos relacionados resueltos en SQL.
+
+
+def _sentencias(motor, pedir):
+    selects = []
+
+    def anotar(conn, cursor, sql, params, context, executemany):
+        if sql.lstrip().startswith("SELECT"):
+            selects.append(sql)
+
+    event.listen(motor, "before_cursor_execute", anotar)
+    try:
+        r = pedir()
+    finally:
+        event.remove(motor, "before_cursor_execute", anotar)
+    assert r.status_code == 200, r.text
+    return r.json(), selects
+
+
+def test_listado_de_pedidos(cliente_http, motor):
+    r = cliente_http.post("/clientes/", json={"nombre": "Ana", "apellido": "Paz", "dni": random.randrange(10**7, 10**8)})
+    r = cliente_http.post("/recetas/", json={"id_cliente": r.json()["id_cliente"], "fecha_receta": "2026-01-01"})
+    id_receta = r.json()["id_receta"]
+    id_proveedor = cliente_http.post("/proveedores/", json={"nombre": "Lab Norte"}).json()["id_proveedor"]
+    ids = [
+        cliente_http.post("/insumos/", json={"descripcion": f"I{i}", "id_proveedor": id_proveedor, "stock_actual": 9}).json()["id_insumo"]
+        for i in range(3)
+    ]
+
+    def pedido(items):
+        r = cliente_http.post("/pedidos-laboratorio/", json={
+            "id_receta": id_receta, "id_proveedor": id_proveedor,
+            "items": [{"id_insumo": i, "cantidad": 1, "precio_unitario": 1} for i in items],
+        })
+        assert r.status_code == 201, r.text
+
+    pedido(ids[:1])
+    _, con_uno = _sentencias(motor, lambda: cliente_http.get("/pedidos-laboratorio/"))
+    pedido(ids)
+    pedido(ids[:2])
+    listado, con_tres = _sentencias(motor, lambda: cliente_http.get("/pedidos-laboratorio/"))
+
+    assert len(con_uno) == len(con_tres)
+    assert [p["cantidad_insumos"] for p in listado] == [2, 3, 1]
+    assert {p["proveedor_nombre"] for p in listado} == {"Lab Norte"}
+    assert all(p["id_receta"] == id_receta for p in listado)
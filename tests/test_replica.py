@@ -0,0 +1,56 @@
+import random
+import time
+from datetime import date
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from starlette.requests import Request
+
+from app import database
+from app.models import Cliente
+from app.services import replica
+
+# get_read_db lee de la réplica salvo que la óptica haya escrito recién o que la
+# réplica esté atrasada (con OPTICA_DB_REPLICA_LAG_MAX).
+
+
+def _lee_de_replica(optica_id):
+    request = Request({"type": "http", "method": "GET", "headers": [(b"x-optica-id", optica_id.encode())]})
+    dependencia = database.get_read_db(request)
+    db = next(dependencia)
+    try:
+        return db.get_bind() is database.replica_engine
+    finally:
+        dependencia.close()
+
+
+def test_lecturas_a_la_replica(monkeypatch, tmp_path, sesiones, optica_id):
+    motor_replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}", future=True)
+    monkeypatch.setattr(database, "replica_engine", motor_replica)
+    monkeypatch.setattr(database, "ReplicaSessionLocal", sessionmaker(bind=motor_replica, future=True))
+
+    assert _lee_de_replica(optica_id)
+
+    # leer lo propio: después de confirmar una escritura, la óptica lee de la primaria
+    with sesiones() as db:
+        db.add(Cliente(optica_id=optica_id, nombre="Ana", apellido="Paz",
+                       dni=random.randrange(10**7, 10**8), fecha_alta=date.today()))
+        db.commit()
+    assert not _lee_de_replica(optica_id)
+    assert _lee_de_replica(f"{optica_id}-otra")
+
+    monkeypatch.setitem(replica._fijadas, optica_id, time.monotonic() - 1)
+    assert _lee_de_replica(optica_id)
+
+    # atraso medido: por encima del máximo, todas las lecturas van a la primaria
+    monkeypatch.setattr(replica, "LAG_MAX", 5.0)
+    monkeypatch.setattr(replica, "CHEQUEO_SEGUNDOS", 0.0)
+    monkeypatch.setattr(replica, "_lag", {"ok": True, "segundos": None, "proximo": 0.0})
+    monkeypatch.setattr(replica, "_medir_lag", lambda motor: 30.0)
+    assert not _lee_de_replica(optica_id)
+    monkeypatch.setattr(replica, "_medir_lag", lambda motor: None)
+    assert not _lee_de_replica(optica_id)
+    monkeypatch.setattr(replica, "_medir_lag", lambda motor: 1.0)
+    assert _lee_de_replica(optica_id)
+
+    motor_replica.dispose()
@@ -0,0 +1,57 @@
+import random
+from datetime import date, timedelta
+
+from app.services import reposicion
+
+# El camino NumPy de la sugerencia: la ventana de historia, el descarte de
+# consumos de insumos que no están en la lista (searchsorted) y lo comprometido
+# en pedidos abiertos.
+
+HOY = date(2026, 6, 1)
+
+
+def test_sugerencia_de_compra(cliente_http, sesiones, optica_id):
+    r = cliente_http.post("/clientes/", json={"nombre": "Ana", "apellido": "Paz", "dni": random.randrange(10**7, 10**8)})
+    r = cliente_http.post("/recetas/", json={"id_cliente": r.json()["id_cliente"], "fecha_receta": "2026-01-01"})
+    id_receta = r.json()["id_receta"]
+    id_proveedor = cliente_http.post("/proveedores/", json={"nombre": "Lab"}).json()["id_proveedor"]
+
+    # el inactivo queda entre los dos activos: su consumo no puede caer en la fila del siguiente
+    ids = []
+    for nombre in ("A", "Inactivo", "B"):
+        r = cliente_http.post("/insumos/", json={"descripcion": nombre, "id_proveedor": id_proveedor, "stock_actual": 200})
+        ids.append(r.json()["id_insumo"])
+    id_a, id_inactivo, id_b = ids
+
+    def pedido(id_insumo, cantidad, recibido=None, enviado=None, estado="RECIBIDO"):
+        r = cliente_http.post("/pedidos-laboratorio/", json={
+            "id_receta": id_receta, "id_proveedor": id_proveedor, "estado": estado,
+            "fecha_envio": enviado and str(enviado), "fecha_recepcion": recibido and str(recibido),
+            "items": [{"id_insumo": id_insumo, "cantidad": cantidad, "precio_unitario": 1}],
+        })
+        assert r.status_code == 201, r.text
+
+    pedido(id_a, 7, recibido=HOY - timedelta(days=3), enviado=HOY - timedelta(days=20))
+    pedido(id_a, 100, recibido=HOY - timedelta(days=30))   # antes de la ventana
+    pedido(id_a, 50, recibido=HOY)                         # hoy todavía no cuenta
+    pedido(id_inactivo, 70, recibido=HOY - timedelta(days=2))
+    pedido(id_b, 4, estado="ENVIADO")                      # abierto: comprometido
+    pedido(id_b, 9, estado="CANCELADO")                    # cerrado: no compromete
+
+    r = cliente_http.put(f"/insumos/{id_inactivo}", json={"activo": False})
+    assert r.status_code == 200, r.text
+
+    with sesiones() as db:
+        resultado = reposicion.sugerir(db, optica_id, HOY, dias_historia=14, dias_entrega=5, incluir_todos=True)
+
+    [grupo] = resultado["proveedores"]
+    # la historia envío -> recepción del laboratorio no es la entrega del proveedor
+    assert grupo["dias_entrega"] == 5
+    items = {i["id_insumo"]: i for i in grupo["items"]}
+    assert set(items) == {id_a, id_b}
+
+    # 14 días, ventanas de 7: el consumo del día 11 entra en 3 de las 8 sumas móviles
+    assert items[id_a]["demanda_diaria"] == round(7 * 3 / 8 / 7, 3)
+    assert items[id_a]["comprometido"] == 0
+    assert items[id_b]["demanda_diaria"] == 0
+    assert items[id_b]["comprometido"] == 4
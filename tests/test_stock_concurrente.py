@@ -0,0 +1,255 @@
+import random
+import threading
+from collections import Counter
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from app.models import Insumo, MovimientoStock
+
+# COMPRAS, ANULACIONES Y RECEPCIONES CONCURRENTES SOBRE LOS MISMOS INSUMOS
+#
+# Varios hilos hacen operaciones de stock mezcladas sobre pocos insumos (para
+# que se pisen). Cada operación aceptada se anota con sus deltas; al final el
+# stock de cada insumo tiene que ser el inicial más la suma de lo anotado, sin
+# pasar nunca por negativo, y ninguna operación puede terminar en un error de
+# servidor (un deadlock o una actualización perdida se verían así).
+#
+# Los cruces de verdad (FOR UPDATE, deadlocks) solo pasan en MySQL: en SQLite
+# BEGIN IMMEDIATE serializa las transacciones enteras y no habría nada que probar.
+# Ahí corre solo test_bloqueos_en_orden_de_id, que verifica cómo se piden los
+# bloqueos: FOR UPDATE y en orden de id, que es lo que evita los deadlocks.
+
+HILOS = 8
+OPERACIONES_POR_HILO = 30
+STOCK_INICIAL = 10
+INSUMOS = 3
+PEDIDOS = 60
+
+
+def _crear_datos(http: TestClient):
+    r = http.post("/proveedores/", json={"nombre": "Lab Concurrente"})
+    assert r.status_code == 201, r.text
+    id_proveedor = r.json()["id_proveedor"]
+
+    r = http.post("/clientes/", json={"nombre": "Ana", "apellido": "Paz", "dni": random.randrange(10**7, 10**8)})
+    assert r.status_code == 201, r.text
+    r = http.post("/recetas/", json={"id_cliente": r.json()["id_cliente"], "fecha_receta": "2026-01-01"})
+    assert r.status_code == 201, r.text
+    id_receta = r.json()["id_receta"]
+
+    ids = []
+    for i in range(INSUMOS):
+        r = http.post("/insumos/", json={
+            "descripcion": f"Insumo {i}", "id_proveedor": id_proveedor,
+            "stock_actual": STOCK_INICIAL, "stock_minimo": 2,
+        })
+        assert r.status_code == 201, r.text
+        ids.append(r.json()["id_insumo"])
+    return id_proveedor, id_receta, ids
+
+
+def _items(azar: random.Random, ids):
+    elegidos = azar.sample(ids, azar.randint(1, len(ids)))
+    return {i: azar.randint(1, 4) for i in elegidos}
+
+
+def test_bloqueos_en_orden_de_id(cliente_http):
+    id_proveedor, id_receta, ids = _crear_datos(cliente_http)
+    vistos = []
+
+    def anotar(contexto):
+        sentencia = contexto.statement
+        if contexto.is_select and sentencia._for_update_arg is not None:
+            if "insumo" in {t.name for t in sentencia.get_final_froms()}:
+                vistos.append([str(c) for c in sentencia._order_by_clauses])
+
+    event.listen(Session, "do_orm_execute", anotar)
+    try:
+        items = [{"id_insumo": i, "cantidad": 2, "precio_unitario": 5} for i in reversed(ids)]
+        r = cliente_http.post("/compras-insumos/", json={
+            "id_proveedor": id_proveedor, "fecha_compra": "2026-02-01", "items": items,
+        })
+        assert r.status_code == 201, r.text
+        r_anular = cliente_http.patch(f"/compras-insumos/{r.json()['id_compra']}/anular", json={"motivo": "prueba"})
+        assert r_anular.status_code == 200, r_anular.text
+        r = cliente_http.post("/pedidos-laboratorio/", json={
+            "id_receta": id_receta, "id_proveedor": id_proveedor,
+            "items": [{"id_insumo": i, "cantidad": 1, "precio_unitario": 10} for i in reversed(ids)],
+        })
+        r = cliente_http.patch(f"/pedidos-laboratorio/{r.json()['id_pedido_lab']}/recepcion", json={})
+        assert r.status_code == 200, r.text
+    finally:
+        event.remove(Session, "do_orm_execute", anotar)
+
+    # compra, anulación y recepción bloquean los insumos, siempre ordenados por id
+    assert len(vistos) >= 3, vistos
+    for orden in vistos:
+        assert orden and orden[0] == "insumo.id_insumo", vistos
+
+
+def test_stock_con_operaciones_concurrentes(api, bloqueos_reales, cliente_http, sesiones, optica_id):
+    id_proveedor, id_receta, ids = _crear_datos(cliente_http)
+
+    # pedidos al laboratorio ya creados (crearlos no mueve stock): se recepcionan en paralelo
+    pedidos = {}
+    azar = random.Random(7)
+    for _ in range(PEDIDOS):
+        items = _items(azar, ids)
+        r = cliente_http.post("/pedidos-laboratorio/", json={
+            "id_receta": id_receta, "id_proveedor": id_proveedor,
+            "items": [{"id_insumo": i, "cantidad": c, "precio_unitario": 10} for i, c in items.items()],
+        })
+        assert r.status_code == 201, r.text
+        pedidos[r.json()["id_pedido_lab"]] = items
+
+    lock = threading.Lock()
+    compras = {}                    # id_compra -> items
+    aplicados = Counter()           # id_insumo -> suma de deltas de las operaciones aceptadas
+    respuestas = Counter()          # (operación, status)
+    fallas = []
+
+    def anotar(items, signo):
+        with lock:
+            for i, c in items.items():
+                aplicados[i] += signo * c
+
+    def trabajar(semilla: int):
+        azar = random.Random(semilla)
+        http = TestClient(api, headers={"X-Optica-Id": optica_id}, raise_server_exceptions=False)
+        try:
+            for _ in range(OPERACIONES_POR_HILO):
+                operacion = azar.choice(("compra", "anulacion", "recepcion"))
+                if operacion == "compra":
+                    items = _items(azar, ids)
+                    r = http.post("/compras-insumos/", json={
+                        "id_proveedor": id_proveedor, "fecha_compra": "2026-02-01",
+                        "items": [{"id_insumo": i, "cantidad": c, "precio_unitario": 5} for i, c in items.items()],
+                    })
+                    if r.status_code == 201:
+                        anotar(items, 1)
+                        with lock:
+                            compras[r.json()["id_compra"]] = items
+                elif operacion == "anulacion":
+                    with lock:
+                        if not compras:
+                            continue
+                        id_compra = azar.choice(sorted(compras))
+                        items = compras[id_compra]
+                    r = http.patch(f"/compras-insumos/{id_compra}/anular", json={"motivo": "prueba"})
+                    if r.status_code == 200:
+                        anotar(items, -1)
+                else:
+                    id_pedido = azar.choice(sorted(pedidos))
+                    r = http.patch(f"/pedidos-laboratorio/{id_pedido}/recepcion", json={})
+                    if r.status_code == 200:
+                        anotar(pedidos[id_pedido], -1)
+                with lock:
+                    respuestas[(operacion, r.status_code)] += 1
+                # 400: stock insuficiente, compra ya anulada o pedido ya recibido (rechazos de negocio)
+                if r.status_code not in (200, 201, 400):
+                    with lock:
+                        fallas.append((operacion, r.status_code, r.text))
+        except Exception as exc:  # noqa: BLE001  (cualquier error del hilo hace fallar la prueba)
+            with lock:
+                fallas.append(("hilo", None, repr(exc)))
+
+    hilos = [threading.Thread(target=trabajar, args=(s,)) for s in range(HILOS)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join(timeout=300)
+    assert not any(h.is_alive() for h in hilos), "operaciones trabadas (¿deadlock?)"
+    assert not fallas, fallas
+
+    # que la prueba haya cruzado de verdad operaciones de los tres tipos
+    for operacion in ("compra", "anulacion", "recepcion"):
+        assert respuestas[(operacion, 201 if operacion == "compra" else 200)], respuestas
+
+    with sesiones() as db:
+        stock = dict(db.execute(
+            select(Insumo.id_insumo, Insumo.stock_actual).where(Insumo.optica_id == optica_id)
+        ).all())
+        libro = dict(db.execute(
+            select(MovimientoStock.id_insumo, func.sum(MovimientoStock.cantidad))
+            .where(MovimientoStock.optica_id == optica_id)
+            .group_by(MovimientoStock.id_insumo)
+        ).all())
+        minimo_libro = db.execute(
+            select(func.min(MovimientoStock.stock_resultante)).where(MovimientoStock.optica_id == optica_id)
+        ).scalar()
+
+    for i in ids:
+        assert stock[i] == STOCK_INICIAL + aplicados[i], (i, stock[i], aplicados[i])
+        assert stock[i] >= 0
+        # el libro de movimientos (incluye el alta con el stock inicial) suma lo mismo
+        assert libro[i] == stock[i]
+    assert minimo_libro >= 0
+
+
+# EDICIÓN DEL STOCK (PUT /insumos/{id}) CRUZADA CON COMPRAS
+#
+# El PUT fija el stock: el ajuste que registra tiene que dejar exactamente el
+# valor pedido aunque entre la lectura del insumo y el ajuste se confirme una
+# compra (si el delta se calculara sobre una lectura sin bloquear, el stock
+# quedaría corrido en lo que sumó la compra).
+
+EDICIONES = 20
+COMPRAS = 60
+
+
+def test_edicion_de_stock_con_compras_concurrentes(api, bloqueos_reales, cliente_http, sesiones, optica_id):
+    r = cliente_http.post("/proveedores/", json={"nombre": "Lab Edicion"})
+    id_proveedor = r.json()["id_proveedor"]
+    r = cliente_http.post("/insumos/", json={"descripcion": "Editado", "id_proveedor": id_proveedor, "stock_actual": 0})
+    id_insumo = r.json()["id_insumo"]
+
+    pedidos = [1000 * (k + 1) for k in range(EDICIONES)]  # ninguno se alcanza sumando compras de 1
+    fallas = []
+    lock = threading.Lock()
+
+    def editar(valores):
+        http = TestClient(api, headers={"X-Optica-Id": optica_id}, raise_server_exceptions=False)
+        for valor in valores:
+            r = http.put(f"/insumos/{id_insumo}", json={"stock_actual": valor})
+            if r.status_code != 200:
+                with lock:
+                    fallas.append(("edicion", r.status_code, r.text))
+
+    def comprar(veces):
+        http = TestClient(api, headers={"X-Optica-Id": optica_id}, raise_server_exceptions=False)
+        for _ in range(veces):
+            r = http.post("/compras-insumos/", json={
+                "id_proveedor": id_proveedor, "fecha_compra": "2026-02-01",
+                "items": [{"id_insumo": id_insumo, "cantidad": 1, "precio_unitario": 5}],
+            })
+            if r.status_code != 201:
+                with lock:
+                    fallas.append(("compra", r.status_code, r.text))
+
+    hilos = [threading.Thread(target=editar, args=(pedidos[k::2],)) for k in range(2)]
+    hilos += [threading.Thread(target=comprar, args=(COMPRAS // 4,)) for _ in range(4)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join(timeout=300)
+    assert not any(h.is_alive() for h in hilos), "operaciones trabadas (¿deadlock?)"
+    assert not fallas, fallas
+
+    with sesiones() as db:
+        resultantes = db.execute(
+            select(MovimientoStock.stock_resultante).where(
+                MovimientoStock.optica_id == optica_id,
+                MovimientoStock.id_insumo == id_insumo,
+                MovimientoStock.observaciones == "Edición del insumo",
+            )
+        ).scalars().all()
+        compras = db.execute(
+            select(func.count()).select_from(MovimientoStock).where(
+                MovimientoStock.id_insumo == id_insumo, MovimientoStock.tipo == "COMPRA"
+            )
+        ).scalar()
+
+    assert sorted(resultantes) == pedidos
+    assert compras == COMPRAS
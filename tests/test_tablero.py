@@ -0,0 +1,100 @@
+import random
+from datetime import date
+
+from sqlalchemy import select
+
+from app.models import TableroOptica
+from app.services import tablero
+
+
+def _datos(http):
+    id_proveedor = http.post("/proveedores/", json={"nombre": "Lab Tablero"}).json()["id_proveedor"]
+    r = http.post("/clientes/", json={"nombre": "Ana", "apellido": "Paz", "dni": random.randrange(10**7, 10**8)})
+    r = http.post("/recetas/", json={"id_cliente": r.json()["id_cliente"], "fecha_receta": "2026-01-05"})
+    id_receta = r.json()["id_receta"]
+    r = http.post("/insumos/", json={"descripcion": "Lente", "id_proveedor": id_proveedor, "stock_actual": 50})
+    return id_proveedor, id_receta, r.json()["id_insumo"]
+
+
+def _pedido(http, id_receta, id_proveedor, id_insumo, fecha_estimada):
+    r = http.post("/pedidos-laboratorio/", json={
+        "id_receta": id_receta, "id_proveedor": id_proveedor, "fecha_estimada_rec": fecha_estimada,
+        "items": [{"id_insumo": id_insumo, "cantidad": 1, "precio_unitario": 5}],
+    })
+    assert r.status_code == 201, r.text
+    return r.json()["id_pedido_lab"]
+
+
+def _claves(sesiones, optica_id):
+    with sesiones() as db:
+        return dict(db.execute(
+            select(TableroOptica.clave, TableroOptica.valor).where(TableroOptica.optica_id == optica_id)
+        ).all())
+
+
+def _leer(sesiones, optica_id, hoy):
+    with sesiones() as db:
+        return tablero.leer(db, optica_id, hoy)
+
+
+def test_contadores_despues_de_crear_y_anular(cliente_http, sesiones, optica_id):
+    id_proveedor, id_receta, id_insumo = _datos(cliente_http)
+    hoy = date(2026, 1, 20)
+
+    r = cliente_http.post("/compras-insumos/", json={
+        "id_proveedor": id_proveedor, "fecha_compra": "2026-01-10",
+        "items": [{"id_insumo": id_insumo, "cantidad": 2, "precio_unitario": 5.5}],
+    })
+    id_compra = r.json()["id_compra"]
+    id_pedido = _pedido(cliente_http, id_receta, id_proveedor, id_insumo, "2026-01-15")
+
+    d = _leer(sesiones, optica_id, hoy)
+    assert d["compras_mes"] == {"mes": "2026-01", "cantidad": 1, "monto_total": 11.0}
+    assert d["pedidos_por_estado"] == {"ENVIADO": 1}
+    assert d["pedidos_abiertos_vencidos"] == 1
+    assert d["recetas_mes"] == 1 and d["clientes_activos"] == 1
+
+    assert cliente_http.patch(f"/compras-insumos/{id_compra}/anular", json={"motivo": "x"}).status_code == 200
+    assert cliente_http.patch(f"/pedidos-laboratorio/{id_pedido}/recepcion", json={}).status_code == 200
+
+    d = _leer(sesiones, optica_id, hoy)
+    assert d["compras_mes"] == {"mes": "2026-01", "cantidad": 0, "monto_total": 0.0}
+    assert d["pedidos_por_estado"] == {"RECIBIDO": 1}
+    assert d["pedidos_abiertos_vencidos"] == 0
+
+    # lo mantenido en cada escritura coincide con recalcular desde las tablas
+    with sesiones() as db:
+        calculados = tablero._calcular(db, optica_id)
+    assert {k: v for k, v in _claves(sesiones, optica_id).items() if abs(v) > 1e-9} == calculados
+
+
+def test_plegado_de_vencidos(cliente_http, sesiones, optica_id):
+    id_proveedor, id_receta, id_insumo = _datos(cliente_http)
+    viejos = [_pedido(cliente_http, id_receta, id_proveedor, id_insumo, f"2026-01-{dia:02d}") for dia in (3, 8, 12)]
+    _pedido(cliente_http, id_receta, id_proveedor, id_insumo, "2026-03-01")
+
+    hoy = date(2026, 2, 1)
+    assert _leer(sesiones, optica_id, hoy)["pedidos_abiertos_vencidos"] == 3
+
+    with sesiones() as db:
+        assert tablero.plegar_todas(db, optica_id, hoy) == 3
+        assert tablero.plegar_todas(db, optica_id, hoy) == 0  # una vez por día
+
+    claves = _claves(sesiones, optica_id)
+    assert not [c for c in claves if c.startswith("vence:") and c < "vence:2026-02-01"]
+    assert claves[tablero.VENCIDOS] == 3 and "vence:2026-03-01" in claves
+    assert _leer(sesiones, optica_id, hoy)["pedidos_abiertos_vencidos"] == 3
+
+    # una escritura sobre un pedido ya plegado descuenta de "vencidos"
+    assert cliente_http.patch(f"/pedidos-laboratorio/{viejos[0]}/estado", json={"estado": "CANCELADO"}).status_code == 200
+    claves = _claves(sesiones, optica_id)
+    assert claves[tablero.VENCIDOS] == 2
+    assert not [c for c in claves if c.startswith("vence:") and c < "vence:2026-02-01"]
+
+    # un día sin plegar: la lectura suma las filas que faltan
+    assert _leer(sesiones, optica_id, date(2026, 3, 2))["pedidos_abiertos_vencidos"] == 3
+
+    with sesiones() as db:
+        tablero.recalcular(db, optica_id, hoy)
+    assert _claves(sesiones, optica_id)[tablero.VENCIDOS] == 2
+    assert _leer(sesiones, optica_id, hoy)["pedidos_abiertos_vencidos"] == 2
@@ -0,0 +1,49 @@
+import random
+
+from app.services import typeahead
+
+
+def test_escritura_durante_la_primera_carga_no_se_pierde(cliente_http, optica_id, monkeypatch):
+    for i, apellido in enumerate(("Alvarez", "Benitez", "Zarate")):
+        r = cliente_http.post("/clientes/", json={"nombre": f"Ana{i}", "apellido": apellido, "dni": random.randrange(10**7, 10**8)})
+        assert r.status_code == 201, r.text
+    id_zarate = r.json()["id_cliente"]
+
+    cargar = typeahead._cargar
+
+    def cargar_con_alta_en_el_medio(db, entidad, optica_id_, ids=None):
+        filas = cargar(db, entidad, optica_id_, ids)
+        if ids is None:
+            # la carga completa leyó antes del alta de Zarate, que se confirma mientras tanto
+            filas = [f for f in filas if f[0] != id_zarate]
+            typeahead._marcar_pendientes({("cliente", optica_id): {id_zarate}})
+        return filas
+
+    monkeypatch.setattr(typeahead, "_cargar", cargar_con_alta_en_el_medio)
+
+    r = cliente_http.get("/clientes/select", params={"q": "zar"})
+    assert r.status_code == 200, r.text
+    assert r.json() == []
+
+    # el alta anotada durante la carga se recarga en el pedido siguiente
+    r = cliente_http.get("/clientes/select", params={"q": "zar"})
+    assert [c["id"] for c in r.json()] == [id_zarate]
+
+
+def test_invalidacion_durante_la_carga_no_guarda_el_indice(cliente_http, optica_id, monkeypatch):
+    r = cliente_http.post("/clientes/", json={"nombre": "Ana", "apellido": "Paz", "dni": random.randrange(10**7, 10**8)})
+    assert r.status_code == 201, r.text
+
+    cargar = typeahead._cargar
+
+    def cargar_e_invalidar(db, entidad, optica_id_, ids=None):
+        filas = cargar(db, entidad, optica_id_, ids)
+        if ids is None:
+            typeahead._marcar_pendientes({("cliente", optica_id): None})
+        return filas
+
+    monkeypatch.setattr(typeahead, "_cargar", cargar_e_invalidar)
+
+    r = cliente_http.get("/clientes/select", params={"q": "paz"})
+    assert len(r.json()) == 1
+    assert ("cliente", optica_id) not in typeahead._indices